@@ -1,12 +1,130 @@
 # Este archivo expone las funciones principales del paquete
-# para que puedan ser importadas directamente desde 'generators'
+# para que puedan ser importadas directamente desde 'generators'.
+#
+# Los generadores se importan recién cuando se usan (cada uno trae sus
+# propias librerías: python-docx/lxml, fpdf, qrcode, ...), así un CLI que
+# genera un solo tipo no paga la carga de los demás.
 
-from .pdf_gen import generate_pdf_honeytoken
-from .epub_gen import generate_epub_honeytoken
-from .xlsx_gen import generate_xlsx_honeytoken
-from .docx_gen import generate_docx_honeytoken
-from .qrcode_gen import generate_qrcode_honeytoken
-from .binary_gen import generate_binary_honeytoken
+import importlib
+import os
+import subprocess
+import sys
+from pathlib import Path
 
-# A futuro agregarás aquí los otros:
-# from .word_gen import generate_word_token
\ No newline at end of file
+
+class GeneratorSpec:
+    """Dónde está un generador y qué opciones acepta además de las comunes."""
+
+    __slots__ = ('module', 'function', 'options')
+
+    def __init__(self, module, function, options=()):
+        self.module = module
+        self.function = function
+        self.options = tuple(options)
+
+
+DOCUMENT_OPTIONS = ('title', 'author', 'content')
+
+# Registro tipo -> generador. Los módulos relativos son de este paquete; un
+# plugin puede registrar el suyo con register_generator().
+GENERATORS = {
+    'pdf': GeneratorSpec('.pdf_gen', 'generate_pdf_honeytoken', DOCUMENT_OPTIONS),
+    'epub': GeneratorSpec('.epub_gen', 'generate_epub_honeytoken', DOCUMENT_OPTIONS),
+    'xlsx': GeneratorSpec('.xlsx_gen', 'generate_xlsx_honeytoken', DOCUMENT_OPTIONS),
+    'docx': GeneratorSpec('.docx_gen', 'generate_docx_honeytoken', DOCUMENT_OPTIONS),
+    'qrcode': GeneratorSpec('.qrcode_gen', 'generate_qrcode_honeytoken'),
+    'binary': GeneratorSpec('.binary_gen', 'generate_binary_honeytoken', ('platform',)),
+}
+
+# Nombre de la función -> tipo, para `from generators import generate_pdf_honeytoken`
+_FUNCTION_TYPES = {spec.function: token_type for token_type, spec in GENERATORS.items()}
+
+
+def register_generator(token_type, module, function, options=()):
+    """
+    Registra un generador externo. `module` es un nombre importable
+    (ej. 'mis_tokens.svg_gen'); la función recibe server_url, output_file,
+    description, token_data y las `options` declaradas.
+    """
+    GENERATORS[token_type] = GeneratorSpec(module, function, options)
+    _FUNCTION_TYPES[function] = token_type
+
+
+def load_plugins(modules=None):
+    """
+    Importa los módulos de plugins (por defecto los de la variable de entorno
+    TOKENSNARE_PLUGINS, separados por coma), que al importarse registran sus
+    generadores con register_generator(). Importar dos veces no hace nada.
+    """
+    if modules is None:
+        modules = os.environ.get("TOKENSNARE_PLUGINS", "").split(",")
+    for module in modules:
+        if module.strip():
+            importlib.import_module(module.strip())
+
+
+def supported_types():
+    return list(GENERATORS)
+
+
+def get_generator(token_type):
+    """Importa (la primera vez) y retorna la función del generador."""
+    spec = GENERATORS.get(token_type)
+    if spec is None:
+        raise ValueError(f"Tipo no reconocido: {token_type}")
+    module = importlib.import_module(spec.module, __name__)
+    return getattr(module, spec.function)
+
+
+def generate(token_type, server_url, output_file, description=None, token_data=None, **options):
+    """
+    Genera un honeytoken del tipo indicado. De `options` (title, author,
+    content, platform, ...) sólo se pasan las que acepta ese generador.
+    """
+    generator = get_generator(token_type)
+    kwargs = {name: options.get(name) for name in GENERATORS[token_type].options}
+    return generator(
+        server_url=server_url,
+        output_file=output_file,
+        description=description,
+        token_data=token_data,
+        **kwargs
+    )
+
+
+_IMPORT_TIMER = """
+import sys, time
+sys.path.insert(0, {root!r})
+import generators.common
+generators.load_plugins()
+started = time.perf_counter()
+generators.get_generator({token_type!r})
+print(time.perf_counter() - started)
+"""
+
+
+def profile_imports(types=None):
+    """
+    Tiempo de importación (segundos) de cada generador, medido en un
+    intérprete nuevo por tipo para que no se compartan módulos ya cargados.
+    No incluye generators.common, que cargan todos.
+    """
+    root = str(Path(__file__).resolve().parent.parent)
+    timings = {}
+    for token_type in types or GENERATORS:
+        result = subprocess.run(
+            [sys.executable, '-c', _IMPORT_TIMER.format(root=root, token_type=token_type)],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            timings[token_type] = None
+        else:
+            timings[token_type] = float(result.stdout.strip().splitlines()[-1])
+    return timings
+
+
+def __getattr__(name):
+    # Compatibilidad: las funciones generate_*_honeytoken se importan al pedirlas
+    if name in _FUNCTION_TYPES:
+        return get_generator(_FUNCTION_TYPES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,91 @@
+"""
+Caché de las partes ya renderizadas de un documento que no dependen del token.
+
+Un mismo señuelo (mismo título, autor y contenido) se suele desplegar en
+muchos equipos, cada uno con su propio token. Lo caro de generarlo (el
+layout del PDF, comprimir document.xml o la hoja del xlsx) depende sólo del
+contenido, así que se guarda acá y para cada token sólo se arma lo que
+cambia: URL de tracking, fechas y metadatos.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Tamaño máximo de la caché (bytes de los artefactos guardados, por proceso)
+ARTIFACT_CACHE_BYTES = int(os.environ.get("ARTIFACT_CACHE_BYTES", 32 * 1024 * 1024))
+
+
+def artifact_key(kind, *parts):
+    """
+    Clave por contenido: hash de `kind` y las partes (strings o None). Así la
+    caché no retiene los textos completos de cada señuelo.
+    """
+    digest = hashlib.sha256(kind.encode())
+    for part in parts:
+        data = b'' if part is None else part.encode('utf-8', 'surrogatepass')
+        digest.update(b'%d:%d:' % (part is None, len(data)))
+        digest.update(data)
+    return digest.digest()
+
+
+class ArtifactCache:
+    """LRU acotada por tamaño total (en bytes). Segura entre threads."""
+
+    def __init__(self, max_bytes=ARTIFACT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # clave -> (valor, tamaño)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def get_or_render(self, key, render, size_of):
+        """Retorna el artefacto cacheado o lo arma con `render()` y lo guarda."""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.put(key, value, size_of(value))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Caché compartida por los generadores del proceso
+artifact_cache = ArtifactCache()
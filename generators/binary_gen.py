@@ -1,26 +1,138 @@
+import mmap
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin ioctl, se copia sin reflink
+    fcntl = None
+
 from .common import register_token
 
 # Placeholder para la URL en el binario
 PLACEHOLDER = b"PLACEHOLDER_URL_XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX"
 
+TEMPLATES = {
+    "windows": "binary_template/template_win.exe",
+    "linux": "binary_template/template_linux",
+}
+
+# ioctl de Linux para clonar un archivo compartiendo bloques (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+# Offsets del placeholder por plantilla: {ruta: (mtime_ns, tamaño, offsets)}
+_offsets_cache = {}
+
+
+def placeholder_offsets(template_path):
+    """
+    Offsets del placeholder en la plantilla. Se buscan una sola vez (sobre un
+    mmap, sin leer el binario a memoria) y se recalculan sólo si la plantilla
+    cambia en disco.
+    """
+    st = os.stat(template_path)
+    cached = _offsets_cache.get(template_path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+
+    offsets = []
+    if st.st_size:
+        with open(template_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            position = data.find(PLACEHOLDER)
+            while position != -1:
+                offsets.append(position)
+                position = data.find(PLACEHOLDER, position + len(PLACEHOLDER))
+
+    if not offsets:
+        raise Exception("Error: No se encontró el placeholder en el binario.")
+
+    offsets = tuple(offsets)
+    _offsets_cache[template_path] = (st.st_mtime_ns, st.st_size, offsets)
+    return offsets
+
+
+def _copy_template(src, dst, size):
+    """
+    Copia la plantilla sin pasar los datos por Python: reflink si el
+    filesystem lo soporta, si no copy_file_range (copia dentro del kernel).
+    Donde no hay ninguna de las dos (Windows, macOS) se copia con shutil.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(dst, FICLONE, src)
+            return
+        except OSError:
+            pass
+
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src, dst, size - copied, copied, copied)
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return
+        except OSError:
+            # Filesystems distintos o sin soporte: se copia desde el principio
+            pass
+
+    os.lseek(src, 0, os.SEEK_SET)
+    os.lseek(dst, 0, os.SEEK_SET)
+    os.ftruncate(dst, 0)
+    with open(src, "rb", closefd=False) as fsrc, open(dst, "wb", closefd=False) as fdst:
+        shutil.copyfileobj(fsrc, fdst)
+
+
+def _write_at(dst, data, offset):
+    """Escribe `data` en `offset` sin mover el cursor si el SO tiene pwrite."""
+    if hasattr(os, "pwrite"):
+        os.pwrite(dst, data, offset)
+        return
+    os.lseek(dst, offset, os.SEEK_SET)
+    os.write(dst, data)
+
+
+def write_patched_binary(template_path, output_file, padded_url):
+    """Escribe la plantilla con el placeholder reemplazado por `padded_url`."""
+    offsets = placeholder_offsets(template_path)
+
+    with open(template_path, "rb") as src:
+        size = os.fstat(src.fileno()).st_size
 
-def generate_binary_honeytoken(server_url, output_file, platform, description):
+        # Stream (ej. respuesta HTTP): se copia el mmap salteando los placeholders
+        if hasattr(output_file, "write"):
+            with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = 0
+                for offset in offsets:
+                    output_file.write(data[start:offset])
+                    output_file.write(padded_url)
+                    start = offset + len(PLACEHOLDER)
+                output_file.write(data[start:])
+            return
+
+        with open(output_file, "wb") as dst:
+            _copy_template(src.fileno(), dst.fileno(), size)
+            for offset in offsets:
+                _write_at(dst.fileno(), padded_url, offset)
+
+
+def generate_binary_honeytoken(server_url, output_file, platform, description, token_data=None):
     """
     Genera un binario que realiza el get hacia la URI, parcheando una plantilla pre-compilada.
     """
 
-    if platform == "windows":
-        template_path = f"binary_template/template_win.exe"
-    elif platform == "linux":
-        template_path = f"binary_template/template_linux"
-    else:
+    if platform not in TEMPLATES:
         raise ValueError("Las plataformas soportadas son windows y linux.")
+    template_path = TEMPLATES[platform]
 
-    token_data = register_token(
-        server_url,
-        token_type="binary",
-        description=description
-    )
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="binary",
+            description=description
+        )
 
     tracking_url = token_data['tracking_url_link']
 
@@ -30,15 +142,6 @@ def generate_binary_honeytoken(server_url, output_file, platform, description):
     if len(url_bytes) > len(PLACEHOLDER):
         raise ValueError("La URL generada es demasiado larga para el placeholder del binario.")
 
-    with open(template_path, "rb") as f:
-        binary_data = f.read()
-
-    if PLACEHOLDER not in binary_data:
-        raise Exception("Error: No se encontró el placeholder en el binario.")
-
     padded_url = url_bytes + b'\x00' * (len(PLACEHOLDER) - len(url_bytes))
 
-    new_binary_data = binary_data.replace(PLACEHOLDER, padded_url)
-
-    with open(output_file, "wb") as f:
-        f.write(new_binary_data)
+    write_patched_binary(template_path, output_file, padded_url)
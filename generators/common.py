@@ -4,37 +4,142 @@ from random import randint
 from datetime import datetime, timezone, timedelta
 import os
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Se lee una sola vez (la API_KEY del .env)
+load_dotenv()
+
+# Tokens por pedido a /api/tokens/bulk (el máximo del servidor)
+BULK_CHUNK_SIZE = 1000
+
+
+class RegistrationError(Exception):
+    """No se pudo registrar el token en el servidor."""
+
+
+class TokenRegistrar:
+    """
+    Cliente reutilizable para registrar tokens en el servidor.
+    Mantiene una Session con pool de conexiones (keep-alive) y reintenta
+    con backoff exponencial los errores de conexión y las respuestas
+    429/5xx. Los errores se reportan con RegistrationError en lugar de
+    terminar el proceso.
+
+    Un reintento de un POST que el servidor sí había procesado puede dejar
+    un token extra registrado (sin archivo asociado).
+    """
+
+    def __init__(self, server_url, api_key=None, retries=3, backoff=0.5, timeout=5, pool_size=10):
+        # Aseguramos que no haya doble slash o falte http
+        if not server_url.startswith("http"):
+            server_url = f"http://{server_url}"
+        self.base_url = server_url.rstrip('/')
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        api_key = api_key or os.environ.get("API_KEY")
+        if api_key:
+            self.session.headers['Authorization'] = f'Bearer {api_key}'
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({'POST'}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _post(self, path, payload):
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise RegistrationError(f"Error conectando con el servidor: {e}") from e
+
+    def register(self, token_type, description, metadata=None):
+        """Registra un token y retorna el diccionario con sus datos (ID y URLs)."""
+        return self._post("/api/tokens", {
+            "type": token_type,
+            "description": description,
+            "metadata": metadata or {}
+        })
+
+    def register_many(self, items):
+        """
+        Registra varios tokens con /api/tokens/bulk (en bloques de BULK_CHUNK_SIZE).
+        `items` es una lista de dicts con 'type' y 'description'.
+        Retorna los datos de cada token, en el mismo orden.
+        """
+        registered = []
+        for start in range(0, len(items), BULK_CHUNK_SIZE):
+            chunk = [
+                {"type": item['type'], "description": item.get('description')}
+                for item in items[start:start + BULK_CHUNK_SIZE]
+            ]
+            registered.extend(self._post("/api/tokens/bulk", {"tokens": chunk})['tokens'])
+        return registered
+
+    def reserve(self, count):
+        """Reserva `count` IDs de token (con sus URLs) para el pool offline."""
+        reserved = []
+        while len(reserved) < count:
+            chunk = min(BULK_CHUNK_SIZE, count - len(reserved))
+            reserved.extend(self._post("/api/tokens/reserve", {"count": chunk})['tokens'])
+        return reserved
+
+    def claim(self, items):
+        """
+        Asigna tipo y descripción a tokens reservados ya usados.
+        `items` es una lista de dicts con 'token', 'type' y 'description'.
+        Retorna (tokens asignados, errores por token).
+        """
+        claimed, errors = [], {}
+        for start in range(0, len(items), BULK_CHUNK_SIZE):
+            chunk = [
+                {"token": item['token'], "type": item['type'], "description": item.get('description')}
+                for item in items[start:start + BULK_CHUNK_SIZE]
+            ]
+            result = self._post("/api/tokens/claim", {"tokens": chunk})
+            claimed.extend(result['claimed'])
+            errors.update(result['errors'])
+        return claimed, errors
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Un registrar por servidor, reutilizado entre llamadas (y entre items en modo batch)
+_registrars = {}
+
+# Un proceso hijo (pool del modo batch) no debe compartir las conexiones del padre
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_registrars.clear)
+
+
+def get_registrar(server_url):
+    registrar = _registrars.get(server_url)
+    if registrar is None:
+        registrar = _registrars[server_url] = TokenRegistrar(server_url)
+    return registrar
+
 
 def register_token(server_url, token_type, description, metadata=None):
     """
     Registra un token en el servidor y retorna el diccionario con los datos (IDs y URLs).
-    Si falla, maneja el error y termina la ejecución o retorna None.
+    Si falla lanza RegistrationError.
     """
-    # Aseguramos que no haya doble slash o falte http
-    if not server_url.startswith("http"):
-        server_url = f"http://{server_url}"
-    
-    api_url = f"{server_url.rstrip('/')}/api/tokens"
-
-    load_dotenv()
-    api_key = os.environ.get("API_KEY", None)
-    headers = {}
-    if api_key:
-        headers['Authorization'] = f'Bearer {api_key}'
-    
-    payload = {
-        "type": token_type,
-        "description": description,
-        "metadata": metadata or {}
-    }
-    
-    try:
-        response = requests.post(api_url, json=payload, headers=headers, timeout=5)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error conectando con el servidor: {e}")
-        exit(1)
+    return get_registrar(server_url).register(token_type, description, metadata)
 
 
 def random_creation_date():
@@ -1,3 +1,9 @@
+import io
+import re
+import zipfile
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
 from docx import Document
 from docx.shared import Inches
 from docx.opc.constants import RELATIONSHIP_TYPE
@@ -6,7 +12,9 @@ from docx.oxml.ns import qn
 from docx.oxml import CT_Inline, CT_Picture
 from datetime import datetime
 
+from .artifacts import artifact_cache, artifact_key
 from .common import register_token, random_creation_date, random_modification_date
+from .zipcache import ZipMember, ZipSkeleton
 
 def inject_tracking_pixel(paragraph, tracking_url):
     """
@@ -50,42 +58,146 @@ def inject_tracking_pixel(paragraph, tracking_url):
     run._r.add_drawing(inline)
 
 
-def generate_docx_honeytoken(server_url, output_file, description, title=None, author=None, content=None):
+# Partes del paquete que cambian en cada honeytoken; el resto se copia precomprimido del esqueleto
+DOCUMENT_PART = 'word/document.xml'
+RELS_PART = 'word/_rels/document.xml.rels'
+CORE_PART = 'docProps/core.xml'
+
+# Marcadores del documento de ejemplo con el que se arma el esqueleto
+_PLACEHOLDER_URL = 'http://tokensnare.invalid/pixel.png'
+_PLACEHOLDER_TITLE = '@@TITLE@@'
+_PLACEHOLDER_AUTHOR = '@@AUTHOR@@'
+_PLACEHOLDER_CREATED = datetime(2001, 1, 1, 1, 1, 1)
+_PLACEHOLDER_MODIFIED = datetime(2002, 2, 2, 2, 2, 2)
+
+# Caracteres que no admite XML 1.0 (python-docx falla con ellos)
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_RUN_BREAKS = re.compile('(\t|\r|\n)')
+
+
+class _DocxTemplate:
+    """Esqueleto del paquete y plantillas de las partes dinámicas."""
+
+    def __init__(self, skeleton, document_head, pixel_paragraph, document_tail, rels, core):
+        self.skeleton = skeleton
+        self.document_head = document_head
+        self.pixel_paragraph = pixel_paragraph
+        self.document_tail = document_tail
+        self.rels = rels
+        self.core = core
+
+
+@lru_cache(maxsize=None)
+def _docx_template():
     """
-    Genera un archivo .docx con un pixel de tracking externo y metadatos anti-forense.
+    Arma (una vez por proceso) un documento de ejemplo con python-docx y el
+    pixel de tracking, y lo separa en el esqueleto estático y las plantillas
+    de document.xml, sus relaciones y core.xml.
     """
-    token_data = register_token(
-        server_url,
-        token_type="docx",
-        description=description
+    doc = Document()
+    inject_tracking_pixel(doc.add_paragraph(), _PLACEHOLDER_URL)
+    core = doc.core_properties
+    core.title = _PLACEHOLDER_TITLE
+    core.author = _PLACEHOLDER_AUTHOR
+    core.created = _PLACEHOLDER_CREATED
+    core.modified = _PLACEHOLDER_MODIFIED
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    package = buffer.getvalue()
+
+    with zipfile.ZipFile(io.BytesIO(package)) as z:
+        document = z.read(DOCUMENT_PART).decode('utf-8')
+        rels = z.read(RELS_PART).decode('utf-8')
+        core_xml = z.read(CORE_PART).decode('utf-8')
+
+    # document.xml de ejemplo: <w:body> + párrafo del pixel + <w:sectPr>...
+    body_start = document.index('<w:body>') + len('<w:body>')
+    section_start = document.index('<w:sectPr')
+
+    return _DocxTemplate(
+        skeleton=ZipSkeleton.from_package(package, (DOCUMENT_PART, RELS_PART, CORE_PART)),
+        document_head=document[:body_start],
+        pixel_paragraph=document[body_start:section_start],
+        document_tail=document[section_start:],
+        rels=rels,
+        core=core_xml,
     )
+
+
+def _run_xml(text):
+    """Un run de texto como lo escribe python-docx (tabs y saltos de línea como elementos)."""
+    parts = []
+    for piece in _RUN_BREAKS.split(_INVALID_XML_CHARS.sub('', text)):
+        if piece == '\t':
+            parts.append('<w:tab/>')
+        elif piece in ('\r', '\n'):
+            parts.append('<w:br/>')
+        elif piece:
+            space = ' xml:space="preserve"' if len(piece.strip()) < len(piece) else ''
+            parts.append(f'<w:t{space}>{escape(piece)}</w:t>')
+    return f"<w:r>{''.join(parts)}</w:r>"
+
+
+def _document_member(template, title, content):
+    """document.xml comprimido: título, contenido y el párrafo del pixel (que apunta a la relación, no a la URL)."""
+    body = []
+    if title:
+        body.append(f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr>{_run_xml(title)}</w:p>')
+    if content:
+        body.append(f'<w:p>{_run_xml(content)}</w:p>')
+    document = template.document_head + ''.join(body) + template.pixel_paragraph + template.document_tail
+    return ZipMember.compress(DOCUMENT_PART, document.encode('utf-8'))
+
+
+def _xml_text(value):
+    return escape(_INVALID_XML_CHARS.sub('', value or ''))
+
+
+def _iso_date(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def generate_docx_honeytoken(server_url, output_file, description, title=None, author=None, content=None, token_data=None):
+    """
+    Genera un archivo .docx con un pixel de tracking externo y metadatos anti-forense.
+    Sólo se escriben document.xml, sus relaciones y core.xml; el resto del
+    paquete (estilos, tema, settings, ...) se copia ya comprimido del esqueleto.
+    """
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="docx",
+            description=description
+        )
     
     tracking_url = token_data['tracking_url_image']
     
-    # common.py devuelve strings ISO, pero python-docx necesita objetos datetime
+    # common.py devuelve strings ISO
     str_created = random_creation_date()
     str_modified = random_modification_date(str_created)
-    dt_created = datetime.strptime(str_created, '%Y-%m-%dT%H:%M:%SZ')
     dt_modified = datetime.strptime(str_modified, '%Y-%m-%dT%H:%M:%SZ')
 
-    # Crea el Documento
-    doc = Document()
+    template = _docx_template()
 
-    # Contenido visible
-    if title:
-        doc.add_heading(title, level=1)
-    if content:
-        doc.add_paragraph(content)
+    # document.xml (contenido visible + pixel) no depende del token: se cachea ya comprimido
+    document = artifact_cache.get_or_render(
+        artifact_key('docx', title, content),
+        lambda: _document_member(template, title, content),
+        lambda member: len(member.data)
+    )
 
-    # Inyecta el pixel de tracking
-    p = doc.add_paragraph()
-    inject_tracking_pixel(p, tracking_url)
+    rels = template.rels.replace(escape(_PLACEHOLDER_URL), escape(tracking_url, {'"': '&quot;'}))
 
-    # Agregamos Metadatos
-    core = doc.core_properties
-    core.title = title if title else ""
-    core.author = author if author else ""
-    core.created = dt_created
-    core.modified = dt_modified
+    # Metadatos
+    core = (template.core
+            .replace(_PLACEHOLDER_TITLE, _xml_text(title))
+            .replace(_PLACEHOLDER_AUTHOR, _xml_text(author))
+            .replace(_iso_date(_PLACEHOLDER_CREATED), str_created)
+            .replace(_iso_date(_PLACEHOLDER_MODIFIED), str_modified))
 
-    doc.save(output_file)
\ No newline at end of file
+    template.skeleton.write(output_file, {
+        DOCUMENT_PART: document,
+        RELS_PART: rels.encode('utf-8'),
+        CORE_PART: core.encode('utf-8'),
+    }, date_time=dt_modified.timetuple())
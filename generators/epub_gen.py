@@ -1,5 +1,10 @@
-from ebooklib import epub
+import time
+import uuid
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
 from .common import register_token
+from .zipcache import STORED, ZipMember, ZipSkeleton
 
 def get_default_css():
     return """
@@ -8,53 +13,163 @@ def get_default_css():
     h1 { text-align: left; }
     """
 
-def generate_epub_honeytoken(server_url, output_file, title, author, description, content):
+
+# --- TEMPLATES ESTÁTICOS (mismo paquete que escribía ebooklib) ---
+MIMETYPE = "application/epub+zip"
+
+CONTAINER = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="EPUB/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+# --- TEMPLATES DINÁMICOS ---
+OPF_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0" prefix="rendition: http://www.idpf.org/vocab/rendition/#">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    <meta property="dcterms:modified">{modified}</meta>
+    <meta name="generator" content="Ebook-lib 0.20.0"/>
+    <dc:identifier id="id">{uid}</dc:identifier>
+    <dc:title>{title}</dc:title>
+    <dc:language>es</dc:language>{creator}
+  </metadata>
+  <manifest>
+    <item href="chapter1.xhtml" id="chapter_0" media-type="application/xhtml+xml"/>
+    <item href="style/nav.css" id="style_nav" media-type="text/css"/>
+    <item href="toc.ncx" id="ncx" media-type="application/x-dtbncx+xml"/>
+    <item href="nav.xhtml" id="nav" media-type="application/xhtml+xml" properties="nav"/>
+  </manifest>
+  <spine toc="ncx">
+    <itemref idref="chapter_0"/>
+  </spine>
+</package>
+"""
+
+CREATOR_TEMPLATE = """
+    <dc:creator id="creator">{}</dc:creator>"""
+
+CHAPTER_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" epub:prefix="z3998: http://www.daisy.org/z3998/2012/vocab/structure/#" lang="es" xml:lang="es">
+  <head>
+    <title>Introducción</title>
+  </head>
+  <body>{body}<div style="background-image:url('{tracking_url}'); width:1px; height:1px; position:absolute; left:-9999px;"/>
+      </body>
+</html>
+"""
+
+NCX_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head>
+    <meta content="{uid}" name="dtb:uid"/>
+    <meta content="0" name="dtb:depth"/>
+    <meta content="0" name="dtb:totalPageCount"/>
+    <meta content="0" name="dtb:maxPageNumber"/>
+  </head>
+  <docTitle>
+    <text>{title}</text>
+  </docTitle>
+  <navMap/>
+</ncx>
+"""
+
+NAV_TEMPLATE = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang="es" xml:lang="es">
+  <head>
+    <title>{title}</title>
+  </head>
+  <body>
+    <nav epub:type="toc" id="id" role="doc-toc">
+      <h2>{title}</h2>
+      <ol/>
+    </nav>
+  </body>
+</html>
+"""
+
+OPF_PART = 'EPUB/content.opf'
+CHAPTER_PART = 'EPUB/chapter1.xhtml'
+NCX_PART = 'EPUB/toc.ncx'
+NAV_PART = 'EPUB/nav.xhtml'
+
+
+def _xhtml(tag, text):
     """
-    Crea un EPUB inyectando un pixel de tracking en el HTML.
+    HTML del usuario (título o contenido), dentro de `tag`, como XHTML bien
+    formado. Las etiquetas (<b>, <p>, <br>, ...) pasan al
+    capítulo igual que cuando lo armaba ebooklib (que también lo parseaba
+    como HTML) y el texto suelto se escapa. El parser sólo se importa si hay
+    markup o entidades.
     """
-    token_data = register_token(
-        server_url,
-        token_type="epub",
-        description=description
+    markup = f"<{tag}>{text}</{tag}>"
+    if '<' not in text and '&' not in text:
+        return markup
+    from lxml import etree, html
+
+    return ''.join(
+        escape(fragment) if isinstance(fragment, str)
+        else etree.tostring(fragment, encoding='unicode', method='xml')
+        for fragment in html.fragments_fromstring(markup)
     )
-    
-    tracking_url_image = token_data['tracking_url_image']
 
-    book = epub.EpubBook()
 
-    book.set_title(title if title else "")
-    book.set_language("es")
-    if author: book.add_author(author)
+@lru_cache(maxsize=None)
+def _epub_skeleton():
+    """
+    Esqueleto del paquete: el mimetype va primero y sin comprimir (lo exige
+    el formato); container.xml y el CSS se comprimen una vez por proceso.
+    """
+    return ZipSkeleton([
+        ZipMember.compress('mimetype', MIMETYPE.encode(), method=STORED),
+        ZipMember.compress('META-INF/container.xml', CONTAINER.encode()),
+        OPF_PART,
+        CHAPTER_PART,
+        ZipMember.compress('EPUB/style/nav.css', get_default_css().encode()),
+        NCX_PART,
+        NAV_PART,
+    ], (OPF_PART, CHAPTER_PART, NCX_PART, NAV_PART))
+
+
+def generate_epub_honeytoken(server_url, output_file, title, author, description, content, token_data=None):
+    """
+    Crea un EPUB inyectando un pixel de tracking en el HTML.
+    Sólo se arman el OPF, el capítulo, el NCX y el nav (que llevan el título
+    y el identificador); el resto del paquete sale del esqueleto.
+    """
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="epub",
+            description=description
+        )
+
+    tracking_url_image = token_data['tracking_url_image']
 
+    uid = str(uuid.uuid4())
+    now = time.time()
+    clean_title = escape(title or "")
 
-    head_title = title if title else ""
-    html_h1 = f"<h1>{title}</h1>" if title else ""
-    html_content = f"<p>{content}</p>" if content else ""
+    html_h1 = _xhtml('h1', title) + "\n        " if title else ""
+    html_content = _xhtml('p', content) + "\n        " if content else ""
 
-    c1 = epub.EpubHtml(title="Introducción", file_name="chapter1.xhtml", lang="es")
+    opf = OPF_TEMPLATE.format(
+        modified=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now)),
+        uid=uid,
+        title=clean_title,
+        creator=CREATOR_TEMPLATE.format(escape(author)) if author else ""
+    )
+    chapter = CHAPTER_TEMPLATE.format(
+        body=html_h1 + html_content,
+        tracking_url=escape(tracking_url_image, {"'": "&apos;"})
+    )
 
-    c1.content = f"""
-    <html>
-      <head>
-        <title>{head_title}</title>
-      </head>
-      <body>
-        {html_h1}
-        {html_content}
-        <div style="background-image:url('{tracking_url_image}'); width:1px; height:1px; position:absolute; left:-9999px;"></div>
-      </body>
-    </html>
-    """
-    
-    book.add_item(c1)
-
-    style_css = get_default_css()
-    nav_css = epub.EpubItem(uid="style_nav", file_name="style/nav.css", media_type="text/css", content=style_css)
-    book.add_item(nav_css)
-    
-    # book.toc = (epub.Link("chapter1.xhtml", title, "intro"),)
-    book.spine = [c1]
-    book.add_item(epub.EpubNcx())
-    book.add_item(epub.EpubNav())
-
-    epub.write_epub(output_file, book, {})
\ No newline at end of file
+    _epub_skeleton().write(output_file, {
+        OPF_PART: opf.encode('utf-8'),
+        CHAPTER_PART: chapter.encode('utf-8'),
+        NCX_PART: NCX_TEMPLATE.format(uid=uid, title=clean_title).encode('utf-8'),
+        NAV_PART: NAV_TEMPLATE.format(title=clean_title).encode('utf-8'),
+    }, date_time=time.localtime(now))
@@ -1,76 +1,288 @@
-import io
-from fpdf import FPDF
-from pypdf import PdfWriter, PdfReader
-from pypdf.generic import DictionaryObject, NameObject, TextStringObject
+import unicodedata
+import zlib
+from urllib.parse import quote
+
+from fpdf.fonts import fpdf_charwidths
+
+from .artifacts import artifact_cache, artifact_key
 from .common import register_token, random_creation_date, random_modification_date
 
-def generate_pdf_honeytoken(server_url, output_file, description, title=None, author=None, content=None):
+# Página A4 con la misma disposición que usaba FPDF (unidades en mm, derivadas de los puntos)
+K = 72 / 25.4
+PAGE_WIDTH_PT, PAGE_HEIGHT_PT = 595.28, 841.89
+PAGE_WIDTH, PAGE_HEIGHT = PAGE_WIDTH_PT / K, PAGE_HEIGHT_PT / K
+MARGIN = 28.35 / K
+CELL_MARGIN = MARGIN / 10
+PAGE_BREAK_TRIGGER = PAGE_HEIGHT - 2 * MARGIN
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+TITLE_FONT = (b'F1', 24, fpdf_charwidths['helveticaB'])
+CONTENT_FONT = (b'F2', 12, fpdf_charwidths['helvetica'])
+TITLE_LINE_HEIGHT = 20
+CONTENT_LINE_HEIGHT = 10
+
+FAKE_CREATOR = "Acrobat Pro 15.8.20082"
+
+# Caracteres ASCII imprimibles que se dejan tal cual en la URI de la OpenAction
+URI_SAFE_CHARS = ''.join(chr(c) for c in range(0x21, 0x7f))
+
+# Objetos fijos (recursos y fuentes estándar con WinAnsiEncoding): se arman una
+# sola vez y van al principio del archivo, así sus offsets también son fijos.
+_HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+_STATIC_OBJECTS = [
+    b'<</ProcSet [/PDF /Text] /Font <</F1 2 0 R /F2 3 0 R>>>>',
+    b'<</Type /Font /BaseFont /Helvetica-Bold /Subtype /Type1 /Encoding /WinAnsiEncoding>>',
+    b'<</Type /Font /BaseFont /Helvetica /Subtype /Type1 /Encoding /WinAnsiEncoding>>',
+]
+
+
+def _serialize_objects(objects, first_number, offset):
+    """'n 0 obj ... endobj' de cada objeto. Retorna (bytes, offsets)."""
+    chunks, offsets = [], []
+    for number, body in enumerate(objects, start=first_number):
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        offsets.append(offset)
+        offset += len(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), offsets
+
+
+_STATIC_BYTES, _STATIC_OFFSETS = _serialize_objects(_STATIC_OBJECTS, 1, len(_HEADER))
+_PREFIX = _HEADER + _STATIC_BYTES
+
+
+def _winansi(text):
     """
-    Genera un PDF con una OpenAction que redirige a un URL de tracking.
+    Codifica el texto de las páginas para las fuentes estándar (WinAnsi /
+    cp1252). Los caracteres fuera de cp1252 se reemplazan por su letra base
+    sin acento (ő -> o) o por '?', en lugar de fallar. Sólo para el contenido
+    de las páginas: la metadata va completa con `_text_string`.
     """
-    token_data = register_token(
-        server_url, 
-        token_type="pdf",
-        description=description
-    )
-    tracking_url = token_data['tracking_url_link']
+    text = text.replace('\r', '')
+    try:
+        return text.encode('cp1252')
+    except UnicodeEncodeError:
+        encoded = bytearray()
+        for char in text:
+            try:
+                encoded += char.encode('cp1252')
+            except UnicodeEncodeError:
+                encoded += unicodedata.normalize('NFKD', char).encode('cp1252', 'ignore') or b'?'
+        return bytes(encoded)
+
+
+def _escape(data):
+    return data.replace(b'\\', b'\\\\').replace(b')', b'\\)').replace(b'(', b'\\(')
+
+
+def _text_string(value):
+    """
+    String de la metadata: literal si es ASCII, UTF-16BE con BOM si no (así
+    no se pierde ningún caracter, aunque no entre en cp1252).
+    """
+    if value.isascii():
+        return b'(' + _escape(value.encode('ascii')) + b')'
+    return b'<' + (b'\xfe\xff' + value.encode('utf-16-be')).hex().upper().encode() + b'>'
+
+
+def _uri_string(uri):
+    """La acción URI sólo admite ASCII: lo demás va con %-encoding (UTF-8)."""
+    return b'(' + _escape(quote(uri, safe=URI_SAFE_CHARS).encode('ascii')) + b')'
+
+
+class _PageLayout:
+    """
+    Arma el contenido de las páginas con la misma disposición que
+    FPDF.cell / FPDF.multi_cell (justificado, con salto de página automático).
+    """
+
+    def __init__(self):
+        self.pages = []
+        self.font = None
+        self.word_spacing = 0
+        self.y = MARGIN
+        self._add_page()
+
+    def _add_page(self):
+        self.pages.append([b'2 J', b'%.2f w' % (0.2 * K)])
+        self.y = MARGIN
+        if self.font:
+            self._select_font()
 
-    # Creamos el PDF (con su título y contenido) usando la librería FPDF
-    pdf = FPDF()
-    pdf.add_page()
+    def _select_font(self):
+        name, size, _ = self.font
+        self.pages[-1].append(b'BT /%s %.2f Tf ET' % (name, size))
 
-    # Escribimos en el PDF
+    def set_font(self, font):
+        self.font = font
+        self._select_font()
+
+    def _set_word_spacing(self, word_spacing):
+        if word_spacing:
+            self.pages[-1].append(b'%.3f Tw' % (word_spacing * K))
+        elif self.word_spacing:
+            self.pages[-1].append(b'0 Tw')
+        self.word_spacing = word_spacing
+
+    def cell(self, height, text):
+        if self.y + height > PAGE_BREAK_TRIGGER:
+            word_spacing = self.word_spacing
+            if word_spacing:
+                self._set_word_spacing(0)
+            self._add_page()
+            if word_spacing:
+                self._set_word_spacing(word_spacing)
+        if text:
+            font_size = self.font[1] / K
+            self.pages[-1].append(b'BT %.2f %.2f Td (%s) Tj ET' % (
+                (MARGIN + CELL_MARGIN) * K,
+                (PAGE_HEIGHT - (self.y + 0.5 * height + 0.3 * font_size)) * K,
+                _escape(text)
+            ))
+        self.y += height
+
+    def multi_cell(self, height, text):
+        """Texto con cortes de línea automáticos (por palabra) y explícitos."""
+        _, size, widths = self.font
+        font_size = size / K
+        max_width = (TEXT_WIDTH - 2 * CELL_MARGIN) * 1000 / font_size
+
+        end = len(text) - 1 if text.endswith(b'\n') else len(text)
+        i = start = 0
+        separator, width, spaces, separator_width = -1, 0, 0, 0
+        while i < end:
+            char = text[i]
+            if char == 0x0A:
+                self._set_word_spacing(0)
+                self.cell(height, text[start:i])
+                i += 1
+                separator, start, width, spaces = -1, i, 0, 0
+                continue
+            if char == 0x20:
+                separator, separator_width = i, width
+                spaces += 1
+            width += widths.get(chr(char), 0)
+            if width > max_width:
+                if separator == -1:
+                    if i == start:
+                        i += 1
+                    self._set_word_spacing(0)
+                    self.cell(height, text[start:i])
+                else:
+                    word_spacing = (max_width - separator_width) / 1000 * font_size / (spaces - 1) if spaces > 1 else 0
+                    self._set_word_spacing(word_spacing)
+                    self.cell(height, text[start:separator])
+                    i = separator + 1
+                separator, start, width, spaces = -1, i, 0, 0
+            else:
+                i += 1
+        self._set_word_spacing(0)
+        self.cell(height, text[start:i])
+
+
+# Objetos: [fijos 1-3] páginas (4), cada página y su contenido, info, catálogo
+PAGES_NUMBER = len(_STATIC_OBJECTS) + 1
+
+
+def _render_pages(title, content):
+    """
+    Objetos de las páginas (Pages, y página + contenido de cada hoja) ya
+    serializados. Sólo dependen del título y el contenido, así que se cachean
+    entre honeytokens con el mismo texto. Retorna (bytes, offsets).
+    """
+    layout = _PageLayout()
     if title:
-        pdf.set_font("Arial", 'B', 24)
-        pdf.cell(0, 20, title, ln=1, align='L')
+        layout.set_font(TITLE_FONT)
+        layout.cell(TITLE_LINE_HEIGHT, _winansi(title))
     if content:
-        pdf.set_font("Arial", '', 12)
-        pdf.multi_cell(0, 10, content)
+        layout.set_font(CONTENT_FONT)
+        layout.multi_cell(CONTENT_LINE_HEIGHT, _winansi(content))
 
-    # Convertimos el PDF (creado con FPDF) para que pypdf pueda manipularlo
-    pdf_buffer_str = pdf.output(dest='S')
-    pdf_bytes = io.BytesIO(pdf_buffer_str.encode('latin-1'))
+    page_numbers = [PAGES_NUMBER + 1 + 2 * index for index in range(len(layout.pages))]
+    objects = [
+        b'<</Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %.2f %.2f]>>' % (
+            b' '.join(b'%d 0 R' % number for number in page_numbers),
+            len(page_numbers), PAGE_WIDTH_PT, PAGE_HEIGHT_PT
+        )
+    ]
+    for number, operations in zip(page_numbers, layout.pages):
+        stream = zlib.compress(b'\n'.join(operations) + b'\n')
+        objects.append(b'<</Type /Page /Parent %d 0 R /Resources 1 0 R /Contents %d 0 R>>' % (PAGES_NUMBER, number + 1))
+        objects.append(b'<</Filter /FlateDecode /Length %d>>\nstream\n%s\nendstream' % (len(stream), stream))
 
-    # Usamos pypdf
-    reader = PdfReader(pdf_bytes)
-    writer = PdfWriter()
+    body, offsets = _serialize_objects(objects, PAGES_NUMBER, len(_PREFIX))
+    return body, tuple(offsets)
+
+
+def build_pdf(tracking_url, title=None, author=None, content=None,
+              creation_date=None, modification_date=None, creator=FAKE_CREATOR):
+    """
+    Arma el PDF completo en una sola pasada: páginas, metadata y la
+    OpenAction que abre el URL de tracking. Retorna los bytes del archivo.
+    """
+    pages, page_offsets = artifact_cache.get_or_render(
+        artifact_key('pdf', title, content),
+        lambda: _render_pages(title, content),
+        lambda rendered: len(rendered[0])
+    )
+    info_number = PAGES_NUMBER + len(page_offsets)
+    catalog_number = info_number + 1
+
+    # Metadata para que parezca más legítimo
+    info = {'/Title': title, '/Author': author, '/Creator': creator, '/Producer': creator,
+            '/CreationDate': creation_date, '/ModDate': modification_date}
+    objects = [
+        b'<<%s>>' % b' '.join(
+            key.encode() + b' ' + _text_string(value) for key, value in info.items() if value
+        ),
+        b'<</Type /Catalog /Pages %d 0 R /OpenAction <</S /URI /URI %s>>>>' % (
+            PAGES_NUMBER, _uri_string(tracking_url)
+        ),
+    ]
+
+    body, offsets = _serialize_objects(objects, info_number, len(_PREFIX) + len(pages))
+    xref_offset = len(_PREFIX) + len(pages) + len(body)
+    xref = [b'xref\n0 %d\n0000000000 65535 f \n' % (catalog_number + 1)]
+    xref += [b'%010d 00000 n \n' % offset for offset in _STATIC_OFFSETS + list(page_offsets) + offsets]
+    trailer = b'trailer\n<</Size %d /Root %d 0 R /Info %d 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (
+        catalog_number + 1, catalog_number, info_number, xref_offset
+    )
+    return _PREFIX + pages + body + b''.join(xref) + trailer
+
+
+def _pdf_date(iso_date):
+    """'2025-03-01T10:20:30Z' -> 'D:20250301102030Z'"""
+    return f"D:{iso_date.replace('-', '').replace(':', '').replace('T', '')}"
 
-    writer.append_pages_from_reader(reader)
-    
-    # Agregamos metadata para que parezca más legítimo
-    metadata = {}
-    if title:
-        metadata['/Title'] = title
-    if author:
-        metadata['/Author'] = author
 
-    fake_creator = "Acrobat Pro 15.8.20082"
-    metadata['/Creator'] = fake_creator
-    metadata['/Producer'] = fake_creator
+def generate_pdf_honeytoken(server_url, output_file, description, title=None, author=None, content=None, token_data=None):
+    """
+    Genera un PDF con una OpenAction que redirige a un URL de tracking.
+    """
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="pdf",
+            description=description
+        )
+    tracking_url = token_data['tracking_url_link']
 
     # Fechas de creación y modificación
     c_date_iso = random_creation_date()
     m_date_iso = random_modification_date(c_date_iso)
-    # Las convertimos a formato PDF (D:YYYYMMDDHHmmSSZ)
-    c_date_pdf = f"D:{c_date_iso.replace('-', '').replace(':', '').replace('T', '')}"
-    m_date_pdf = f"D:{m_date_iso.replace('-', '').replace(':', '').replace('T', '')}"
-
-    metadata['/CreationDate'] = c_date_pdf
-    metadata['/ModDate'] = m_date_pdf
-
-    if metadata:
-        writer.add_metadata(metadata)
-
-    
-    # Inyectamos la OpenAction
-    uri_action = DictionaryObject({
-        NameObject("/S"): NameObject("/URI"),
-        NameObject("/URI"): TextStringObject(tracking_url)
-    })
-    writer._root_object.update({
-        NameObject("/OpenAction"): uri_action
-    })
-
-    # Guardamos el PDF
+
+    pdf_bytes = build_pdf(
+        tracking_url,
+        title=title,
+        author=author,
+        content=content,
+        creation_date=_pdf_date(c_date_iso),
+        modification_date=_pdf_date(m_date_iso)
+    )
+
+    # Guardamos el PDF (en un archivo o en un stream, ej. la respuesta HTTP)
+    if hasattr(output_file, "write"):
+        output_file.write(pdf_bytes)
+        return
     with open(output_file, "wb") as f:
-        writer.write(f)
\ No newline at end of file
+        f.write(pdf_bytes)
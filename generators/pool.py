@@ -0,0 +1,149 @@
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock
+    fcntl = None
+
+from .common import get_registrar
+
+DEFAULT_POOL_FILE = "token_pool.json"
+
+
+class PoolExhausted(Exception):
+    """El pool no tiene suficientes tokens reservados."""
+
+
+class TokenPool:
+    """
+    Pool local de tokens reservados en el servidor (/api/tokens/reserve).
+    Permite generar documentos sin conexión: cada documento toma un token
+    del pool y queda anotado como pendiente hasta que `sync` le asigna tipo
+    y descripción en el servidor (/api/tokens/claim).
+
+    El archivo es JSON:
+        {"server": ..., "available": [token_data, ...],
+         "used": [{token, type, description, output, synced, reserved}, ...],
+         "synced": N}
+    (`reserved` es el token_data original, para devolverlo al pool con `release`).
+    Los usados se borran del archivo al sincronizarlos (quedan contados en
+    `synced`), así el pool no crece con cada documento generado.
+    Cada operación toma un lock sobre `<pool>.lock`, así varias ejecuciones
+    de la CLI pueden usar el mismo pool.
+    """
+
+    def __init__(self, path=DEFAULT_POOL_FILE):
+        self.path = Path(path)
+
+    @contextmanager
+    def _open(self):
+        """Lee el pool con el lock tomado y lo guarda (de forma atómica) al salir."""
+        with open(self.path.with_suffix('.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self.path.exists():
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            else:
+                data = {'server': None, 'available': [], 'used': []}
+
+            yield data
+
+            tmp_file = self.path.with_suffix('.tmp')
+            with open(tmp_file, 'w') as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.path)
+
+    def status(self):
+        with self._open() as data:
+            pending = sum(1 for entry in data['used'] if not entry['synced'])
+            return {
+                'server': data['server'],
+                'available': len(data['available']),
+                'used': len(data['used']) + data.get('synced', 0),
+                'pending_sync': pending,
+            }
+
+    def fill(self, server_url, count):
+        """Reserva `count` tokens más en el servidor y los agrega al pool."""
+        with self._open() as data:
+            if data['server'] and data['server'] != server_url:
+                raise ValueError(
+                    f"El pool pertenece al servidor {data['server']}; usar otro archivo de pool para {server_url}"
+                )
+            data['server'] = server_url
+            data['available'].extend(get_registrar(server_url).reserve(count))
+            return len(data['available'])
+
+    def take(self, items):
+        """
+        Toma un token del pool por cada item (dict con type, description y output)
+        y retorna los token_data listos para pasar a los generadores.
+        Lanza PoolExhausted si no alcanzan (sin tomar ninguno). Los tokens de
+        los documentos que después no se puedan generar se devuelven con `release`.
+        """
+        with self._open() as data:
+            if len(data['available']) < len(items):
+                raise PoolExhausted(
+                    f"El pool tiene {len(data['available'])} tokens y se necesitan {len(items)} "
+                    f"(reservar más con --pool-fill)"
+                )
+            taken = data['available'][:len(items)]
+            del data['available'][:len(items)]
+
+            token_data = []
+            for item, reserved in zip(items, taken):
+                data['used'].append({
+                    'token': reserved['token'],
+                    'type': item['type'],
+                    'description': item.get('description'),
+                    'output': item.get('output'),
+                    'synced': False,
+                    'reserved': reserved,
+                })
+                token_data.append(dict(reserved, type=item['type'], description=item.get('description')))
+            return token_data
+
+    def release(self, tokens):
+        """
+        Devuelve al pool tokens tomados con `take` cuyo documento no se llegó
+        a generar: vuelven a `available` y dejan de figurar como usados.
+        Retorna la cantidad devuelta.
+        """
+        token_ids = {token['token'] for token in tokens if token}
+        if not token_ids:
+            return 0
+        with self._open() as data:
+            released = [
+                entry for entry in data['used']
+                if entry['token'] in token_ids and not entry['synced'] and 'reserved' in entry
+            ]
+            released_ids = {entry['token'] for entry in released}
+            data['used'] = [entry for entry in data['used'] if entry['token'] not in released_ids]
+            data['available'][:0] = [entry['reserved'] for entry in released]
+            return len(released)
+
+    def sync(self, server_url=None):
+        """
+        Asigna en el servidor el tipo y la descripción de los tokens usados
+        pendientes. Retorna (cantidad sincronizada, errores por token).
+        """
+        with self._open() as data:
+            pending = [entry for entry in data['used'] if not entry['synced']]
+            claimed, errors = set(), {}
+            if pending:
+                claimed, errors = get_registrar(server_url or data['server']).claim(pending)
+                claimed = set(claimed)
+                for entry in pending:
+                    if entry['token'] in claimed:
+                        entry['synced'] = True
+            # Ya asignados en el servidor: sólo se conserva la cuenta
+            remaining = [entry for entry in data['used'] if not entry['synced']]
+            data['synced'] = data.get('synced', 0) + len(data['used']) - len(remaining)
+            data['used'] = remaining
+            return len(claimed), errors
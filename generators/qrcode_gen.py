@@ -1,25 +1,265 @@
-from .common import register_token
+import os
+import struct
+import zlib
+from xml.sax.saxutils import escape
+
 import qrcode
+from qrcode.exceptions import DataOverflowError
+
+from .common import register_token
+
+ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+BOX_SIZE = 10
+BORDER = 4
+
+# Versión y máscara elegidas por (largo de los datos, corrección de errores).
+# Las URLs de tracking de un mismo servidor tienen todas el mismo largo: la
+# búsqueda de versión y la prueba de las 8 máscaras se hacen una sola vez.
+# (Cualquier máscara es válida; la elegida sólo optimiza la legibilidad.)
+_fit_cache = {}
+
+
+def qr_matrix(data, error_correction=ERROR_CORRECTION):
+    """Matriz de módulos del QR (lista de filas de bool, True = oscuro), sin borde."""
+    key = (len(data.encode('utf-8')), error_correction)
+    fitted = _fit_cache.get(key)
+    if fitted is not None:
+        version, mask = fitted
+        qr = qrcode.QRCode(version=version, error_correction=error_correction, mask_pattern=mask)
+        qr.add_data(data)
+        try:
+            qr.make(fit=False)
+            return qr.modules
+        except DataOverflowError:
+            # Mismo largo pero otra segmentación (ej. sólo dígitos vs texto): se vuelve a ajustar
+            pass
+
+    # Lo mismo que make(fit=True), pero guardando la máscara elegida
+    qr = qrcode.QRCode(error_correction=error_correction)
+    qr.add_data(data)
+    qr.best_fit()
+    mask = qr.best_mask_pattern()
+    qr.makeImpl(False, mask)
+    _fit_cache[key] = (qr.version, mask)
+    return qr.modules
+
+
+# ============================================================================
+# PNG y SVG (sin PIL)
+# ============================================================================
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def render_png(matrix, box_size=BOX_SIZE, border=BORDER):
+    """PNG blanco y negro de 1 bit por pixel (como el que guardaba PIL)."""
+    size = len(matrix) + 2 * border
+    pixels = size * box_size
+    quiet = '1' * (border * box_size)
+
+    raw = []
+    # Cada fila se completa a byte con bits en 1 (blanco)
+    padding = '1' * (-pixels % 8)
+    blank_row = b'\x00' + int('1' * pixels + padding, 2).to_bytes((pixels + 7) // 8, 'big')
+    raw.append(blank_row * (border * box_size))
+    for row in matrix:
+        bits = quiet + ''.join(('0' if dark else '1') * box_size for dark in row) + quiet + padding
+        raw.append((b'\x00' + int(bits, 2).to_bytes((pixels + 7) // 8, 'big')) * box_size)
+    raw.append(blank_row * (border * box_size))
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', struct.pack('>IIBBBBB', pixels, pixels, 1, 0, 0, 0, 0)),
+        _png_chunk(b'IDAT', zlib.compress(b''.join(raw), 9)),
+        _png_chunk(b'IEND', b''),
+    ])
+
+
+def _dark_runs(matrix):
+    """(fila, columna, largo) de cada tramo horizontal de módulos oscuros."""
+    for y, row in enumerate(matrix):
+        x = 0
+        width = len(row)
+        while x < width:
+            if row[x]:
+                start = x
+                while x < width and row[x]:
+                    x += 1
+                yield y, start, x - start
+            else:
+                x += 1
+
+
+def _svg_path(matrix, offset_x=0, offset_y=0):
+    return ''.join(f"M{offset_x + x} {offset_y + y}h{length}v1h-{length}z" for y, x, length in _dark_runs(matrix))
+
+
+def render_svg(matrix, box_size=BOX_SIZE, border=BORDER):
+    """SVG con un solo path (los tramos de módulos oscuros), en unidades de módulo."""
+    size = len(matrix) + 2 * border
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size * box_size}" height="{size * box_size}" '
+        f'viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path fill="#000" d="{_svg_path(matrix, border, border)}"/></svg>\n'
+    ).encode('utf-8')
+
+
+# ============================================================================
+# HOJAS CON VARIOS QR (para imprimir)
+# ============================================================================
+
+MM = 72 / 25.4
+SHEET_WIDTH_MM, SHEET_HEIGHT_MM = 210, 297
+SHEET_MARGIN_MM = 10
+SHEET_CELL_MM = 45
+LABEL_MM = 5
+
+
+def _sheet_layout(count, cell_mm=SHEET_CELL_MM):
+    """Posiciones (página, x, y en mm desde arriba a la izquierda) de cada QR en hojas A4."""
+    columns = max(1, int((SHEET_WIDTH_MM - 2 * SHEET_MARGIN_MM) // cell_mm))
+    rows = max(1, int((SHEET_HEIGHT_MM - 2 * SHEET_MARGIN_MM) // (cell_mm + LABEL_MM)))
+    per_page = columns * rows
+    for index in range(count):
+        page, slot = divmod(index, per_page)
+        row, column = divmod(slot, columns)
+        yield page, SHEET_MARGIN_MM + column * cell_mm, SHEET_MARGIN_MM + row * (cell_mm + LABEL_MM)
+
+
+def _pdf_escape(text):
+    return text.encode('latin-1', 'replace').replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def render_sheet_pdf(items, cell_mm=SHEET_CELL_MM):
+    """
+    PDF A4 con una grilla de QR vectoriales y su etiqueta abajo.
+    `items` es una lista de (matriz, etiqueta).
+    """
+    pages = []
+    for (matrix, label), (page, x, y) in zip(items, _sheet_layout(len(items), cell_mm)):
+        if page == len(pages):
+            pages.append([b'0 g'])
+        module = (cell_mm - 2) / (len(matrix) + 2 * BORDER) * MM
+        left = (x + 1) * MM + BORDER * module
+        top = (SHEET_HEIGHT_MM - y - 1) * MM - BORDER * module
+        ops = pages[page]
+        for row, column, length in _dark_runs(matrix):
+            ops.append(b'%.2f %.2f %.2f %.2f re' % (left + column * module, top - (row + 1) * module,
+                                                    length * module, module))
+        ops.append(b'f')
+        if label:
+            ops.append(b'BT /F1 7 Tf %.2f %.2f Td (%s) Tj ET' % (
+                (x + 1) * MM, (SHEET_HEIGHT_MM - y - cell_mm - LABEL_MM + 1.5) * MM, _pdf_escape(label)
+            ))
+
+    # 1 catálogo, 2 páginas, 3 fuente, después página + contenido de cada hoja
+    objects = [
+        b'<</Type /Catalog /Pages 2 0 R>>',
+        b'<</Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %.2f %.2f]>>' % (
+            b' '.join(b'%d 0 R' % (4 + 2 * i) for i in range(len(pages))), len(pages),
+            SHEET_WIDTH_MM * MM, SHEET_HEIGHT_MM * MM
+        ),
+        b'<</Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding>>',
+    ]
+    for i, ops in enumerate(pages):
+        stream = zlib.compress(b'\n'.join(ops))
+        objects.append(b'<</Type /Page /Parent 2 0 R /Resources <</Font <</F1 3 0 R>>>> /Contents %d 0 R>>' % (5 + 2 * i))
+        objects.append(b'<</Filter /FlateDecode /Length %d>>\nstream\n%s\nendstream' % (len(stream), stream))
+
+    out = [b'%PDF-1.4\n']
+    offsets = []
+    position = len(out[0])
+    for number, body in enumerate(objects, start=1):
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        offsets.append(position)
+        position += len(chunk)
+        out.append(chunk)
+    out.append(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    out.extend(b'%010d 00000 n \n' % offset for offset in offsets)
+    out.append(b'trailer\n<</Size %d /Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, position))
+    return b''.join(out)
+
+
+def render_sheet_svg(items, cell_mm=SHEET_CELL_MM):
+    """SVG A4 (una sola hoja, tan alta como haga falta) con la grilla de QR y sus etiquetas."""
+    layout = list(_sheet_layout(len(items), cell_mm))
+    per_page_height = SHEET_HEIGHT_MM
+    height = (max((page for page, _, _ in layout), default=0) + 1) * per_page_height
+    parts = [
+        f'<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{SHEET_WIDTH_MM}mm" height="{height}mm" '
+        f'viewBox="0 0 {SHEET_WIDTH_MM} {height}" shape-rendering="crispEdges">'
+        f'<rect width="{SHEET_WIDTH_MM}" height="{height}" fill="#fff"/>'
+    ]
+    for (matrix, label), (page, x, y) in zip(items, layout):
+        size = len(matrix) + 2 * BORDER
+        scale = (cell_mm - 2) / size
+        top = page * per_page_height + y + 1
+        parts.append(f'<path fill="#000" transform="translate({x + 1} {top}) scale({scale:.4f})" '
+                     f'd="{_svg_path(matrix, BORDER, BORDER)}"/>')
+        if label:
+            parts.append(f'<text x="{x + 1}" y="{top + cell_mm + LABEL_MM - 3.5}" font-family="Helvetica, Arial, sans-serif" '
+                         f'font-size="2.5">{escape(label)}</text>')
+    parts.append('</svg>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+# ============================================================================
+# GENERADORES
+# ============================================================================
+
+def _write(output_file, data):
+    if hasattr(output_file, 'write'):
+        output_file.write(data)
+    else:
+        with open(output_file, 'wb') as f:
+            f.write(data)
+
+
+def _output_format(output_file):
+    # Un stream con `name` (archivo abierto, respuesta HTTP) usa la extensión de ese nombre
+    name = getattr(output_file, 'name', None) if hasattr(output_file, 'write') else output_file
+    if not isinstance(name, str):
+        return 'png'
+    return {'.svg': 'svg', '.pdf': 'pdf'}.get(os.path.splitext(name)[1].lower(), 'png')
+
+
+def generate_qrcode_honeytoken(server_url, output_file, description, token_data=None):
+    """
+    Genera un QR con el link de tracking. El formato sale de la extensión de
+    `output_file` (o del `name` de un stream): .svg, .pdf (hoja A4 con el QR) o PNG (default).
+    """
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="qrcode",
+            description=description
+        )
 
-def generate_qrcode_honeytoken(server_url, output_file, description):
-    token_data = register_token(
-        server_url, 
-        token_type="qrcode",
-        description=description
-    )
-    
     tracking_url = token_data['tracking_url_link']
+    matrix = qr_matrix(tracking_url)
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4
-    )
-    
-    qr.add_data(tracking_url)
-    qr.make(fit=True)
+    output_format = _output_format(output_file)
+    if output_format == 'svg':
+        data = render_svg(matrix)
+    elif output_format == 'pdf':
+        data = render_sheet_pdf([(matrix, None)])
+    else:
+        data = render_png(matrix)
+    _write(output_file, data)
 
-    img = qr.make_image(fill_color="black", back_color="white")
 
-    img.save(output_file)
\ No newline at end of file
+def generate_qrcode_sheet(output_file, tokens, labels=True, cell_mm=SHEET_CELL_MM):
+    """
+    Hoja(s) para imprimir con un QR por token (`tokens`: datos de tokens ya
+    registrados, ej. de register_many o del pool), en PDF o SVG según la
+    extensión. Cada QR lleva debajo el ID de su token.
+    """
+    items = [(qr_matrix(token['tracking_url_link']), token.get('token') if labels else None) for token in tokens]
+    if _output_format(output_file) == 'svg':
+        _write(output_file, render_sheet_svg(items, cell_mm))
+    else:
+        _write(output_file, render_sheet_pdf(items, cell_mm))
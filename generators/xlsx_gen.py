@@ -1,6 +1,9 @@
-import zipfile
+from datetime import datetime
+from functools import lru_cache
 from xml.sax.saxutils import escape
+from .artifacts import artifact_cache, artifact_key
 from .common import register_token, random_creation_date, random_modification_date
+from .zipcache import ZipMember, ZipSkeleton
 
 
 # --- TEMPLATES XML ESTÁTICOS ---
@@ -72,46 +75,86 @@ CORE_PROPS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
 </cp:coreProperties>"""
 
 
-def generate_xlsx_honeytoken(server_url, output_file, description, title=None, author=None, content=None):
-    token_data = register_token(
-        server_url,
-        token_type="xlsx",
-        description=description
+# Partes que cambian en cada honeytoken
+SHEET_PART = 'xl/worksheets/sheet1.xml'
+DRAWING_RELS_PART = 'xl/drawings/_rels/drawing1.xml.rels'
+CORE_PART = 'docProps/core.xml'
+
+# Orden de los miembros en el paquete (el mismo que antes); None = dinámico
+PACKAGE_MEMBERS = [
+    ('[Content_Types].xml', CONTENT_TYPES),
+    ('_rels/.rels', RELS_GLOBAL),
+    ('xl/workbook.xml', WORKBOOK),
+    ('xl/_rels/workbook.xml.rels', WORKBOOK_RELS),
+    ('xl/worksheets/_rels/sheet1.xml.rels', WORKSHEET_RELS),
+    ('xl/styles.xml', STYLES),
+    ('docProps/app.xml', APP_PROPS),
+    (SHEET_PART, None),
+    ('xl/drawings/drawing1.xml', DRAWING),
+    (DRAWING_RELS_PART, None),
+    (CORE_PART, None),
+]
+
+
+@lru_cache(maxsize=None)
+def _xlsx_skeleton():
+    """Comprime una vez por proceso los miembros estáticos del paquete."""
+    members = [
+        ZipMember.compress(name, template.encode('utf-8')) if template is not None else name
+        for name, template in PACKAGE_MEMBERS
+    ]
+    return ZipSkeleton(members, [name for name, template in PACKAGE_MEMBERS if template is None])
+
+
+def write_xlsx(output, tracking_url, title=None, author=None, content=None, created=None, modified=None):
+    """
+    Escribe el .xlsx en `output` (ruta o stream binario). Sólo se comprimen
+    la hoja, las relaciones del dibujo (el pixel) y core.xml; el resto se
+    copia ya comprimido del esqueleto.
+    """
+    clean_title = escape(title or "")
+    clean_author = escape(author or "")
+    clean_content = escape(content or "")
+
+    # La hoja sólo depende del contenido: se cachea ya comprimida entre honeytokens
+    worksheet_final = artifact_cache.get_or_render(
+        artifact_key('xlsx', content),
+        lambda: ZipMember.compress(SHEET_PART, WORKSHEET_TEMPLATE.format(clean_content).encode('utf-8')),
+        lambda member: len(member.data)
     )
+    drawing_rels_final = DRAWING_RELS_TEMPLATE.format(escape(tracking_url, {'"': '&quot;'}))
+
+    core_props_final = CORE_PROPS_TEMPLATE.format(
+        title=clean_title,
+        author=clean_author,
+        created=created,
+        modified=modified
+    )
+
+    dt_modified = datetime.strptime(modified, '%Y-%m-%dT%H:%M:%SZ')
+    _xlsx_skeleton().write(output, {
+        SHEET_PART: worksheet_final,
+        DRAWING_RELS_PART: drawing_rels_final.encode('utf-8'),
+        CORE_PART: core_props_final.encode('utf-8'),
+    }, date_time=dt_modified.timetuple())
+
+
+def generate_xlsx_honeytoken(server_url, output_file, description, title=None, author=None, content=None, token_data=None):
+    """
+    Genera un .xlsx con una imagen externa (pixel de tracking) en la hoja.
+    `output_file` puede ser una ruta o un stream binario (ej. io.BytesIO).
+    """
+    if token_data is None:
+        token_data = register_token(
+            server_url,
+            token_type="xlsx",
+            description=description
+        )
     
     tracking_url = token_data['tracking_url_image']
 
     # Datos dinámicos
     ts_created = random_creation_date()
     ts_modified = random_modification_date(ts_created)
-    
-    clean_title = escape(title or "")
-    clean_author = escape(author or "")
-    clean_content = escape(content or "")
-    
-    worksheet_final = WORKSHEET_TEMPLATE.format(clean_content)
-    drawing_rels_final = DRAWING_RELS_TEMPLATE.format(tracking_url)
-    
-    core_props_final = CORE_PROPS_TEMPLATE.format(
-        title=clean_title, 
-        author=clean_author, 
-        created=ts_created,
-        modified=ts_modified
-    )
 
-    # Construcción
-    with zipfile.ZipFile(output_file, 'w', compression=zipfile.ZIP_DEFLATED) as z:
-        # Templates estáticos
-        z.writestr('[Content_Types].xml', CONTENT_TYPES)
-        z.writestr('_rels/.rels', RELS_GLOBAL)
-        z.writestr('xl/workbook.xml', WORKBOOK)
-        z.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
-        z.writestr('xl/worksheets/_rels/sheet1.xml.rels', WORKSHEET_RELS)
-        # z.writestr('xl/theme/theme1.xml', THEME)
-        z.writestr('xl/styles.xml', STYLES)
-        z.writestr('docProps/app.xml', APP_PROPS)
-        # Templates dinámicos
-        z.writestr('xl/worksheets/sheet1.xml', worksheet_final)
-        z.writestr('xl/drawings/drawing1.xml', DRAWING)
-        z.writestr('xl/drawings/_rels/drawing1.xml.rels', drawing_rels_final)
-        z.writestr('docProps/core.xml', core_props_final)   
\ No newline at end of file
+    write_xlsx(output_file, tracking_url, title, author, content, created=ts_created, modified=ts_modified)
@@ -0,0 +1,137 @@
+"""
+Escritura rápida de paquetes ZIP (docx, xlsx, epub) a partir de un esqueleto.
+
+Los miembros que no cambian entre honeytokens (estilos, tema, settings, ...)
+se guardan ya comprimidos, con su CRC y tamaños, y se copian tal cual; sólo
+los miembros dinámicos (documento, relaciones, metadatos) se comprimen en
+cada generación.
+"""
+import io
+import struct
+import zipfile
+import zlib
+
+STORED = zipfile.ZIP_STORED
+DEFLATED = zipfile.ZIP_DEFLATED
+
+_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+_CENTRAL_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+_END_RECORD = struct.Struct('<4s4H2LH')
+
+# Zip (versión 2.0) creado en MS-DOS, como lo escriben Office y zipfile
+_VERSION = 20
+_UTF8_FLAG = 0x800
+
+
+class ZipMember:
+    """Un miembro del paquete con los datos ya comprimidos."""
+
+    __slots__ = ('name', 'method', 'crc', 'size', 'data')
+
+    def __init__(self, name, method, crc, size, data):
+        self.name = name
+        self.method = method
+        self.crc = crc
+        self.size = size
+        self.data = data
+
+    @classmethod
+    def compress(cls, name, content, method=DEFLATED, level=6):
+        if method == DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            data = compressor.compress(content) + compressor.flush()
+        else:
+            data = content
+        return cls(name, method, zlib.crc32(content), len(content), data)
+
+
+def _dos_datetime(date_time):
+    """(año, mes, día, hora, min, seg) -> (hora DOS, fecha DOS)."""
+    year, month, day, hour, minute, second = date_time[:6]
+    return (hour << 11) | (minute << 5) | (second // 2), ((year - 1980) << 9) | (month << 5) | day
+
+
+class ZipSkeleton:
+    """
+    Esqueleto de un paquete ZIP: la lista ordenada de miembros, con los
+    estáticos precomprimidos y los dinámicos (`dynamic`) sólo por nombre.
+    """
+
+    def __init__(self, members, dynamic):
+        # members: lista de ZipMember o de nombres (los dinámicos)
+        self.members = members
+        self.dynamic = frozenset(dynamic)
+
+    @classmethod
+    def from_package(cls, package_bytes, dynamic):
+        """
+        Arma el esqueleto desde un paquete de ejemplo, copiando los bytes
+        comprimidos de los miembros estáticos sin descomprimirlos.
+        """
+        members = []
+        with zipfile.ZipFile(io.BytesIO(package_bytes)) as package:
+            for info in package.infolist():
+                if info.filename in dynamic:
+                    members.append(info.filename)
+                    continue
+                header = package_bytes[info.header_offset:info.header_offset + _LOCAL_HEADER.size]
+                fields = _LOCAL_HEADER.unpack(header)
+                start = info.header_offset + _LOCAL_HEADER.size + fields[10] + fields[11]
+                data = package_bytes[start:start + info.compress_size]
+                members.append(ZipMember(info.filename, info.compress_type, info.CRC, info.file_size, data))
+
+        missing = set(dynamic) - {member for member in members if isinstance(member, str)}
+        if missing:
+            raise ValueError(f"El paquete de ejemplo no tiene los miembros: {', '.join(sorted(missing))}")
+        return cls(members, dynamic)
+
+    def chunks(self, contents, date_time=(1980, 1, 1, 0, 0, 0), level=6):
+        """
+        Genera el paquete de a pedazos (headers, datos, directorio central),
+        para escribirlo en un stream sin armar el archivo completo en memoria.
+        `contents` tiene el contenido (bytes, o un ZipMember ya comprimido) de
+        cada miembro dinámico; todos los miembros llevan la fecha `date_time`.
+        """
+        dos_time, dos_date = _dos_datetime(date_time)
+        central = []
+        offset = 0
+
+        for member in self.members:
+            if isinstance(member, str):
+                content = contents[member]
+                # Un miembro dinámico puede venir ya comprimido (ej. de la caché de artefactos)
+                if not isinstance(content, ZipMember):
+                    content = ZipMember.compress(member, content, level=level)
+                member = content
+            name = member.name.encode('utf-8')
+            flags = 0 if name.isascii() else _UTF8_FLAG
+
+            header = _LOCAL_HEADER.pack(
+                b'PK\x03\x04', _VERSION, 0, flags, member.method, dos_time, dos_date,
+                member.crc, len(member.data), member.size, len(name), 0
+            )
+            yield header + name
+            yield member.data
+            central.append(_CENTRAL_HEADER.pack(
+                b'PK\x01\x02', _VERSION, 0, _VERSION, 0, flags, member.method, dos_time, dos_date,
+                member.crc, len(member.data), member.size, len(name), 0, 0, 0, 0, 0, offset
+            ) + name)
+            offset += len(header) + len(name) + len(member.data)
+
+        central_size = sum(len(entry) for entry in central)
+        yield b''.join(central) + _END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, len(central), len(central), central_size, offset, 0
+        )
+
+    def build(self, contents, date_time=(1980, 1, 1, 0, 0, 0), level=6):
+        """Arma el paquete completo en memoria (bytes)."""
+        return b''.join(self.chunks(contents, date_time, level))
+
+    def write(self, output, contents, date_time=(1980, 1, 1, 0, 0, 0), level=6):
+        """Escribe el paquete en `output`: una ruta o un stream binario (archivo, BytesIO, socket...)."""
+        if hasattr(output, 'write'):
+            for chunk in self.chunks(contents, date_time, level):
+                output.write(chunk)
+            return
+        with open(output, 'wb') as f:
+            f.writelines(self.chunks(contents, date_time, level))
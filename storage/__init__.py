@@ -0,0 +1,24 @@
+# Capa de persistencia del servidor de alertas.
+# Todos los backends exponen la misma interfaz (load, close, compact, sync,
+# has_token, get_token, list_tokens, add_token, add_tokens, update_token, delete_token, reset,
+# add_hit, add_hits, add_repeats, get_hit, hits_for_token, query_tokens, query_hits,
+# count_tokens, count_hits, totals, iter_hits, token_stats, global_stats).
+
+from .ingest import HitQueue
+from .journal import HitJournal
+from .json_store import JsonStore
+from .sqlite_store import SqliteStore
+
+BACKENDS = {
+    'json': (JsonStore, "tokensnare_db.json"),
+    'sqlite': (SqliteStore, "tokensnare_db.sqlite3"),
+}
+
+
+def open_storage(backend="json", path=None, **options):
+    """Crea el backend pedido. Si no se indica ruta se usa la ruta por defecto del backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de almacenamiento no soportado: {backend}. Opciones: {', '.join(BACKENDS)}")
+
+    store_class, default_path = BACKENDS[backend]
+    return store_class(path or default_path, **options)
@@ -0,0 +1,93 @@
+from collections import Counter
+
+# Buckets que se conservan en memoria (el resto se descarta al agregar nuevos)
+MAX_HOURLY_BUCKETS = 7 * 24
+MAX_DAILY_BUCKETS = 366
+# User agents distintos que se cuentan por token; al llenarse se reemplaza el menos visto
+MAX_USER_AGENTS = 50
+
+
+def hour_bucket(timestamp):
+    """'2025-06-01T13:45:10.123-03:00' -> '2025-06-01T13'"""
+    return timestamp[:13]
+
+
+def day_bucket(timestamp):
+    """'2025-06-01T13:45:10.123-03:00' -> '2025-06-01'"""
+    return timestamp[:10]
+
+
+class TokenStats:
+    """
+    Agregados de un token (o de toda la base) que se actualizan con cada hit,
+    para responder estadísticas sin recorrer el historial:
+    IPs únicas, primer/último hit, buckets por hora y por día y user agents.
+    Las IPs se cuentan por hits (no un set) para poder descontar un token
+    borrado de los agregados globales con `remove`.
+    """
+
+    __slots__ = ('ips', 'first_seen', 'last_seen', 'hourly', 'daily', 'user_agents')
+
+    def __init__(self):
+        self.ips = Counter()
+        self.first_seen = None
+        self.last_seen = None
+        self.hourly = {}
+        self.daily = {}
+        self.user_agents = Counter()
+
+    def add(self, hit, count=1):
+        """Suma `count` requests del hit (más de uno para repeticiones agrupadas)."""
+        timestamp = hit['timestamp']
+        if hit.get('ip'):
+            self.ips[hit['ip']] += count
+        if self.first_seen is None:
+            self.first_seen = timestamp
+        self.last_seen = timestamp
+
+        _increment_bucket(self.hourly, hour_bucket(timestamp), MAX_HOURLY_BUCKETS, count)
+        _increment_bucket(self.daily, day_bucket(timestamp), MAX_DAILY_BUCKETS, count)
+
+        user_agent = hit.get('user_agent')
+        if user_agent:
+            if user_agent not in self.user_agents and len(self.user_agents) >= MAX_USER_AGENTS:
+                least_seen, least_count = min(self.user_agents.items(), key=lambda item: item[1])
+                del self.user_agents[least_seen]
+                self.user_agents[user_agent] = least_count
+            self.user_agents[user_agent] += count
+
+    def remove(self, other):
+        """Descuenta los agregados de `other` (un token borrado) de estos."""
+        self.ips.subtract(other.ips)
+        self.user_agents.subtract(other.user_agents)
+        for counter in (self.ips, self.user_agents):
+            for key in [key for key, count in counter.items() if count <= 0]:
+                del counter[key]
+        for buckets, other_buckets in ((self.hourly, other.hourly), (self.daily, other.daily)):
+            for key, count in other_buckets.items():
+                if key in buckets:
+                    buckets[key] -= count
+                    if buckets[key] <= 0:
+                        del buckets[key]
+        if not self.daily:
+            self.first_seen = self.last_seen = None
+
+    def to_dict(self, hourly_since, daily_since, top=5):
+        return {
+            'unique_ips': len(self.ips),
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'hourly': {bucket: count for bucket, count in self.hourly.items() if bucket >= hourly_since},
+            'daily': {bucket: count for bucket, count in self.daily.items() if bucket >= daily_since},
+            'top_user_agents': [
+                {'user_agent': user_agent, 'hits': count}
+                for user_agent, count in self.user_agents.most_common(top)
+            ],
+        }
+
+
+def _increment_bucket(buckets, key, max_buckets, count=1):
+    buckets[key] = buckets.get(key, 0) + count
+    if len(buckets) > max_buckets:
+        # Los buckets se crean en orden cronológico: el primero es el más viejo
+        del buckets[next(iter(buckets))]
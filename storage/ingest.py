@@ -0,0 +1,263 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'block', 'sync')
+
+
+class HitQueue:
+    """
+    Cola de ingesta de hits desacoplada del request.
+    Los endpoints de tracking sólo encolan el hit y responden; un thread
+    escritor dedicado los toma por lotes y los guarda en el backend.
+
+    Política cuando la cola está llena (`overflow`):
+      - drop:  se descarta el hit y se incrementa el contador `dropped`.
+      - block: se espera hasta `block_timeout` segundos; si sigue llena se descarta.
+      - sync:  se escribe el hit directamente desde el thread del request.
+
+    Con `dedup_window` (segundos) los hits repetidos de un mismo cliente
+    (token, IP y user agent) dentro de la ventana no se guardan como hits
+    nuevos: se suman al `count` del primero, en una sola escritura al cerrar
+    la ventana. Sólo el primero dispara `on_written` (la alerta).
+
+    Un error del almacenamiento (base bloqueada, disco lleno) o de
+    `on_written` no detiene el thread escritor: se informa con `on_error`
+    (o por logging), el lote se cuenta en `failed` y se sigue con el próximo.
+
+    `stop()` drena la cola antes de terminar: ningún hit aceptado se pierde
+    en un apagado ordenado. No se bloquea aunque la cola esté llena.
+    """
+
+    _STOP = object()
+
+    def __init__(self, store, maxsize=10000, batch_size=256, flush_interval=0.5,
+                 overflow='drop', block_timeout=0.05, on_written=None, dedup_window=0,
+                 on_error=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Política de overflow no soportada: {overflow}. Opciones: {', '.join(OVERFLOW_POLICIES)}")
+
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.on_written = on_written
+        self.on_error = on_error
+        self.dedup_window = dedup_window
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.collapsed = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._stopping = threading.Event()
+        # Los contadores se actualizan desde varios threads de requests
+        self._stats_lock = threading.Lock()
+        # Ventanas abiertas, en orden de apertura:
+        # (token, ip, user agent) -> [hit guardado, inicio, repeticiones, timestamp de la última]
+        self._recent = OrderedDict()
+        # Con overflow 'sync' también escriben los threads de requests
+        self._write_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hit-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, hit):
+        """Encola un hit. Retorna False si se descartó por overflow."""
+        try:
+            if self.overflow == 'block':
+                self._queue.put(hit, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(hit)
+        except queue.Full:
+            if self.overflow == 'sync':
+                self._write_safely([hit])
+                return True
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Drena los hits pendientes y detiene el thread escritor, esperando
+        como mucho `timeout` segundos (None: hasta que termine de drenar).
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        try:
+            # Sólo para despertar al escritor; con la cola llena ya está procesando
+            self._queue.put_nowait(self._STOP)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'collapsed': self.collapsed,
+            'failed': self.failed,
+            'pending': self._queue.qsize(),
+        }
+
+    def _write(self, batch):
+        with self._write_lock:
+            repeats = []
+            if self.dedup_window > 0:
+                batch = self._collapse(batch, repeats)
+            try:
+                written = self.store.add_hits(batch) if batch else []
+            finally:
+                if self.dedup_window > 0:
+                    for hit in batch:
+                        if 'id' not in hit:
+                            # Token inexistente o lote fallido: no hay hit al que sumarle las repeticiones
+                            self._forget(hit)
+            if self.dedup_window > 0:
+                self._expire(repeats)
+            self._add_repeats(repeats)
+        with self._stats_lock:
+            self.written += len(written)
+        if self.on_written:
+            for hit in written:
+                try:
+                    self.on_written(hit)
+                except Exception as e:
+                    # El hit ya está guardado: una alerta que falla no afecta al resto
+                    self._report_error("al notificar un hit", e)
+
+    def _write_safely(self, batch):
+        try:
+            self._write(batch)
+        except Exception as e:
+            with self._stats_lock:
+                self.failed += len(batch)
+            self._report_error(f"al guardar un lote de {len(batch)} hits", e)
+
+    def _report_error(self, action, error):
+        if self.on_error is not None:
+            try:
+                self.on_error(action, error)
+                return
+            except Exception:
+                pass
+        log.error("Error %s: %s", action, error, exc_info=error)
+
+    def _collapse(self, batch, repeats):
+        """
+        Retorna los hits del lote que abren una ventana nueva; los demás se
+        suman a la ventana abierta de su cliente. Las ventanas vencidas que
+        se reabren dejan sus repeticiones en `repeats`.
+        """
+        now = time.monotonic()
+        fresh = []
+        for hit in batch:
+            key = (hit['token'], hit.get('ip'), hit.get('user_agent'))
+            window = self._recent.get(key)
+            if window is not None:
+                if now - window[1] < self.dedup_window:
+                    window[2] += 1
+                    window[3] = hit['timestamp']
+                    continue
+                del self._recent[key]
+                if window[2] and 'id' in window[0]:
+                    repeats.append((window[0], window[2], window[3]))
+            self._recent[key] = [hit, now, 0, None]
+            fresh.append(hit)
+        return fresh
+
+    def _forget(self, hit):
+        key = (hit['token'], hit.get('ip'), hit.get('user_agent'))
+        window = self._recent.get(key)
+        if window is not None and window[0] is hit:
+            del self._recent[key]
+
+    def _expire(self, repeats, force=False):
+        """Cierra las ventanas vencidas (todas con `force`) y deja sus repeticiones en `repeats`."""
+        now = time.monotonic()
+        while self._recent:
+            key, window = next(iter(self._recent.items()))
+            if not force and now - window[1] < self.dedup_window:
+                break
+            del self._recent[key]
+            if window[2] and 'id' in window[0]:
+                repeats.append((window[0], window[2], window[3]))
+
+    def _add_repeats(self, repeats):
+        if not repeats:
+            return
+        self.store.add_repeats(repeats)
+        with self._stats_lock:
+            self.collapsed += sum(count for _, count, _ in repeats)
+
+    def _flush_repeats(self, force=False):
+        with self._write_lock:
+            repeats = []
+            self._expire(repeats, force)
+            self._add_repeats(repeats)
+
+    def _idle(self, force=False):
+        """Cierra ventanas vencidas y baja a disco lo pendiente."""
+        try:
+            self._flush_repeats(force)
+            self.store.sync()
+        except Exception as e:
+            self._report_error("al sincronizar el almacenamiento", e)
+
+    def _run(self):
+        running = True
+        while running:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                # Sin tráfico: aprovechamos para cerrar ventanas vencidas y bajar a disco lo pendiente
+                self._idle()
+                continue
+
+            batch = []
+            while True:
+                if item is self._STOP:
+                    running = False
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_safely(batch)
+
+        # Drenar lo que haya quedado detrás del marcador de parada
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not self._STOP:
+                leftover.append(item)
+        for start in range(0, len(leftover), self.batch_size):
+            self._write_safely(leftover[start:start + self.batch_size])
+        self._idle(force=True)
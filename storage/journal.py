@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+
+class HitJournal:
+    """
+    Journal append-only (JSON Lines) con las operaciones sobre la base.
+    Cada operación agrega una línea al final del archivo, así que el costo de
+    registrar un hit es constante sin importar el tamaño del historial.
+    El fsync se hace por lotes: cada `fsync_every` entradas o cada
+    `fsync_interval` segundos, lo que ocurra primero.
+
+    Para compactar sin frenar las escrituras, `rotate()` aparta el journal
+    actual en `<journal>.1` (lo que va a cubrir el snapshot) y sigue en uno
+    vacío; `discard_rotated()` lo borra cuando el snapshot quedó escrito.
+    """
+
+    def __init__(self, path, fsync_every=64, fsync_interval=1.0):
+        self.path = Path(path)
+        self.rotated_path = self.path.with_name(self.path.name + '.1')
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # Entradas y bytes acumulados desde el último snapshot (para decidir compactar)
+        self.entries = 0
+        self.bytes = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._fh = None
+
+    def open(self):
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(',', ':'), ensure_ascii=False) + '\n'
+        self._fh.write(line)
+        self._fh.flush()
+        self.entries += 1
+        self.bytes += len(line)
+        self._pending += 1
+
+        if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        """Fuerza a disco las entradas pendientes."""
+        if self._fh is not None and self._pending:
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def replay(self):
+        """
+        Itera las entradas guardadas: primero las de un journal rotado que
+        quedó sin compactar (el proceso murió antes de terminar el snapshot)
+        y después las del actual.
+        Si el proceso murió a mitad de una escritura, la última línea queda
+        truncada: se descarta y la recuperación sigue con lo anterior.
+        """
+        self.entries = 0
+        self.bytes = 0
+        for path in (self.rotated_path, self.path):
+            if not path.exists():
+                continue
+            self.bytes += path.stat().st_size
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    self.entries += 1
+                    yield entry
+
+    def rotate(self):
+        """
+        Aparta las entradas actuales en el journal rotado y sigue en uno vacío.
+        Si quedó un rotado de una compactación que falló, se le agregan al final.
+        """
+        was_open = self._fh is not None
+        self.close()
+        if self.path.exists():
+            if self.rotated_path.exists():
+                with open(self.path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.unlink(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+        self.entries = 0
+        self.bytes = 0
+        if was_open:
+            self.open()
+
+    def discard_rotated(self):
+        """Borra el journal rotado (ya está cubierto por el snapshot)."""
+        try:
+            os.unlink(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
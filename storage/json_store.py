@@ -0,0 +1,551 @@
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin flock, no se puede detectar un segundo proceso
+    fcntl = None
+
+from .aggregates import TokenStats
+from .journal import HitJournal
+from .records import HeaderSets, HitRecord, header_set_ref
+
+log = logging.getLogger(__name__)
+
+# Orden de los tokens: función clave y si es descendente
+TOKEN_SORTS = {
+    'created': (lambda record: (record['created_at'], record['token']), False),
+    'last_hit': (lambda record: (record['last_hit'] or '', record['token']), True),
+}
+
+
+def _hit_matches(hit, since, until, ip):
+    if since is not None and hit.timestamp < since:
+        return False
+    if until is not None and hit.timestamp > until:
+        return False
+    if ip is not None and hit.ip != ip:
+        return False
+    return True
+
+
+def read_json_database(path):
+    """
+    Lee una base del backend JSON (snapshot + journal) sin abrirla: no toma
+    el lock de proceso ni crea el journal, así no deja archivos nuevos al
+    lado de la original (ej. al migrarla a SQLite). Retorna (tokens, hits)
+    con el mismo formato que list_tokens e iter_hits.
+    """
+    source = JsonStore(path)
+    source._load()
+    return source.list_tokens(), list(source.iter_hits())
+
+
+class JsonStore:
+    """
+    Backend por defecto: base en memoria + snapshot JSON + journal de operaciones.
+    Los hits se agrupan por token en memoria, así que las consultas y borrados
+    de un token no recorren el historial completo. En memoria cada hit es un
+    HitRecord y los headers se guardan una vez por conjunto distinto
+    (HeaderSets), tanto en memoria como en el snapshot y el journal.
+
+    Es seguro entre threads (todas las operaciones toman un lock), pero como la
+    base vive en memoria admite un único proceso: al abrirla toma un lock
+    exclusivo sobre `<db>.lock` y un segundo proceso falla al iniciar en lugar
+    de pisar el archivo. Para varios workers usar el backend sqlite.
+    """
+
+    def __init__(self, path, compact_ratio=1.0, compact_min_bytes=4 * 1024 * 1024,
+                 fsync_every=64, fsync_interval=1.0, lock_timeout=0):
+        self.path = Path(path)
+        # Segundos que se espera el lock de proceso antes de fallar: al
+        # recargar o reemplazar un worker, el nuevo puede arrancar antes de
+        # que el anterior termine de drenar su cola y suelte la base.
+        self.lock_timeout = lock_timeout
+        # Se compacta cuando el journal pesa más que `compact_ratio` veces el
+        # snapshot (y al menos `compact_min_bytes`): el costo de reescribir el
+        # snapshot se reparte entre una cantidad de hits proporcional a su tamaño.
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.journal = HitJournal(
+            self.path.with_suffix('.journal'),
+            fsync_every=fsync_every,
+            fsync_interval=fsync_interval
+        )
+        self._tokens = {}
+        self._hits = {}
+        self._header_sets = HeaderSets()
+        self._total_hits = 0
+        self._stats = {}
+        self._global_stats = TokenStats()
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._lock_file = None
+        # HitRecord con count != 1 (los únicos cuyo count hay que copiar al compactar)
+        self._repeated = set()
+        self._snapshot_bytes = 0
+        self._compaction = None  # thread que está escribiendo un snapshot
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    def load(self):
+        """
+        Carga el último snapshot y re-aplica las operaciones del journal
+        posteriores a él (las que tienen 'seq' mayor al del snapshot).
+        """
+        with self._lock:
+            self._acquire_process_lock()
+            self._load()
+            self.journal.open()
+
+    def _acquire_process_lock(self):
+        if fcntl is None or self._lock_file is not None:
+            return
+        lock_file = open(self.path.with_suffix('.lock'), 'w')
+        deadline = time.monotonic() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    continue
+            lock_file.close()
+            raise RuntimeError(
+                f"La base {self.path} ya está abierta por otro proceso. "
+                "El backend json admite un solo proceso; para varios workers usar STORAGE_BACKEND=sqlite."
+            )
+        self._lock_file = lock_file
+
+    def _release_process_lock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _load(self):
+        self._tokens, self._hits, self._total_hits, self._seq = {}, {}, 0, 0
+        self._repeated = set()
+        self._stats, self._global_stats = {}, TokenStats()
+        self._header_sets = HeaderSets()
+
+        if self.path.exists():
+            self._snapshot_bytes = self.path.stat().st_size
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self._tokens = data.get('tokens', {})
+            self._seq = data.get('seq', 0)
+            self._header_sets = HeaderSets(data.get('header_sets'))
+            for hit in data.get('hits', []):
+                record = self._record(hit)
+                self._hits.setdefault(hit['token'], []).append(record)
+                self._total_hits += record.count
+                self._add_stats(hit, record.count)
+
+        for entry in self.journal.replay():
+            if entry.get('seq', 0) <= self._seq:
+                continue
+            self._apply(entry)
+            self._seq = entry['seq']
+
+    def compact(self):
+        """
+        Escribe un snapshot completo y descarta el journal que cubre. Además
+        libera los conjuntos de headers que quedaron sin hits (tokens borrados).
+        """
+        self._wait_compaction()
+        with self._lock:
+            self._header_sets.prune({
+                hit.headers_ref for records in self._hits.values() for hit in records
+            })
+            state = self._capture()
+        self._write_snapshot(state)
+
+    def _capture(self):
+        """
+        Copia liviana del estado para escribir el snapshot fuera del lock y
+        rota el journal (las operaciones siguientes van al journal nuevo).
+        Los HitRecord no cambian salvo `count`, que se copia aparte (sólo el
+        de los que tienen repeticiones).
+        """
+        state = {
+            'seq': self._seq,
+            'tokens': {token: dict(record) for token, record in self._tokens.items()},
+            'header_sets': dict(self._header_sets.as_dict()),
+            'hits': [(token, list(records)) for token, records in self._hits.items()],
+            'counts': {record: record.count for record in self._repeated},
+        }
+        self.journal.rotate()
+        return state
+
+    def _write_snapshot(self, state):
+        tmp_file = self.path.with_suffix('.json.tmp')
+        with open(tmp_file, 'w') as f:
+            f.write('{"seq":%d,"tokens":' % state['seq'])
+            json.dump(state['tokens'], f, separators=(',', ':'))
+            f.write(',"header_sets":')
+            json.dump(state['header_sets'], f, separators=(',', ':'))
+            f.write(',"hits":[')
+            first = True
+            counts = state['counts']
+            for token, records in state['hits']:
+                for record in records:
+                    stored = record.to_json(token)
+                    count = counts.get(record, 1)
+                    if count != 1:
+                        stored['count'] = count
+                    else:
+                        stored.pop('count', None)
+                    f.write(('' if first else ',') + json.dumps(stored, separators=(',', ':')))
+                    first = False
+            f.write(']}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+        with self._lock:
+            self.journal.discard_rotated()
+            self._snapshot_bytes = self.path.stat().st_size
+
+    def _compact_in_background(self):
+        """Se llama con el lock tomado: sólo se copia el estado, el snapshot lo escribe otro thread."""
+        state = self._capture()
+
+        def run():
+            try:
+                self._write_snapshot(state)
+            except Exception as e:
+                # El journal rotado queda y se incluye en la próxima compactación
+                log.error("Error escribiendo el snapshot %s: %s", self.path, e, exc_info=e)
+
+        self._compaction = threading.Thread(target=run, name="json-compaction", daemon=True)
+        self._compaction.start()
+
+    def _wait_compaction(self):
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def sync(self):
+        with self._lock:
+            self.journal.sync()
+
+    def close(self):
+        self._wait_compaction()
+        with self._lock:
+            self.journal.close()
+            self._release_process_lock()
+
+    # ------------------------------------------------------------------
+    # Journal
+    # ------------------------------------------------------------------
+    def _apply(self, entry):
+        """
+        Aplica una operación del journal sobre la base en memoria.
+        Se usa tanto al registrar operaciones nuevas como al recuperar el journal.
+        """
+        op = entry['op']
+        if op == 'token':
+            record = entry['record']
+            self._tokens[record['token']] = record
+        elif op == 'update':
+            if entry['token'] in self._tokens:
+                self._tokens[entry['token']].update(entry['fields'])
+        elif op == 'hit':
+            hit = entry['hit']
+            token = hit['token']
+            if 'headers' in entry:
+                # Primer hit con este conjunto de headers: el conjunto viaja en la entrada
+                self._header_sets.put(hit['headers_ref'], entry['headers'])
+            if token in self._tokens:
+                self._hits.setdefault(token, []).append(self._record(hit))
+                self._total_hits += 1
+                self._tokens[token]['hits'] += 1
+                self._tokens[token]['last_hit'] = hit['timestamp']
+                self._add_stats(hit)
+        elif op == 'repeat':
+            # Repeticiones agrupadas de un hit ya guardado (id = posición en el historial del token)
+            token, count = entry['token'], entry['count']
+            token_hits = self._hits.get(token, [])
+            if token not in self._tokens or not 0 <= entry['id'] < len(token_hits):
+                return
+            record = token_hits[entry['id']]
+            record.count += count
+            self._repeated.add(record)
+            self._total_hits += count
+            self._tokens[token]['hits'] += count
+            self._tokens[token]['last_hit'] = entry['timestamp']
+            self._add_stats({
+                'token': token,
+                'timestamp': entry['timestamp'],
+                'ip': record.ip,
+                'user_agent': record.user_agent,
+            }, count)
+        elif op == 'delete':
+            token = entry['token']
+            self._tokens.pop(token, None)
+            records = self._hits.pop(token, ())
+            self._total_hits -= sum(record.count for record in records)
+            self._repeated.difference_update(records)
+            stats = self._stats.pop(token, None)
+            if stats is not None:
+                self._global_stats.remove(stats)
+        elif op == 'reset':
+            self._tokens.clear()
+            self._hits.clear()
+            self._repeated.clear()
+            self._header_sets.clear()
+            self._total_hits = 0
+            self._stats.clear()
+            self._global_stats = TokenStats()
+
+    def _record(self, hit):
+        """
+        HitRecord a partir de un hit guardado (con 'headers_ref') o de uno en
+        el formato anterior, con los headers completos en el propio hit.
+        """
+        if 'headers_ref' in hit:
+            ref = hit['headers_ref']
+        else:
+            ref = header_set_ref(hit.get('headers'))
+            if ref is not None and ref not in self._header_sets:
+                self._header_sets.put(ref, hit['headers'])
+        record = HitRecord(hit['timestamp'], hit.get('ip'), hit.get('user_agent'), ref, hit.get('count', 1))
+        if record.count != 1:
+            self._repeated.add(record)
+        return record
+
+    def _add_stats(self, hit, count=1):
+        stats = self._stats.get(hit['token'])
+        if stats is None:
+            stats = self._stats[hit['token']] = TokenStats()
+        stats.add(hit, count)
+        self._global_stats.add(hit, count)
+
+    def _commit(self, op, **data):
+        """
+        Registra una operación: la aplica en memoria y la agrega al journal.
+        Si el journal creció lo suficiente respecto del snapshot, lo compacta
+        en segundo plano.
+        """
+        self._seq += 1
+        entry = {'seq': self._seq, 'op': op, **data}
+        self._apply(entry)
+        self.journal.append(entry)
+
+        threshold = max(self.compact_min_bytes, self.compact_ratio * self._snapshot_bytes)
+        if self.journal.bytes >= threshold and not (self._compaction and self._compaction.is_alive()):
+            self._compact_in_background()
+
+    # ------------------------------------------------------------------
+    # Tokens
+    # ------------------------------------------------------------------
+    def has_token(self, token):
+        return token in self._tokens
+
+    def get_token(self, token):
+        with self._lock:
+            record = self._tokens.get(token)
+            return record.copy() if record else None
+
+    def list_tokens(self):
+        with self._lock:
+            return [record.copy() for record in self._tokens.values()]
+
+    def count_tokens(self):
+        return len(self._tokens)
+
+    def totals(self):
+        """Cantidad de tokens y de hits (contadores en memoria)."""
+        return {'tokens': len(self._tokens), 'hits': self._total_hits}
+
+    def add_token(self, record):
+        """Inserta el token si no existe. Retorna False si ya estaba registrado."""
+        with self._lock:
+            if record['token'] in self._tokens:
+                return False
+            self._commit('token', record=record)
+            return True
+
+    def add_tokens(self, records):
+        """Inserta varios tokens bajo un mismo lock. Retorna, por cada uno, si se insertó."""
+        with self._lock:
+            return [self.add_token(record) for record in records]
+
+    def update_token(self, token, **fields):
+        """Actualiza sólo los campos indicados (sin pisar los contadores de hits)."""
+        fields.pop('token', None)
+        with self._lock:
+            if token not in self._tokens or not fields:
+                return False
+            self._commit('update', token=token, fields=fields)
+            return True
+
+    def delete_token(self, token):
+        with self._lock:
+            if token not in self._tokens:
+                return False
+            self._commit('delete', token=token)
+            return True
+
+    def reset(self):
+        with self._lock:
+            self._commit('reset')
+
+    # ------------------------------------------------------------------
+    # Hits
+    # ------------------------------------------------------------------
+    def add_hit(self, hit):
+        """Guarda el hit y le asigna su 'id'. Retorna False si el token no existe."""
+        with self._lock:
+            if hit['token'] not in self._tokens:
+                return False
+            ref = header_set_ref(hit.get('headers'))
+            stored = {
+                'token': hit['token'],
+                'timestamp': hit['timestamp'],
+                'ip': hit.get('ip'),
+                'user_agent': hit.get('user_agent'),
+                'headers_ref': ref,
+            }
+            if ref is not None and ref not in self._header_sets:
+                # Cada conjunto de headers distinto se escribe una sola vez
+                self._commit('hit', hit=stored, headers=hit['headers'])
+            else:
+                self._commit('hit', hit=stored)
+            hit['id'] = len(self._hits[hit['token']]) - 1
+            return True
+
+    def add_hits(self, hits):
+        """Guarda un lote de hits. Retorna los que correspondían a tokens existentes."""
+        with self._lock:
+            return [hit for hit in hits if self.add_hit(hit)]
+
+    def add_repeats(self, repeats):
+        """
+        Suma repeticiones a hits ya guardados: `repeats` es una lista de
+        (hit con 'id', cantidad, timestamp de la última). Se descartan las de
+        hits que ya no existen (token borrado). Retorna cuántas se aplicaron.
+        """
+        applied = 0
+        with self._lock:
+            for hit, count, timestamp in repeats:
+                token_hits = self._hits.get(hit['token'], [])
+                position = hit['id']
+                if not 0 <= position < len(token_hits):
+                    continue
+                record = token_hits[position]
+                if record.ip != hit.get('ip') or record.user_agent != hit.get('user_agent'):
+                    # El token se borró y se volvió a crear: el id es de otro hit
+                    continue
+                self._commit('repeat', token=hit['token'], id=position, count=count, timestamp=timestamp)
+                applied += 1
+        return applied
+
+    def hits_for_token(self, token):
+        with self._lock:
+            return [hit.to_dict(token, self._header_sets) for hit in self._hits.get(token, ())]
+
+    def count_hits(self):
+        return self._total_hits
+
+    def get_hit(self, token, hit_id):
+        """Un hit puntual (con headers) por el id que devuelve query_hits."""
+        with self._lock:
+            token_hits = self._hits.get(token, [])
+            if not 0 <= hit_id < len(token_hits):
+                return None
+            return dict(token_hits[hit_id].to_dict(token, self._header_sets), id=hit_id)
+
+    def query_hits(self, token, since=None, until=None, ip=None,
+                   after=None, limit=100, reverse=False, headers=True):
+        """
+        Página de hits de un token, ordenada por id (posición en el historial
+        del token, que es append-only). `after` es el id del último hit de la
+        página anterior. Retorna (hits, cursor_siguiente o None).
+        """
+        with self._lock:
+            token_hits = self._hits.get(token, [])
+            if reverse:
+                start = len(token_hits) - 1 if after is None else after - 1
+                positions = range(start, -1, -1)
+            else:
+                start = 0 if after is None else after + 1
+                positions = range(start, len(token_hits))
+
+            page = []
+            for position in positions:
+                hit = token_hits[position]
+                if not _hit_matches(hit, since, until, ip):
+                    continue
+                if len(page) == limit:
+                    return page, page[-1]['id']
+                item = hit.to_dict(token, self._header_sets if headers else None)
+                item['id'] = position
+                page.append(item)
+            return page, None
+
+    def query_tokens(self, type=None, created_from=None, created_to=None, has_hits=None,
+                     hit_since=None, hit_until=None, ip=None, sort='created', after=None, limit=100):
+        """
+        Página de tokens filtrados. `sort` es 'created' (más viejos primero) o
+        'last_hit' (último hit más reciente primero). Los filtros de hits
+        (hit_since, hit_until, ip) dejan los tokens con al menos un hit que coincida.
+        Retorna (tokens, cursor_siguiente o None).
+        """
+        key, descending = TOKEN_SORTS[sort]
+        after = tuple(after) if after is not None else None
+
+        with self._lock:
+            candidates = []
+            for record in self._tokens.values():
+                if type is not None and record['type'] != type:
+                    continue
+                if created_from is not None and record['created_at'] < created_from:
+                    continue
+                if created_to is not None and record['created_at'] > created_to:
+                    continue
+                if has_hits is not None and bool(record['hits']) != has_hits:
+                    continue
+                if after is not None and (key(record) >= after if descending else key(record) <= after):
+                    continue
+                if (hit_since or hit_until or ip) and not any(
+                        _hit_matches(hit, hit_since, hit_until, ip) for hit in self._hits.get(record['token'], ())):
+                    continue
+                candidates.append(record)
+
+            candidates.sort(key=key, reverse=descending)
+            page = [record.copy() for record in candidates[:limit]]
+
+        next_cursor = list(key(page[-1])) if len(candidates) > limit else None
+        return page, next_cursor
+
+    # ------------------------------------------------------------------
+    # Estadísticas
+    # ------------------------------------------------------------------
+    def token_stats(self, token, hourly_since, daily_since, top=5):
+        """
+        Agregados de un token (ver TokenStats). Los buckets se filtran desde
+        `hourly_since` ('YYYY-MM-DDTHH') y `daily_since` ('YYYY-MM-DD').
+        Retorna None si el token no existe.
+        """
+        with self._lock:
+            if token not in self._tokens:
+                return None
+            stats = self._stats.get(token) or TokenStats()
+            return stats.to_dict(hourly_since, daily_since, top)
+
+    def global_stats(self, hourly_since, daily_since, top=5):
+        """Agregados de todos los hits de la base, con el mismo formato que token_stats."""
+        with self._lock:
+            return self._global_stats.to_dict(hourly_since, daily_since, top)
+
+    def iter_hits(self):
+        with self._lock:
+            hits = [hit.to_dict(token, self._header_sets)
+                    for token, token_hits in self._hits.items() for hit in token_hits]
+        yield from hits
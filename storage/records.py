@@ -0,0 +1,114 @@
+import hashlib
+import json
+import sys
+
+
+def header_set_ref(headers):
+    """
+    Referencia de un conjunto de headers: hash del contenido (respetando el
+    orden). Dos hits con los mismos headers comparten la misma referencia.
+    """
+    if not headers:
+        return None
+    canonical = json.dumps(headers, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:20]
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class HitRecord:
+    """
+    Hit compacto en memoria: sin dict por hit, con IP y user agent internados
+    (los clientes que repiten comparten el mismo string) y los headers como
+    referencia a un HeaderSets. El token no se guarda: es la clave de la lista.
+    `count` es la cantidad de requests que representa (las repeticiones del
+    mismo cliente dentro de la ventana de deduplicación se suman acá).
+    """
+
+    __slots__ = ('timestamp', 'ip', 'user_agent', 'headers_ref', 'count')
+
+    def __init__(self, timestamp, ip, user_agent, headers_ref, count=1):
+        self.timestamp = timestamp
+        self.ip = _intern(ip)
+        self.user_agent = _intern(user_agent)
+        self.headers_ref = headers_ref
+        self.count = count
+
+    def to_dict(self, token, header_sets=None):
+        """Vista completa del hit. Sin `header_sets` no se incluyen los headers."""
+        hit = {
+            'token': token,
+            'timestamp': self.timestamp,
+            'ip': self.ip,
+            'user_agent': self.user_agent,
+            'count': self.count,
+        }
+        if header_sets is not None:
+            hit['headers'] = header_sets.get(self.headers_ref)
+        return hit
+
+    def to_json(self, token):
+        """Forma en la que se guarda en el snapshot y el journal (sin 'count' si es 1)."""
+        stored = {
+            'token': token,
+            'timestamp': self.timestamp,
+            'ip': self.ip,
+            'user_agent': self.user_agent,
+            'headers_ref': self.headers_ref,
+        }
+        if self.count != 1:
+            stored['count'] = self.count
+        return stored
+
+
+class HeaderSets:
+    """Conjuntos de headers direccionados por contenido: cada conjunto distinto se guarda una vez."""
+
+    def __init__(self, sets=None):
+        self._sets = dict(sets or {})
+
+    def __contains__(self, ref):
+        return ref in self._sets
+
+    def __len__(self):
+        return len(self._sets)
+
+    def put(self, ref, headers):
+        self._sets[ref] = headers
+
+    def get(self, ref):
+        headers = self._sets.get(ref)
+        return dict(headers) if headers else {}
+
+    def prune(self, live_refs):
+        """Descarta los conjuntos que ya no referencia ningún hit."""
+        for ref in [ref for ref in self._sets if ref not in live_refs]:
+            del self._sets[ref]
+
+    def clear(self):
+        self._sets.clear()
+
+    def as_dict(self):
+        return self._sets
+
+
+def parse_header_list(raw):
+    """'Cookie, Authorization' -> {'cookie', 'authorization'} (None si está vacío)."""
+    names = {name.strip().lower() for name in (raw or '').split(',') if name.strip()}
+    return frozenset(names) or None
+
+
+def filter_headers(headers, allow=None, deny=None):
+    """
+    Aplica las listas de headers a guardar: si hay `allow` sólo se conservan
+    esos; los de `deny` se descartan siempre. Los nombres se comparan sin
+    distinguir mayúsculas.
+    """
+    if allow is None and deny is None:
+        return headers
+    return {
+        name: value for name, value in headers.items()
+        if (allow is None or name.lower() in allow) and (deny is None or name.lower() not in deny)
+    }
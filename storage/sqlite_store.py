@@ -0,0 +1,720 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .aggregates import MAX_DAILY_BUCKETS, MAX_HOURLY_BUCKETS, day_bucket, hour_bucket
+from .json_store import read_json_database
+from .records import header_set_ref
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    token       TEXT PRIMARY KEY,
+    type        TEXT NOT NULL,
+    description TEXT,
+    created_at  TEXT NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0,
+    last_hit    TEXT
+);
+
+CREATE TABLE IF NOT EXISTS hits (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    token      TEXT NOT NULL,
+    timestamp  TEXT NOT NULL,
+    ip         TEXT,
+    user_agent TEXT,
+    headers    TEXT,
+    headers_ref TEXT,
+    count      INTEGER NOT NULL DEFAULT 1
+);
+
+-- Cada conjunto de headers distinto se guarda una vez y los hits lo referencian por hash
+-- (hits.headers sólo tiene valor en filas anteriores a esta tabla)
+CREATE TABLE IF NOT EXISTS header_sets (
+    ref     TEXT PRIMARY KEY,
+    headers TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_hits_token ON hits(token, id);
+CREATE INDEX IF NOT EXISTS idx_hits_timestamp ON hits(timestamp);
+CREATE INDEX IF NOT EXISTS idx_hits_ip ON hits(ip);
+CREATE INDEX IF NOT EXISTS idx_tokens_created ON tokens(created_at, token);
+CREATE INDEX IF NOT EXISTS idx_tokens_last_hit ON tokens(COALESCE(last_hit, ''), token);
+
+-- Agregados por token, actualizados en la misma transacción que el hit
+CREATE TABLE IF NOT EXISTS token_ips (
+    token TEXT NOT NULL,
+    ip    TEXT NOT NULL,
+    hits  INTEGER NOT NULL,
+    PRIMARY KEY (token, ip)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS hit_buckets (
+    token  TEXT NOT NULL,
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    hits   INTEGER NOT NULL,
+    PRIMARY KEY (token, period, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS token_user_agents (
+    token      TEXT NOT NULL,
+    user_agent TEXT NOT NULL,
+    hits       INTEGER NOT NULL,
+    PRIMARY KEY (token, user_agent)
+) WITHOUT ROWID;
+
+-- Totales de toda la base (una fila por contador), para no contar la tabla de hits
+CREATE TABLE IF NOT EXISTS hit_totals (
+    name TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL
+) WITHOUT ROWID;
+
+-- Los mismos agregados sumados para toda la base, así las estadísticas globales
+-- leen filas ya calculadas en lugar de agrupar las tablas por token
+CREATE TABLE IF NOT EXISTS global_ips (
+    ip   TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS global_buckets (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    hits   INTEGER NOT NULL,
+    PRIMARY KEY (period, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS global_user_agents (
+    user_agent TEXT PRIMARY KEY,
+    hits       INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_token_ips_ip ON token_ips(ip);
+CREATE INDEX IF NOT EXISTS idx_hit_buckets_period ON hit_buckets(period, bucket);
+CREATE INDEX IF NOT EXISTS idx_global_user_agents_hits ON global_user_agents(hits);
+"""
+
+# Orden de los tokens: expresión clave y si es descendente
+TOKEN_SORTS = {
+    'created': ("(created_at, token)", "created_at, token", False),
+    'last_hit': ("(COALESCE(last_hit, ''), token)", "COALESCE(last_hit, '') DESC, token DESC", True),
+}
+
+HIT_COLUMNS_WITHOUT_HEADERS = "id, token, timestamp, ip, user_agent, count"
+HIT_COLUMNS = "hits.id, token, timestamp, ip, user_agent, hits.count, COALESCE(hits.headers, header_sets.headers) AS headers"
+HITS_WITH_HEADERS = "hits LEFT JOIN header_sets ON header_sets.ref = hits.headers_ref"
+
+
+def _hit_filters(since, until, ip, prefix=""):
+    """Condiciones SQL (y parámetros) para filtrar hits por rango de tiempo e IP."""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{prefix}timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{prefix}timestamp <= ?")
+        params.append(until)
+    if ip is not None:
+        clauses.append(f"{prefix}ip = ?")
+        params.append(ip)
+    return clauses, params
+
+STATS_TABLES = ('token_ips', 'hit_buckets', 'token_user_agents')
+GLOBAL_STATS_TABLES = ('global_ips', 'global_buckets', 'global_user_agents')
+
+# Recalcula los agregados desde la tabla de hits (bases creadas antes de
+# tener agregados, o después de importar una base JSON)
+REBUILD_STATS = (
+    "INSERT INTO token_ips SELECT token, ip, SUM(count) FROM hits WHERE ip IS NOT NULL AND ip != '' GROUP BY token, ip",
+    "INSERT INTO hit_buckets SELECT token, 'hour', substr(timestamp, 1, 13), SUM(count) FROM hits GROUP BY 1, 3",
+    "INSERT INTO hit_buckets SELECT token, 'day', substr(timestamp, 1, 10), SUM(count) FROM hits GROUP BY 1, 3",
+    "INSERT INTO token_user_agents SELECT token, user_agent, SUM(count) FROM hits "
+    "WHERE user_agent IS NOT NULL AND user_agent != '' GROUP BY token, user_agent",
+)
+
+# Agregados globales y totales, desde los agregados por token
+REBUILD_GLOBAL_STATS = (
+    "INSERT INTO global_ips SELECT ip, SUM(hits) FROM token_ips GROUP BY ip",
+    "INSERT INTO global_buckets SELECT period, bucket, SUM(hits) FROM hit_buckets GROUP BY period, bucket",
+    "INSERT INTO global_user_agents SELECT user_agent, SUM(hits) FROM token_user_agents GROUP BY user_agent",
+    "INSERT OR REPLACE INTO hit_totals VALUES ('hits', (SELECT COALESCE(SUM(count), 0) FROM hits))",
+    "INSERT OR REPLACE INTO hit_totals VALUES ('tokens', (SELECT COUNT(*) FROM tokens))",
+    "INSERT OR REPLACE INTO hit_totals VALUES ('unique_ips', (SELECT COUNT(*) FROM global_ips))",
+)
+
+# Descuenta de los agregados globales los de un token que se borra (antes de borrar los suyos)
+SUBTRACT_TOKEN_STATS = (
+    "UPDATE global_ips SET hits = hits - "
+    "(SELECT t.hits FROM token_ips t WHERE t.token = ?1 AND t.ip = global_ips.ip) "
+    "WHERE ip IN (SELECT ip FROM token_ips WHERE token = ?1)",
+    "UPDATE global_buckets SET hits = hits - "
+    "(SELECT t.hits FROM hit_buckets t WHERE t.token = ?1 AND t.period = global_buckets.period "
+    "AND t.bucket = global_buckets.bucket) "
+    "WHERE (period, bucket) IN (SELECT period, bucket FROM hit_buckets WHERE token = ?1)",
+    "UPDATE global_user_agents SET hits = hits - "
+    "(SELECT t.hits FROM token_user_agents t WHERE t.token = ?1 AND t.user_agent = global_user_agents.user_agent) "
+    "WHERE user_agent IN (SELECT user_agent FROM token_user_agents WHERE token = ?1)",
+    "DELETE FROM global_buckets WHERE hits <= 0 AND (period, bucket) IN "
+    "(SELECT period, bucket FROM hit_buckets WHERE token = ?1)",
+    "DELETE FROM global_user_agents WHERE hits <= 0 AND user_agent IN "
+    "(SELECT user_agent FROM token_user_agents WHERE token = ?1)",
+)
+
+# Suma `n` al total de hits, de tokens o de IPs únicas (en la misma transacción que el cambio que lo origina)
+ADD_TO_TOTAL = "UPDATE hit_totals SET hits = hits + ? WHERE name = 'hits'"
+ADD_TO_TOKENS = "UPDATE hit_totals SET hits = hits + ? WHERE name = 'tokens'"
+ADD_TO_UNIQUE_IPS = "UPDATE hit_totals SET hits = hits + ? WHERE name = 'unique_ips'"
+
+# Buckets que se conservan (los mismos que el backend JSON); los más viejos se
+# borran como mucho una vez cada BUCKET_PRUNE_INTERVAL segundos
+BUCKET_RETENTION = {'hour': timedelta(hours=MAX_HOURLY_BUCKETS), 'day': timedelta(days=MAX_DAILY_BUCKETS)}
+BUCKET_FORMATS = {'hour': '%Y-%m-%dT%H', 'day': '%Y-%m-%d'}
+BUCKET_PRUNE_INTERVAL = 3600
+
+TOKEN_COLUMNS = ('token', 'type', 'description', 'created_at', 'hits', 'last_hit')
+
+
+class SqliteStore:
+    """
+    Backend SQLite en modo WAL, con índices por token, timestamp e IP.
+    Las consultas de un token usan el índice en lugar de recorrer todos los hits.
+
+    Es el backend soportado para varios threads y varios procesos (workers)
+    contra el mismo archivo: cada thread usa su propia conexión, las
+    escrituras toman el lock de escritura de SQLite con BEGIN IMMEDIATE y los
+    contadores se actualizan dentro de la misma sentencia (hits = hits + 1).
+    """
+
+    def __init__(self, path, busy_timeout=5.0, token_refresh_interval=1.0):
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # IDs de todos los tokens, para que has_token (cada hit) no consulte la base.
+        # Los registrados por otros procesos se incorporan recargando el conjunto
+        # ante un token desconocido, como mucho cada `token_refresh_interval`
+        # segundos. Si otro proceso borra uno, el hit se descarta igual al guardarlo.
+        self.token_refresh_interval = token_refresh_interval
+        self._token_ids = set()
+        self._token_ids_loaded = 0.0
+        self._token_ids_lock = threading.Lock()
+        self._buckets_pruned = 0.0
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+    @property
+    def _conn(self):
+        """Conexión del thread actual (se crea la primera vez que se usa)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: las transacciones se abren explícitamente en _write()
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def load(self):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._write() as conn:
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            hit_columns = {row['name'] for row in conn.execute("PRAGMA table_info(hits)")}
+            if 'headers_ref' not in hit_columns:
+                conn.execute("ALTER TABLE hits ADD COLUMN headers_ref TEXT")
+            if 'count' not in hit_columns:
+                conn.execute("ALTER TABLE hits ADD COLUMN count INTEGER NOT NULL DEFAULT 1")
+            stats_missing = conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM hits) AND NOT EXISTS (SELECT 1 FROM hit_buckets)"
+            ).fetchone()[0]
+            if stats_missing:
+                self._rebuild_stats(conn)
+            elif not conn.execute("SELECT EXISTS (SELECT 1 FROM hit_totals WHERE name = 'unique_ips')").fetchone()[0]:
+                # Base anterior a los agregados globales: se calculan una vez
+                self._rebuild_global_stats(conn)
+        with self._token_ids_lock:
+            self._reload_token_ids()
+
+    def compact(self):
+        with self._write() as conn:
+            # Conjuntos de headers que quedaron sin hits al borrar tokens
+            conn.execute(
+                "DELETE FROM header_sets WHERE ref NOT IN "
+                "(SELECT DISTINCT headers_ref FROM hits WHERE headers_ref IS NOT NULL)"
+            )
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def sync(self):
+        # Cada transacción ya queda persistida en el WAL al hacer commit; sólo
+        # se aprovecha (el thread escritor llama acá cuando está ocioso) para
+        # descartar los buckets viejos
+        if time.monotonic() - self._buckets_pruned >= BUCKET_PRUNE_INTERVAL:
+            self.prune_buckets()
+
+    def prune_buckets(self, now=None):
+        """Borra los buckets por hora y por día fuera de la ventana que se conserva."""
+        now = now or datetime.now().astimezone()
+        with self._write() as conn:
+            for period, retention in BUCKET_RETENTION.items():
+                oldest = (now - retention).strftime(BUCKET_FORMATS[period])
+                for table in ('hit_buckets', 'global_buckets'):
+                    conn.execute(f"DELETE FROM {table} WHERE period = ? AND bucket < ?", (period, oldest))
+        self._buckets_pruned = time.monotonic()
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @contextmanager
+    def _write(self):
+        """
+        Transacción de escritura. BEGIN IMMEDIATE toma el lock de escritura
+        al empezar, así dos procesos no pueden intercalar sus cambios; si otro
+        proceso lo tiene, SQLite reintenta hasta `busy_timeout`.
+        """
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def import_json(self, json_path):
+        """
+        Migra una base existente del backend JSON (snapshot + journal).
+        Los tokens ya presentes en SQLite se reemplazan junto con sus hits.
+        Retorna la cantidad de tokens y hits importados.
+        """
+        tokens, hits = read_json_database(json_path)
+
+        with self._write() as conn:
+            for record in tokens:
+                conn.execute("DELETE FROM hits WHERE token = ?", (record['token'],))
+            conn.executemany(
+                "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?, ?)",
+                [tuple(record.get(col) for col in TOKEN_COLUMNS) for record in tokens]
+            )
+            conn.executemany(
+                "INSERT INTO hits (token, timestamp, ip, user_agent, headers_ref, count) VALUES (?, ?, ?, ?, ?, ?)",
+                [self._hit_row(conn, hit) + (hit.get('count', 1),) for hit in hits]
+            )
+            self._rebuild_stats(conn)
+        with self._token_ids_lock:
+            self._token_ids.update(record['token'] for record in tokens)
+        return len(tokens), len(hits)
+
+    @classmethod
+    def _rebuild_stats(cls, conn):
+        for table in STATS_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        for statement in REBUILD_STATS:
+            conn.execute(statement)
+        cls._rebuild_global_stats(conn)
+
+    @staticmethod
+    def _rebuild_global_stats(conn):
+        for table in GLOBAL_STATS_TABLES + ('hit_totals',):
+            conn.execute(f"DELETE FROM {table}")
+        for statement in REBUILD_GLOBAL_STATS:
+            conn.execute(statement)
+
+    # ------------------------------------------------------------------
+    # Conversión de filas
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _hit_row(conn, hit):
+        """Fila de la tabla hits; guarda el conjunto de headers si es nuevo."""
+        headers = hit.get('headers')
+        ref = header_set_ref(headers)
+        if ref is not None:
+            conn.execute("INSERT OR IGNORE INTO header_sets VALUES (?, ?)", (ref, json.dumps(headers)))
+        return (hit['token'], hit['timestamp'], hit.get('ip'), hit.get('user_agent'), ref)
+
+    @staticmethod
+    def _hit_dict(row, with_id=False):
+        hit = {
+            'token': row['token'],
+            'timestamp': row['timestamp'],
+            'ip': row['ip'],
+            'user_agent': row['user_agent'],
+            'count': row['count'],
+        }
+        if 'headers' in row.keys():
+            hit['headers'] = json.loads(row['headers']) if row['headers'] else {}
+        if with_id:
+            hit['id'] = row['id']
+        return hit
+
+    def _query(self, sql, params=()):
+        return self._conn.execute(sql, params).fetchall()
+
+    # ------------------------------------------------------------------
+    # Tokens
+    # ------------------------------------------------------------------
+    def _reload_token_ids(self):
+        # Se llama con _token_ids_lock tomado: los add/delete de este proceso
+        # esperan al reemplazo del set, así ninguno se aplica sobre el set viejo
+        self._token_ids = {row[0] for row in self._query("SELECT token FROM tokens")}
+        self._token_ids_loaded = time.monotonic()
+
+    def has_token(self, token):
+        if token in self._token_ids:
+            return True
+        # Desconocido: puede ser de otro proceso. La base se consulta como mucho
+        # una vez por intervalo, aunque lleguen miles de tokens inventados.
+        if time.monotonic() - self._token_ids_loaded < self.token_refresh_interval:
+            return False
+        if not self._token_ids_lock.acquire(blocking=False):
+            return False
+        try:
+            self._reload_token_ids()
+        finally:
+            self._token_ids_lock.release()
+        return token in self._token_ids
+
+    def get_token(self, token):
+        rows = self._query("SELECT * FROM tokens WHERE token = ?", (token,))
+        return dict(rows[0]) if rows else None
+
+    def list_tokens(self):
+        return [dict(row) for row in self._query("SELECT * FROM tokens ORDER BY created_at")]
+
+    def count_tokens(self):
+        return self.totals()['tokens']
+
+    def totals(self):
+        """Cantidad de tokens y de hits, de los contadores mantenidos (sin contar filas)."""
+        totals = {'tokens': 0, 'hits': 0}
+        totals.update((row[0], row[1]) for row in self._query(
+            "SELECT name, hits FROM hit_totals WHERE name IN ('tokens', 'hits')"
+        ))
+        return totals
+
+    def add_token(self, record):
+        """Inserta el token si no existe. Retorna False si ya estaba registrado."""
+        with self._write() as conn:
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO tokens VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(record.get(col) for col in TOKEN_COLUMNS)
+            ).rowcount
+            if inserted:
+                conn.execute(ADD_TO_TOKENS, (1,))
+        with self._token_ids_lock:
+            self._token_ids.add(record['token'])
+        return inserted > 0
+
+    def add_tokens(self, records):
+        """Inserta varios tokens en una sola transacción. Retorna, por cada uno, si se insertó."""
+        with self._write() as conn:
+            inserted = [
+                conn.execute(
+                    "INSERT OR IGNORE INTO tokens VALUES (?, ?, ?, ?, ?, ?)",
+                    tuple(record.get(col) for col in TOKEN_COLUMNS)
+                ).rowcount > 0
+                for record in records
+            ]
+            if any(inserted):
+                conn.execute(ADD_TO_TOKENS, (sum(inserted),))
+        with self._token_ids_lock:
+            self._token_ids.update(record['token'] for record in records)
+        return inserted
+
+    def update_token(self, token, **fields):
+        """Actualiza sólo los campos indicados (sin pisar los contadores de hits)."""
+        columns = [col for col in fields if col in TOKEN_COLUMNS and col != 'token']
+        if not columns:
+            return False
+        assignments = ", ".join(f"{col} = ?" for col in columns)
+        with self._write() as conn:
+            updated = conn.execute(
+                f"UPDATE tokens SET {assignments} WHERE token = ?",
+                [fields[col] for col in columns] + [token]
+            ).rowcount
+        return updated > 0
+
+    def delete_token(self, token):
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE hit_totals SET hits = hits - (SELECT COALESCE(SUM(count), 0) FROM hits WHERE token = ?) "
+                "WHERE name = 'hits'", (token,)
+            )
+            deleted = conn.execute("DELETE FROM tokens WHERE token = ?", (token,)).rowcount
+            conn.execute(ADD_TO_TOKENS, (-deleted,))
+            for statement in SUBTRACT_TOKEN_STATS:
+                conn.execute(statement, (token,))
+            gone_ips = conn.execute(
+                "DELETE FROM global_ips WHERE hits <= 0 AND ip IN (SELECT ip FROM token_ips WHERE token = ?)", (token,)
+            ).rowcount
+            conn.execute(ADD_TO_UNIQUE_IPS, (-gone_ips,))
+            for table in ('hits',) + STATS_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE token = ?", (token,))
+        with self._token_ids_lock:
+            self._token_ids.discard(token)
+        return deleted > 0
+
+    def reset(self):
+        with self._write() as conn:
+            for table in ('tokens', 'hits', 'header_sets') + STATS_TABLES + GLOBAL_STATS_TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            conn.execute("UPDATE hit_totals SET hits = 0")
+        with self._token_ids_lock:
+            self._token_ids.clear()
+
+    # ------------------------------------------------------------------
+    # Hits
+    # ------------------------------------------------------------------
+    def _insert_hit(self, hit):
+        updated = self._conn.execute(
+            "UPDATE tokens SET hits = hits + 1, last_hit = ? WHERE token = ?",
+            (hit['timestamp'], hit['token'])
+        ).rowcount
+        if not updated:
+            return False
+        hit['id'] = self._conn.execute(
+            "INSERT INTO hits (token, timestamp, ip, user_agent, headers_ref) VALUES (?, ?, ?, ?, ?)",
+            self._hit_row(self._conn, hit)
+        ).lastrowid
+        self._update_stats(hit)
+        return True
+
+    def _update_stats(self, hit, count=1):
+        conn, token, timestamp = self._conn, hit['token'], hit['timestamp']
+        if hit.get('ip'):
+            conn.execute(
+                "INSERT INTO token_ips VALUES (?, ?, ?) ON CONFLICT (token, ip) DO UPDATE SET hits = hits + excluded.hits",
+                (token, hit['ip'], count)
+            )
+            seen = conn.execute("UPDATE global_ips SET hits = hits + ? WHERE ip = ?", (count, hit['ip'])).rowcount
+            if not seen:
+                conn.execute("INSERT INTO global_ips VALUES (?, ?)", (hit['ip'], count))
+                conn.execute(ADD_TO_UNIQUE_IPS, (1,))
+        buckets = [('hour', hour_bucket(timestamp)), ('day', day_bucket(timestamp))]
+        conn.executemany(
+            "INSERT INTO hit_buckets VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (token, period, bucket) DO UPDATE SET hits = hits + excluded.hits",
+            [(token, period, bucket, count) for period, bucket in buckets]
+        )
+        conn.executemany(
+            "INSERT INTO global_buckets VALUES (?, ?, ?) "
+            "ON CONFLICT (period, bucket) DO UPDATE SET hits = hits + excluded.hits",
+            [(period, bucket, count) for period, bucket in buckets]
+        )
+        if hit.get('user_agent'):
+            conn.execute(
+                "INSERT INTO token_user_agents VALUES (?, ?, ?) "
+                "ON CONFLICT (token, user_agent) DO UPDATE SET hits = hits + excluded.hits",
+                (token, hit['user_agent'], count)
+            )
+            conn.execute(
+                "INSERT INTO global_user_agents VALUES (?, ?) "
+                "ON CONFLICT (user_agent) DO UPDATE SET hits = hits + excluded.hits",
+                (hit['user_agent'], count)
+            )
+
+    def add_hit(self, hit):
+        """Guarda el hit y le asigna su 'id'. Retorna False si el token no existe."""
+        with self._write() as conn:
+            inserted = self._insert_hit(hit)
+            if inserted:
+                conn.execute(ADD_TO_TOTAL, (1,))
+            return inserted
+
+    def add_hits(self, hits):
+        """Guarda un lote de hits en una sola transacción. Retorna los aceptados."""
+        with self._write() as conn:
+            accepted = [hit for hit in hits if self._insert_hit(hit)]
+            if accepted:
+                conn.execute(ADD_TO_TOTAL, (len(accepted),))
+            return accepted
+
+    def add_repeats(self, repeats):
+        """
+        Suma repeticiones a hits ya guardados: `repeats` es una lista de
+        (hit con 'id', cantidad, timestamp de la última), en una sola
+        transacción. Retorna cuántas se aplicaron.
+        """
+        applied = 0
+        with self._write() as conn:
+            for hit, count, timestamp in repeats:
+                updated = conn.execute(
+                    "UPDATE hits SET count = count + ? WHERE id = ? AND token = ?",
+                    (count, hit['id'], hit['token'])
+                ).rowcount
+                if not updated:
+                    continue
+                conn.execute(
+                    "UPDATE tokens SET hits = hits + ?, last_hit = ? WHERE token = ?",
+                    (count, timestamp, hit['token'])
+                )
+                self._update_stats(dict(hit, timestamp=timestamp), count)
+                conn.execute(ADD_TO_TOTAL, (count,))
+                applied += 1
+        return applied
+
+    def hits_for_token(self, token):
+        rows = self._query(f"SELECT {HIT_COLUMNS} FROM {HITS_WITH_HEADERS} WHERE token = ? ORDER BY hits.id", (token,))
+        return [self._hit_dict(row) for row in rows]
+
+    def count_hits(self):
+        return self.totals()['hits']
+
+    def get_hit(self, token, hit_id):
+        """Un hit puntual (con headers) por el id que devuelve query_hits."""
+        rows = self._query(f"SELECT {HIT_COLUMNS} FROM {HITS_WITH_HEADERS} WHERE hits.id = ? AND token = ?", (hit_id, token))
+        return self._hit_dict(rows[0], with_id=True) if rows else None
+
+    def query_hits(self, token, since=None, until=None, ip=None,
+                   after=None, limit=100, reverse=False, headers=True):
+        """
+        Página de hits de un token ordenada por id (usa el índice token, id).
+        `after` es el id del último hit de la página anterior.
+        Retorna (hits, cursor_siguiente o None).
+        """
+        clauses, params = _hit_filters(since, until, ip)
+        clauses.insert(0, "token = ?")
+        params.insert(0, token)
+        if after is not None:
+            clauses.append("hits.id < ?" if reverse else "hits.id > ?")
+            params.append(after)
+
+        if headers:
+            columns, source = HIT_COLUMNS, HITS_WITH_HEADERS
+        else:
+            columns, source = HIT_COLUMNS_WITHOUT_HEADERS, "hits"
+        rows = self._query(
+            f"SELECT {columns} FROM {source} WHERE {' AND '.join(clauses)} "
+            f"ORDER BY hits.id {'DESC' if reverse else 'ASC'} LIMIT ?",
+            params + [limit + 1]
+        )
+        page = [self._hit_dict(row, with_id=True) for row in rows[:limit]]
+        next_cursor = page[-1]['id'] if len(rows) > limit else None
+        return page, next_cursor
+
+    def query_tokens(self, type=None, created_from=None, created_to=None, has_hits=None,
+                     hit_since=None, hit_until=None, ip=None, sort='created', after=None, limit=100):
+        """
+        Página de tokens filtrados. `sort` es 'created' (más viejos primero) o
+        'last_hit' (último hit más reciente primero). Los filtros de hits
+        (hit_since, hit_until, ip) dejan los tokens con al menos un hit que coincida.
+        Retorna (tokens, cursor_siguiente o None).
+        """
+        key_expr, order_by, descending = TOKEN_SORTS[sort]
+        clauses, params = [], []
+        if type is not None:
+            clauses.append("type = ?")
+            params.append(type)
+        if created_from is not None:
+            clauses.append("created_at >= ?")
+            params.append(created_from)
+        if created_to is not None:
+            clauses.append("created_at <= ?")
+            params.append(created_to)
+        if has_hits is not None:
+            clauses.append("hits > 0" if has_hits else "hits = 0")
+        if after is not None:
+            clauses.append(f"{key_expr} {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+
+        hit_clauses, hit_params = _hit_filters(hit_since, hit_until, ip, prefix="h.")
+        if hit_clauses:
+            clauses.append(
+                "EXISTS (SELECT 1 FROM hits h WHERE h.token = tokens.token AND "
+                + " AND ".join(hit_clauses) + ")"
+            )
+            params.extend(hit_params)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._query(f"SELECT * FROM tokens {where} ORDER BY {order_by} LIMIT ?", params + [limit + 1])
+        page = [dict(row) for row in rows[:limit]]
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = page[-1]
+            next_cursor = [last['created_at'], last['token']] if sort == 'created' else [last['last_hit'] or '', last['token']]
+        return page, next_cursor
+
+    # ------------------------------------------------------------------
+    # Estadísticas
+    # ------------------------------------------------------------------
+    def _buckets(self, period, since, token=None):
+        if token is None:
+            rows = self._query(
+                "SELECT bucket, hits FROM global_buckets WHERE period = ? AND bucket >= ? "
+                "ORDER BY bucket", (period, since)
+            )
+        else:
+            rows = self._query(
+                "SELECT bucket, hits FROM hit_buckets WHERE token = ? AND period = ? AND bucket >= ? "
+                "ORDER BY bucket", (token, period, since)
+            )
+        return {row[0]: row[1] for row in rows}
+
+    def token_stats(self, token, hourly_since, daily_since, top=5):
+        """
+        Agregados de un token (mismo formato que el backend JSON). Los buckets
+        se filtran desde `hourly_since` ('YYYY-MM-DDTHH') y `daily_since` ('YYYY-MM-DD').
+        Retorna None si el token no existe.
+        """
+        rows = self._query("SELECT last_hit FROM tokens WHERE token = ?", (token,))
+        if not rows:
+            return None
+        first = self._query("SELECT timestamp FROM hits WHERE token = ? ORDER BY id LIMIT 1", (token,))
+        return {
+            'unique_ips': self._query("SELECT COUNT(*) FROM token_ips WHERE token = ?", (token,))[0][0],
+            'first_seen': first[0][0] if first else None,
+            'last_seen': rows[0]['last_hit'],
+            'hourly': self._buckets('hour', hourly_since, token),
+            'daily': self._buckets('day', daily_since, token),
+            'top_user_agents': [
+                {'user_agent': row[0], 'hits': row[1]}
+                for row in self._query(
+                    "SELECT user_agent, hits FROM token_user_agents WHERE token = ? "
+                    "ORDER BY hits DESC LIMIT ?", (token, top)
+                )
+            ],
+        }
+
+    def global_stats(self, hourly_since, daily_since, top=5):
+        """
+        Agregados de todos los hits de la base, con el mismo formato que
+        token_stats. Sólo lee filas mantenidas con cada hit o índices, sin
+        recorrer hits ni agrupar los agregados por token.
+        """
+        first = self._query("SELECT timestamp FROM hits ORDER BY id LIMIT 1")
+        # Usa el índice idx_tokens_last_hit (el mismo del orden del dashboard)
+        last = self._query(
+            f"SELECT last_hit FROM tokens ORDER BY {TOKEN_SORTS['last_hit'][1]} LIMIT 1"
+        )
+        unique_ips = self._query("SELECT hits FROM hit_totals WHERE name = 'unique_ips'")
+        return {
+            'unique_ips': unique_ips[0][0] if unique_ips else 0,
+            'first_seen': first[0][0] if first else None,
+            'last_seen': (last[0][0] or None) if last else None,
+            'hourly': self._buckets('hour', hourly_since),
+            'daily': self._buckets('day', daily_since),
+            'top_user_agents': [
+                {'user_agent': row[0], 'hits': row[1]}
+                for row in self._query(
+                    "SELECT user_agent, hits FROM global_user_agents ORDER BY hits DESC LIMIT ?", (top,)
+                )
+            ],
+        }
+
+    def iter_hits(self):
+        for row in self._query(f"SELECT {HIT_COLUMNS} FROM {HITS_WITH_HEADERS} ORDER BY hits.id"):
+            yield self._hit_dict(row)
@@ -0,0 +1,85 @@
+import io
+import os
+
+import pytest
+
+from generators import binary_gen
+from generators.binary_gen import PLACEHOLDER, placeholder_offsets, write_patched_binary
+
+URL = b'http://localhost:5000/t/abc'
+PADDED_URL = URL + b'\x00' * (len(PLACEHOLDER) - len(URL))
+
+
+@pytest.fixture
+def template(tmp_path):
+    path = tmp_path / 'template'
+    path.write_bytes(b'\x7fELF' + os.urandom(70000) + PLACEHOLDER + b'\x90' * 16 + PLACEHOLDER + os.urandom(5000))
+    return path
+
+
+def _expected(template):
+    return template.read_bytes().replace(PLACEHOLDER, PADDED_URL)
+
+
+def test_offsets_of_every_placeholder(template):
+    data = template.read_bytes()
+    first = data.find(PLACEHOLDER)
+
+    assert placeholder_offsets(str(template)) == (first, first + len(PLACEHOLDER) + 16)
+
+
+def test_offsets_are_recomputed_when_template_changes(template):
+    placeholder_offsets(str(template))
+    template.write_bytes(b'xx' + PLACEHOLDER)
+
+    assert placeholder_offsets(str(template)) == (2,)
+
+
+def test_missing_placeholder_raises(tmp_path):
+    path = tmp_path / 'empty'
+    path.write_bytes(b'sin placeholder')
+
+    with pytest.raises(Exception, match='placeholder'):
+        placeholder_offsets(str(path))
+
+
+def test_writes_patched_file(template, tmp_path):
+    output = tmp_path / 'out.bin'
+    # Un archivo anterior más largo se reemplaza completo
+    output.write_bytes(b'\xff' * 200000)
+
+    write_patched_binary(str(template), str(output), PADDED_URL)
+
+    assert output.read_bytes() == _expected(template)
+
+
+def test_writes_patched_stream(template):
+    output = io.BytesIO()
+
+    write_patched_binary(str(template), output, PADDED_URL)
+
+    assert output.getvalue() == _expected(template)
+
+
+def test_fallback_without_reflink_copy_file_range_or_pwrite(template, tmp_path, monkeypatch):
+    monkeypatch.setattr(binary_gen, 'fcntl', None)
+    monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    monkeypatch.delattr(os, 'pwrite', raising=False)
+    output = tmp_path / 'out.bin'
+
+    write_patched_binary(str(template), str(output), PADDED_URL)
+
+    assert output.read_bytes() == _expected(template)
+
+
+def test_copy_file_range_error_falls_back_to_copy(template, tmp_path, monkeypatch):
+    def unsupported(*args):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(binary_gen, 'fcntl', None)
+    monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+    output = tmp_path / 'out.bin'
+
+    write_patched_binary(str(template), str(output), PADDED_URL)
+
+    assert output.read_bytes() == _expected(template)
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from storage.ingest import HitQueue
+from storage.json_store import JsonStore
+
+
+def _hit(token='a', ip='10.0.0.1', user_agent='curl/8.0'):
+    return {'token': token, 'timestamp': '2025-06-01T13:45:10-03:00', 'ip': ip, 'user_agent': user_agent}
+
+
+class MemoryStore:
+    """Almacenamiento mínimo: guarda los lotes en una lista."""
+
+    def __init__(self):
+        self.hits = []
+        self.repeats = []
+
+    def add_hits(self, hits):
+        for hit in hits:
+            hit['id'] = len(self.hits)
+            self.hits.append(hit)
+        return hits
+
+    def add_repeats(self, repeats):
+        self.repeats.extend(repeats)
+        return len(repeats)
+
+    def sync(self):
+        pass
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+def test_drop_overflow_counts_dropped():
+    store = MemoryStore()
+    queue = HitQueue(store, maxsize=2, overflow='drop')
+
+    assert [queue.put(_hit()) for _ in range(5)] == [True, True, False, False, False]
+    assert queue.stats()['dropped'] == 3
+    assert queue.stats()['pending'] == 2
+
+    queue.start()
+    queue.stop()
+    assert len(store.hits) == 2
+    assert queue.stats()['written'] == 2
+
+
+def test_sync_overflow_writes_from_the_caller():
+    store = MemoryStore()
+    queue = HitQueue(store, maxsize=1, overflow='sync')
+
+    assert all(queue.put(_hit()) for _ in range(3))
+    # Los que no entraron en la cola ya están guardados
+    assert len(store.hits) == 2
+
+    queue.start()
+    queue.stop()
+    assert len(store.hits) == 3
+    assert queue.stats()['dropped'] == 0
+
+
+def test_unknown_overflow_policy_is_rejected():
+    with pytest.raises(ValueError):
+        HitQueue(MemoryStore(), overflow='ignore')
+
+
+def test_dedup_window_collapses_repeats(tmp_path):
+    store = JsonStore(tmp_path / 'db.json')
+    store.load()
+    store.add_token({'token': 'a', 'type': 'pdf', 'description': None,
+                     'created_at': '2025-06-01T10:00:00-03:00', 'hits': 0, 'last_hit': None})
+    alerts = []
+    queue = HitQueue(store, dedup_window=60, on_written=alerts.append)
+    queue.start()
+
+    for _ in range(5):
+        queue.put(_hit())
+    queue.put(_hit(ip='10.0.0.2'))
+    # Token inexistente: no se guarda ni queda una ventana abierta
+    queue.put(_hit(token='x'))
+    queue.stop()
+
+    assert sorted((hit['ip'], hit['count']) for hit in store.hits_for_token('a')) == [('10.0.0.1', 5), ('10.0.0.2', 1)]
+    assert store.totals()['hits'] == 6
+    # Sólo el primer hit de cada cliente genera una alerta
+    assert sorted(hit['ip'] for hit in alerts) == ['10.0.0.1', '10.0.0.2']
+    assert queue.stats()['collapsed'] == 4
+    assert queue.stats()['written'] == 2
+    store.close()
+
+
+def test_writer_survives_storage_errors():
+    class FlakyStore(MemoryStore):
+        def add_hits(self, hits):
+            if any(hit['token'] == 'boom' for hit in hits):
+                raise OSError("disco lleno")
+            return super().add_hits(hits)
+
+    def failing_alert(hit):
+        raise RuntimeError("webhook caído")
+
+    store, errors = FlakyStore(), []
+    queue = HitQueue(store, on_written=failing_alert, on_error=lambda action, error: errors.append(error))
+    queue.start()
+
+    queue.put(_hit(token='boom'))
+    _wait_for(lambda: queue.stats()['failed'] == 1)
+    queue.put(_hit())
+    queue.stop()
+
+    assert len(store.hits) == 1
+    assert queue.stats()['written'] == 1
+    assert queue.stats()['failed'] == 1
+    assert [type(error) for error in errors] == [OSError, RuntimeError]
+
+
+def test_stop_returns_after_timeout_with_full_queue():
+    writing, release = threading.Event(), threading.Event()
+
+    class SlowStore(MemoryStore):
+        def add_hits(self, hits):
+            writing.set()
+            release.wait()
+            return super().add_hits(hits)
+
+    store = SlowStore()
+    queue = HitQueue(store, maxsize=1)
+    queue.start()
+    queue.put(_hit())
+    assert writing.wait(5)
+    # El escritor está trabado en el primer lote y la cola quedó llena
+    assert queue.put(_hit())
+    assert not queue.put(_hit())
+
+    started = time.monotonic()
+    queue.stop(timeout=0.2)
+    assert time.monotonic() - started < 2
+
+    # Cuando el almacenamiento responde, lo que estaba encolado se guarda igual
+    release.set()
+    _wait_for(lambda: len(store.hits) == 2)
@@ -0,0 +1,164 @@
+import threading
+
+import pytest
+
+from storage.json_store import JsonStore, read_json_database
+
+
+def _token(token, created_at='2025-06-01T10:00:00-03:00'):
+    return {'token': token, 'type': 'pdf', 'description': None, 'created_at': created_at, 'hits': 0, 'last_hit': None}
+
+
+def _hit(token, timestamp='2025-06-01T13:45:10-03:00', ip='10.0.0.1', user_agent='curl/8.0'):
+    return {'token': token, 'timestamp': timestamp, 'ip': ip, 'user_agent': user_agent, 'headers': {'Host': 'localhost'}}
+
+
+def _open(path, **options):
+    store = JsonStore(path, **options)
+    store.load()
+    return store
+
+
+def _state(store):
+    """Todo lo que tiene que sobrevivir a reabrir la base."""
+    return {
+        'tokens': sorted(store.list_tokens(), key=lambda record: record['token']),
+        'hits': list(store.iter_hits()),
+        'totals': store.totals(),
+        'stats': store.global_stats('0', '0', top=10),
+    }
+
+
+def test_journal_is_replayed_after_reopen(tmp_path):
+    path = tmp_path / 'db.json'
+    store = _open(path)
+    store.add_tokens([_token('a'), _token('b'), _token('c')])
+    store.add_hits([_hit('a'), _hit('a', ip='10.0.0.2'), _hit('b'), _hit('c')])
+    store.update_token('a', description='nuevo')
+    store.delete_token('c')
+    before = _state(store)
+    store.close()
+
+    assert not path.exists()
+    store = _open(path)
+    assert _state(store) == before
+    assert store.get_token('a')['description'] == 'nuevo'
+    assert store.totals() == {'tokens': 2, 'hits': 3}
+    assert not store.has_token('c')
+    store.close()
+
+
+def test_compact_writes_snapshot_and_discards_journal(tmp_path):
+    path = tmp_path / 'db.json'
+    store = _open(path)
+    store.add_token(_token('a'))
+    store.add_hits([_hit('a') for _ in range(10)])
+    store.compact()
+    store.add_hit(_hit('a', ip='10.0.0.9'))
+    before = _state(store)
+    store.close()
+
+    assert path.exists()
+    assert not store.journal.rotated_path.exists()
+    # Sólo queda en el journal lo posterior al snapshot
+    assert len(store.journal.path.read_text().splitlines()) == 1
+
+    store = _open(path)
+    assert _state(store) == before
+    store.close()
+
+
+def test_background_compaction_keeps_every_hit(tmp_path):
+    path = tmp_path / 'db.json'
+    # Umbral mínimo: casi cada escritura dispara una compactación en segundo plano
+    store = _open(path, compact_ratio=0, compact_min_bytes=1)
+    store.add_tokens([_token(f't{n}') for n in range(4)])
+
+    def writer(n):
+        for i in range(50):
+            store.add_hit(_hit(f't{n}', ip=f'10.0.{n}.{i}'))
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    before = _state(store)
+    store.close()
+
+    assert not store.journal.rotated_path.exists()
+    store = _open(path)
+    assert _state(store) == before
+    assert store.totals() == {'tokens': 4, 'hits': 200}
+    assert store.global_stats('0', '0')['unique_ips'] == 200
+    store.close()
+
+
+def test_repeats_survive_compaction(tmp_path):
+    path = tmp_path / 'db.json'
+    store = _open(path)
+    store.add_token(_token('a'))
+    hit = _hit('a')
+    store.add_hit(hit)
+    assert store.add_repeats([(hit, 4, '2025-06-01T14:00:00-03:00')]) == 1
+    store.compact()
+    store.close()
+
+    store = _open(path)
+    assert [stored['count'] for stored in store.hits_for_token('a')] == [5]
+    assert store.get_token('a')['hits'] == 5
+    assert store.get_token('a')['last_hit'] == '2025-06-01T14:00:00-03:00'
+    assert store.totals()['hits'] == 5
+    assert sum(store.token_stats('a', '0', '0')['daily'].values()) == 5
+    store.close()
+
+
+def test_truncated_last_line_is_discarded(tmp_path):
+    path = tmp_path / 'db.json'
+    store = _open(path)
+    store.add_token(_token('a'))
+    store.add_hits([_hit('a'), _hit('a')])
+    store.close()
+
+    # El proceso murió a mitad de escribir una entrada
+    with open(store.journal.path, 'a') as f:
+        f.write('{"seq":4,"op":"hit","hit":{"token":"a"')
+
+    store = _open(path)
+    assert store.totals() == {'tokens': 1, 'hits': 2}
+    store.close()
+
+
+def test_second_process_is_rejected(tmp_path):
+    pytest.importorskip('fcntl')
+    path = tmp_path / 'db.json'
+    store = _open(path)
+
+    # flock es por descriptor abierto: otra instancia se comporta como otro proceso
+    with pytest.raises(RuntimeError, match='otro proceso'):
+        _open(path)
+    with pytest.raises(RuntimeError, match='otro proceso'):
+        _open(path, lock_timeout=0.2)
+
+    # Si el primero suelta la base mientras el segundo espera, el segundo arranca
+    threading.Timer(0.2, store.close).start()
+    second = _open(path, lock_timeout=5)
+    second.close()
+
+
+def test_read_json_database_leaves_no_files(tmp_path):
+    path = tmp_path / 'db.json'
+    store = _open(path)
+    store.add_token(_token('a'))
+    store.add_hit(_hit('a'))
+    store.compact()
+    store.add_hit(_hit('a', ip='10.0.0.2'))
+    store.close()
+    (tmp_path / 'db.lock').unlink()
+    files = sorted(tmp_path.iterdir())
+
+    tokens, hits = read_json_database(path)
+
+    assert sorted(tmp_path.iterdir()) == files
+    assert [record['token'] for record in tokens] == ['a']
+    assert [hit['ip'] for hit in hits] == ['10.0.0.1', '10.0.0.2']
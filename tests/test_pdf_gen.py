@@ -0,0 +1,37 @@
+import re
+import zlib
+
+from generators.pdf_gen import build_pdf
+
+
+def _info_string(pdf, key):
+    """Decodifica un string del diccionario Info (literal o hex UTF-16BE)."""
+    info = re.search(rb'/Title .*?>>', pdf, re.S).group(0)
+    match = re.search(rb'/' + key + rb' (?:\((.*?)\)|<([0-9A-F]+)>)', info)
+    literal, hexa = match.groups()
+    if literal is not None:
+        return literal.decode('ascii')
+    data = bytes.fromhex(hexa.decode())
+    assert data.startswith(b'\xfe\xff')
+    return data[2:].decode('utf-16-be')
+
+
+def test_info_keeps_non_latin1_text():
+    pdf = build_pdf('http://localhost/t', title='T ő 中', author='Ана 😀', content='x')
+
+    assert _info_string(pdf, b'Title') == 'T ő 中'
+    assert _info_string(pdf, b'Author') == 'Ана 😀'
+
+
+def test_page_text_falls_back_to_winansi():
+    pdf = build_pdf('http://localhost/t', title='T ő 中 €')
+
+    streams = re.findall(rb'stream\n(.*?)\nendstream', pdf, re.S)
+    text = b''.join(zlib.decompress(stream) for stream in streams)
+    assert b'(T o ? \x80) Tj' in text
+
+
+def test_openaction_uri_is_ascii():
+    pdf = build_pdf('http://localhost/t?n=ñ')
+
+    assert b'/URI (http://localhost/t?n=%C3%B1)' in pdf
@@ -0,0 +1,122 @@
+import json
+import threading
+
+import pytest
+
+from generators.pool import PoolExhausted, TokenPool
+
+SERVER = 'http://localhost:5000'
+
+
+class FakeRegistrar:
+    """Registrar sin red: reserva tokens numerados y asigna los que no estén en `failing`."""
+
+    def __init__(self):
+        self.reserved = 0
+        self.failing = set()
+        self.claimed = []
+
+    def reserve(self, count):
+        tokens = [{'token': f't{n}', 'tracking_url': f'{SERVER}/t/t{n}'}
+                  for n in range(self.reserved, self.reserved + count)]
+        self.reserved += count
+        return tokens
+
+    def claim(self, items):
+        self.claimed.extend(item['token'] for item in items)
+        claimed = [item['token'] for item in items if item['token'] not in self.failing]
+        errors = {item['token']: 'rechazado' for item in items if item['token'] in self.failing}
+        return claimed, errors
+
+
+@pytest.fixture
+def registrar(monkeypatch):
+    registrar = FakeRegistrar()
+    monkeypatch.setattr('generators.pool.get_registrar', lambda server_url: registrar)
+    return registrar
+
+
+@pytest.fixture
+def pool(tmp_path, registrar):
+    return TokenPool(tmp_path / 'pool.json')
+
+
+def _items(count, type='pdf'):
+    return [{'type': type, 'description': f'doc {n}', 'output': f'doc{n}.pdf'} for n in range(count)]
+
+
+def test_take_and_release(pool):
+    pool.fill(SERVER, 3)
+
+    taken = pool.take(_items(2))
+    assert [token['token'] for token in taken] == ['t0', 't1']
+    assert taken[0]['type'] == 'pdf'
+    assert taken[0]['description'] == 'doc 0'
+    assert taken[0]['tracking_url'] == f'{SERVER}/t/t0'
+    assert pool.status() == {'server': SERVER, 'available': 1, 'used': 2, 'pending_sync': 2}
+
+    # El documento de t1 no se pudo generar: el token vuelve al pool
+    assert pool.release([None, taken[1]]) == 1
+    assert pool.status()['available'] == 2
+    assert [token['token'] for token in pool.take(_items(2))] == ['t1', 't2']
+
+
+def test_take_more_than_available_takes_nothing(pool):
+    pool.fill(SERVER, 1)
+
+    with pytest.raises(PoolExhausted):
+        pool.take(_items(2))
+    assert pool.status() == {'server': SERVER, 'available': 1, 'used': 0, 'pending_sync': 0}
+
+
+def test_fill_rejects_another_server(pool):
+    pool.fill(SERVER, 1)
+
+    with pytest.raises(ValueError):
+        pool.fill('http://otro:5000', 1)
+
+
+def test_sync_drops_synced_entries(pool, registrar):
+    pool.fill(SERVER, 3)
+    taken = pool.take(_items(3))
+    registrar.failing = {'t2'}
+
+    assert pool.sync() == (2, {'t2': 'rechazado'})
+    assert pool.status() == {'server': SERVER, 'available': 0, 'used': 3, 'pending_sync': 1}
+    data = json.loads(pool.path.read_text())
+    assert [entry['token'] for entry in data['used']] == ['t2']
+    assert data['synced'] == 2
+
+    # Ya asignados en el servidor: no se pueden devolver al pool
+    assert pool.release(taken[:2]) == 0
+
+    registrar.failing = set()
+    assert pool.sync() == (1, {})
+    assert registrar.claimed == ['t0', 't1', 't2', 't2']
+    assert json.loads(pool.path.read_text())['used'] == []
+    assert pool.status()['used'] == 3
+
+    # Sin pendientes no se llama al servidor
+    assert pool.sync() == (0, {})
+    assert len(registrar.claimed) == 4
+
+
+def test_concurrent_takes_do_not_share_tokens(pool):
+    pytest.importorskip('fcntl')
+    pool.fill(SERVER, 40)
+    results = []
+
+    def worker():
+        # Cada ejecución abre el pool por su cuenta, como procesos distintos de la CLI
+        results.extend(TokenPool(pool.path).take(_items(5)))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    tokens = [token['token'] for token in results]
+    assert len(tokens) == 40
+    assert len(set(tokens)) == 40
+    assert pool.status()['available'] == 0
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+import tokensnare_server as server
+from tokensnare_server import RateLimiter, client_address
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server, 'time', SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def test_burst_then_refill(clock):
+    limiter = RateLimiter(rate=2, burst=3, max_clients=10)
+
+    assert [limiter.allow('10.0.0.1') for _ in range(4)] == [True, True, True, False]
+    # Otro cliente tiene su propio bucket
+    assert limiter.allow('10.0.0.2')
+
+    clock.now += 0.5  # una ficha (2 por segundo)
+    assert limiter.allow('10.0.0.1')
+    assert not limiter.allow('10.0.0.1')
+
+    # La recarga no supera la ráfaga
+    clock.now += 60
+    assert [limiter.allow('10.0.0.1') for _ in range(4)] == [True, True, True, False]
+
+
+def test_forgets_least_recently_seen_client(clock):
+    limiter = RateLimiter(rate=0.001, burst=1, max_clients=2)
+
+    assert limiter.allow('a')
+    assert limiter.allow('b')
+    assert not limiter.allow('a')  # 'a' pasa a ser el más reciente
+    assert limiter.allow('c')      # se olvida 'b'
+
+    assert limiter.stats() == {'clients': 2, 'max_clients': 2}
+    assert not limiter.allow('a')
+    assert limiter.allow('b')      # vuelve como cliente nuevo, con la ráfaga completa
+
+
+def test_zero_rate_allows_everything():
+    limiter = RateLimiter(rate=0, burst=1, max_clients=1)
+
+    assert all(limiter.allow('10.0.0.1') for _ in range(100))
+    assert limiter.stats()['clients'] == 0
+
+
+def test_client_address_ignores_forwarded_for_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(server, 'TRUSTED_PROXY_HOPS', 0)
+
+    assert client_address({'X-Forwarded-For': '1.2.3.4'}, '10.0.0.1') == '10.0.0.1'
+
+
+def test_client_address_uses_address_added_by_outermost_proxy(monkeypatch):
+    headers = {'X-Forwarded-For': '6.6.6.6, 1.2.3.4, 172.16.0.2'}
+
+    monkeypatch.setattr(server, 'TRUSTED_PROXY_HOPS', 1)
+    assert client_address(headers, '10.0.0.1') == '172.16.0.2'
+
+    monkeypatch.setattr(server, 'TRUSTED_PROXY_HOPS', 2)
+    assert client_address(headers, '10.0.0.1') == '1.2.3.4'
+
+    # Menos direcciones que proxies: el header no es confiable
+    monkeypatch.setattr(server, 'TRUSTED_PROXY_HOPS', 4)
+    assert client_address(headers, '10.0.0.1') == '10.0.0.1'
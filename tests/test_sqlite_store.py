@@ -0,0 +1,210 @@
+import sqlite3
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from storage.json_store import JsonStore
+from storage.sqlite_store import SqliteStore
+
+
+def _token(token, created_at='2025-06-01T10:00:00-03:00'):
+    return {'token': token, 'type': 'pdf', 'description': None, 'created_at': created_at, 'hits': 0, 'last_hit': None}
+
+
+def _hit(token, timestamp='2025-06-01T13:45:10-03:00', ip='10.0.0.1', user_agent='curl/8.0'):
+    return {'token': token, 'timestamp': timestamp, 'ip': ip, 'user_agent': user_agent, 'headers': {'Host': 'localhost'}}
+
+
+def _open(path, **options):
+    store = SqliteStore(path, **options)
+    store.load()
+    return store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = _open(tmp_path / 'db.sqlite3')
+    yield store
+    store.close()
+
+
+def _fill(store):
+    store.add_tokens([_token('a'), _token('b', '2025-06-01T11:00:00-03:00'), _token('c', '2025-06-01T12:00:00-03:00')])
+    store.add_hits([
+        _hit('a'),
+        _hit('a', '2025-06-01T14:10:00-03:00', ip='10.0.0.2'),
+        _hit('b', '2025-06-02T09:00:00-03:00', user_agent='Mozilla/5.0'),
+        _hit('c', '2025-06-02T10:00:00-03:00', ip='10.0.0.3', user_agent='Mozilla/5.0'),
+        _hit('c', '2025-06-02T10:30:00-03:00', ip='10.0.0.3', user_agent='python-requests'),
+    ])
+
+
+def _recomputed(store):
+    """Los agregados globales calculados recorriendo todos los hits."""
+    ips, hourly, daily, user_agents = Counter(), Counter(), Counter(), Counter()
+    for hit in store.iter_hits():
+        ips[hit['ip']] += hit['count']
+        hourly[hit['timestamp'][:13]] += hit['count']
+        daily[hit['timestamp'][:10]] += hit['count']
+        user_agents[hit['user_agent']] += hit['count']
+    # Las repeticiones agrupadas mueven el último hit del token, no el timestamp del hit
+    last_seen = max((record['last_hit'] for record in store.list_tokens() if record['last_hit']), default=None)
+    return {
+        'unique_ips': len(ips),
+        'last_seen': last_seen,
+        'hourly': dict(hourly),
+        'daily': dict(daily),
+        'top_user_agents': sorted(user_agents.items(), key=lambda item: -item[1]),
+    }
+
+
+def _global(store):
+    stats = store.global_stats('0', '0', top=10)
+    return {
+        'unique_ips': stats['unique_ips'],
+        'last_seen': stats['last_seen'],
+        'hourly': stats['hourly'],
+        'daily': stats['daily'],
+        'top_user_agents': [(row['user_agent'], row['hits']) for row in stats['top_user_agents']],
+    }
+
+
+def test_global_stats_follow_hits_repeats_and_deletes(store):
+    _fill(store)
+    hit = _hit('b', '2025-06-02T09:05:00-03:00', ip='10.0.0.9', user_agent='Mozilla/5.0')
+    store.add_hit(hit)
+    store.add_repeats([(hit, 3, '2025-06-02T09:06:00-03:00')])
+    assert _global(store) == _recomputed(store)
+    assert store.totals() == {'tokens': 3, 'hits': 9}
+
+    store.delete_token('c')
+    assert _global(store) == _recomputed(store)
+    assert store.totals() == {'tokens': 2, 'hits': 7}
+
+    store.delete_token('b')
+    assert _global(store) == _recomputed(store)
+    assert store.global_stats('0', '0')['unique_ips'] == 2
+
+    store.reset()
+    assert store.totals() == {'tokens': 0, 'hits': 0}
+    assert store.global_stats('0', '0')['unique_ips'] == 0
+    assert store.global_stats('0', '0')['last_seen'] is None
+
+
+def test_load_rebuilds_missing_global_stats(tmp_path):
+    path = tmp_path / 'db.sqlite3'
+    store = _open(path)
+    _fill(store)
+    expected = _global(store)
+    store.close()
+
+    # Base anterior a los agregados globales
+    conn = sqlite3.connect(path)
+    for table in ('global_ips', 'global_buckets', 'global_user_agents', 'hit_totals'):
+        conn.execute(f"DELETE FROM {table}")
+    conn.commit()
+    conn.close()
+
+    store = _open(path)
+    assert _global(store) == expected
+    assert store.totals() == {'tokens': 3, 'hits': 5}
+    store.close()
+
+
+def test_prune_buckets_drops_old_buckets(store):
+    store.add_token(_token('a'))
+    store.add_hits([
+        _hit('a', '2020-01-01T10:00:00-03:00'),
+        _hit('a', '2025-05-01T10:00:00-03:00'),
+        _hit('a', '2025-06-01T13:00:00-03:00'),
+    ])
+
+    store.prune_buckets(now=datetime.fromisoformat('2025-06-02T00:00:00-03:00'))
+
+    for stats in (store.global_stats('0', '0'), store.token_stats('a', '0', '0')):
+        assert stats['hourly'] == {'2025-06-01T13': 1}
+        assert stats['daily'] == {'2025-05-01': 1, '2025-06-01': 1}
+    # Los hits no se tocan
+    assert store.totals()['hits'] == 3
+
+
+def test_query_hits_pages_with_cursor(store):
+    store.add_token(_token('a'))
+    store.add_hits([_hit('a', f'2025-06-01T13:00:{n:02d}-03:00', ip=f'10.0.0.{n % 2}') for n in range(7)])
+
+    for reverse, expected in (
+        (False, [['00', '01', '02'], ['03', '04', '05'], ['06']]),
+        (True, [['06', '05', '04'], ['03', '02', '01'], ['00']]),
+    ):
+        pages, after = [], None
+        while True:
+            page, after = store.query_hits('a', after=after, limit=3, reverse=reverse, headers=False)
+            pages.append([hit['timestamp'][17:19] for hit in page])
+            if after is None:
+                break
+        assert pages == expected
+
+    page, after = store.query_hits('a', ip='10.0.0.1', limit=10)
+    assert [hit['timestamp'][17:19] for hit in page] == ['01', '03', '05']
+    assert after is None
+    assert page[0]['headers'] == {'Host': 'localhost'}
+    assert store.get_hit('a', page[0]['id'])['ip'] == '10.0.0.1'
+
+
+def test_query_tokens_pages_with_cursor(store):
+    _fill(store)
+    store.add_tokens([_token(f'z{n}', '2025-06-01T12:00:00-03:00') for n in range(3)])
+
+    for sort, expected in (
+        ('created', ['a', 'b', 'c', 'z0', 'z1', 'z2']),
+        ('last_hit', ['c', 'b', 'a', 'z2', 'z1', 'z0']),
+    ):
+        tokens, after = [], None
+        while True:
+            page, after = store.query_tokens(sort=sort, after=after, limit=2)
+            tokens.extend(record['token'] for record in page)
+            if after is None:
+                break
+        assert tokens == expected
+
+    page, _ = store.query_tokens(has_hits=True, ip='10.0.0.2')
+    assert [record['token'] for record in page] == ['a']
+
+
+def test_has_token_sees_tokens_from_other_processes(tmp_path):
+    path = tmp_path / 'db.sqlite3'
+    first = _open(path, token_refresh_interval=0)
+    second = _open(path)
+
+    assert not first.has_token('a')
+    second.add_token(_token('a'))
+    assert first.has_token('a')
+
+    second.delete_token('a')
+    assert not second.has_token('a')
+    first.close()
+    second.close()
+
+
+def test_import_json_matches_json_store(tmp_path):
+    json_path = tmp_path / 'db.json'
+    source = JsonStore(json_path)
+    source.load()
+    _fill(source)
+    hit = _hit('a', '2025-06-01T15:00:00-03:00', ip='10.0.0.7')
+    source.add_hit(hit)
+    source.add_repeats([(hit, 2, '2025-06-01T15:01:00-03:00')])
+    expected = source.global_stats('0', '0', top=10)
+    source.close()
+
+    store = _open(tmp_path / 'db.sqlite3')
+    assert store.import_json(json_path) == (3, 6)
+    assert store.totals() == {'tokens': 3, 'hits': 8}
+    assert store.get_token('a')['hits'] == 5
+    assert store.has_token('c')
+
+    stats = store.global_stats('0', '0', top=10)
+    for key in ('unique_ips', 'hourly', 'daily', 'top_user_agents'):
+        assert stats[key] == expected[key]
+    store.close()
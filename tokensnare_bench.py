@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+TokenSnare Bench
+Benchmarks de los generadores y de los endpoints de tracking contra un
+servidor local levantado para la corrida (base temporal, sin tocar la real).
+
+    python tokensnare_bench.py                          # todo, salida en consola
+    python tokensnare_bench.py --only tracking --concurrency 32 --requests 5000
+    python tokensnare_bench.py --storage sqlite --json bench.json
+
+Con --json se guardan los resultados (más la versión de Python, el commit y
+la configuración) para comparar entre releases.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent
+
+# Headers de clientes reales que abren honeytokens (navegador, Office, Acrobat, Outlook, bots)
+HEADER_SETS = [
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36',
+        'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+        'Accept-Language': 'es-AR,es;q=0.9,en;q=0.8',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Referer': 'https://mail.ejemplo.com/',
+        'Sec-Fetch-Dest': 'image',
+        'Sec-Fetch-Mode': 'no-cors',
+        'Sec-Fetch-Site': 'cross-site',
+    },
+    {
+        'User-Agent': 'Microsoft Office/16.0 (Windows NT 10.0; Microsoft Word 16.0.17928; Pro)',
+        'Accept': '*/*',
+        'Accept-Encoding': 'gzip, deflate',
+        'X-Office-Major-Version': '16',
+        'X-MS-CookieUri-Requested': 't',
+        'X-FeatureVersion': '1',
+        'X-IDCRL_ACCEPTED': 't',
+    },
+    {
+        'User-Agent': 'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 10.0; Win64; x64; Trident/7.0; Acrobat Reader DC)',
+        'Accept': '*/*',
+        'Accept-Language': 'es-AR',
+        'Accept-Encoding': 'gzip, deflate',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; WOW64; Trident/7.0; Microsoft Outlook 16.0.17928; ms-office; MSOffice 16)',
+        'Accept': 'image/png, image/svg+xml, image/*;q=0.8, */*;q=0.5',
+        'Accept-Language': 'es-AR',
+        'Accept-Encoding': 'gzip, deflate',
+        'UA-CPU': 'AMD64',
+    },
+    {
+        'User-Agent': 'curl/8.5.0',
+        'Accept': '*/*',
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (compatible; Googlebot-Image/1.0; +http://www.google.com/bot.html)',
+        'Accept': '*/*',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'From': 'googlebot(at)googlebot.com',
+    },
+]
+
+# Las IPs se varían con X-Forwarded-For (como detrás de un proxy)
+CLIENT_IPS = [f"10.{i // 250}.{i % 250}.{(i * 7) % 250 + 1}" for i in range(500)]
+
+
+# ============================================================================
+# SERVIDOR LOCAL
+# ============================================================================
+
+def _serve(port, tracking_port, storage, db_path, api_key, ready):
+    """Proceso del servidor: la app real con una base temporal."""
+    os.environ['API_KEY'] = api_key
+    # Se mide el camino completo de ingesta: sin límite por IP ni deduplicación,
+    # salvo que se pidan explícitamente por variables de entorno
+    os.environ.setdefault('HIT_RATE_LIMIT', '0')
+    os.environ.setdefault('HIT_DEDUP_WINDOW', '0')
+    sys.path.insert(0, str(ROOT))
+    import tokensnare_server
+    from werkzeug.serving import make_server
+
+    # Sin las alertas por consola de cada hit
+    tokensnare_server.log_print = lambda message: None
+
+    tokensnare_server.load_database(storage, db_path)
+    if tracking_port:
+        tokensnare_server.start_tracking_listener('127.0.0.1', tracking_port)
+    server = make_server('127.0.0.1', port, tokensnare_server.app, threaded=True)
+    ready.set()
+    try:
+        server.serve_forever()
+    finally:
+        tokensnare_server.close_database()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalServer:
+    """Levanta el servidor en otro proceso (así el cliente no le compite el GIL)."""
+
+    def __init__(self, storage, tracker=False):
+        self.api_key = secrets.token_hex(16)
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='tokensnare_bench_')
+        suffix = 'sqlite3' if storage == 'sqlite' else 'json'
+        self.db_path = os.path.join(self.tmpdir.name, f'bench_db.{suffix}')
+        self.storage = storage
+        self.port = _free_port()
+        self.tracking_port = _free_port() if tracker else None
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.tracking_url = f"http://127.0.0.1:{self.tracking_port}" if tracker else self.url
+        self.process = None
+
+    def start(self):
+        ctx = multiprocessing.get_context('spawn')
+        ready = ctx.Event()
+        self.process = ctx.Process(
+            target=_serve,
+            args=(self.port, self.tracking_port, self.storage, self.db_path, self.api_key, ready),
+            daemon=True
+        )
+        self.process.start()
+        if not ready.wait(30):
+            raise RuntimeError("El servidor de benchmark no inició")
+        # El listener de tracking arranca en un thread: se espera a que acepte conexiones
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', self.tracking_port or self.port), 0.2).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        os.environ['API_KEY'] = self.api_key
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(10)
+            self.process = None
+        self.tmpdir.cleanup()
+
+    def rss_mb(self):
+        """Memoria residente del proceso del servidor (Linux)."""
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def api(self, method, path, **kwargs):
+        response = requests.request(method, f"{self.url}{path}",
+                                    headers={'Authorization': f'Bearer {self.api_key}'}, timeout=30, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def wait_ingested(self, timeout=60):
+        """Espera a que la cola de hits quede vacía. Retorna las estadísticas de ingesta."""
+        deadline = time.monotonic() + timeout
+        while True:
+            stats = self.api('GET', '/api/stats')
+            ingest = stats.get('ingest', {})
+            if ingest.get('pending', 0) == 0 or time.monotonic() > deadline:
+                ingest['total_hits'] = stats['total_hits']
+                return ingest
+            time.sleep(0.1)
+
+
+# ============================================================================
+# MEDICIONES
+# ============================================================================
+
+def summarize(latencies, elapsed, errors=0):
+    """p50/p99/media/máximo en ms y throughput (operaciones por segundo)."""
+    if not latencies:
+        return {'count': 0, 'errors': errors}
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'count': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(50), 3),
+        'p99_ms': round(percentile(99), 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'throughput': round(len(ordered) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def bench_generators(server, iterations, types=None):
+    """
+    Tiempo de cada generador: con el registro del token incluido (contra el
+    servidor local) y sólo la generación del archivo (token ya registrado).
+    """
+    sys.path.insert(0, str(ROOT))
+    import generators
+    from generators.common import register_token
+
+    results = {}
+    outdir = Path(server.tmpdir.name) / 'out'
+    outdir.mkdir(exist_ok=True)
+    options = {'title': 'Informe confidencial', 'author': 'Bench',
+               'content': 'Contenido de prueba del benchmark. ' * 20, 'platform': 'linux'}
+
+    # Las plantillas de binarios se buscan relativas a la raíz del repo
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        for token_type in types or generators.supported_types():
+            results[token_type] = _bench_generator(server, generators, register_token, token_type,
+                                                   str(outdir / f"bench.{token_type}"), options, iterations)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def _bench_generator(server, generators, register_token, token_type, output, options, iterations):
+    # Primera llamada fuera de la medición: importa el generador y arma sus cachés
+    import_started = time.perf_counter()
+    try:
+        token_data = register_token(server.url, token_type, 'bench')
+        generators.generate(token_type, server.url, output, 'bench', token_data=token_data, **options)
+    except Exception as e:
+        return {'skipped': f"{type(e).__name__}: {e}"}
+    first_call = time.perf_counter() - import_started
+
+    result = {}
+    for mode in ('generate', 'register+generate'):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t = time.perf_counter()
+            if mode == 'register+generate':
+                token_data = register_token(server.url, token_type, 'bench')
+            generators.generate(token_type, server.url, output, 'bench', token_data=token_data, **options)
+            latencies.append(time.perf_counter() - t)
+        result[mode] = summarize(latencies, time.perf_counter() - started)
+    result['first_call_ms'] = round(first_call * 1000, 3)
+    result['output_bytes'] = os.path.getsize(output)
+    return result
+
+
+def _tracking_requests(base_url, tokens, count):
+    """Los pedidos de un endpoint: (método, URL, headers), rotando tokens, clientes e IPs."""
+    headers_cycle = itertools.cycle(HEADER_SETS)
+    ips = itertools.cycle(CLIENT_IPS)
+    token_cycle = itertools.cycle(tokens)
+    endpoints = {
+        'image': lambda token: ('GET', f"{base_url}/image/{token}.png", {}),
+        'link': lambda token: ('GET', f"{base_url}/link/{token}", {}),
+        'callback': lambda token: ('POST', f"{base_url}/api/callback",
+                                   {'X-Cloned-Domain': 'h0neybank.com', 'X-Cloned-Url': 'https://h0neybank.com/login'}),
+    }
+    return {
+        name: [
+            (method, url, {**next(headers_cycle), **extra, 'X-Forwarded-For': next(ips)})
+            for method, url, extra in (build(next(token_cycle)) for _ in range(count))
+        ]
+        for name, build in endpoints.items()
+    }
+
+
+def _run_load(planned, concurrency):
+    """Manda los pedidos con `concurrency` threads (una Session keep-alive por thread)."""
+    local = threading.local()
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def send(request):
+        nonlocal errors
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, url, headers = request
+        t = time.perf_counter()
+        try:
+            response = session.request(method, url, headers=headers, timeout=30)
+            ok = response.status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - t
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, planned))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def bench_tracking(server, concurrency, count, rounds, token_count):
+    """
+    Carga sobre /image, /link y /api/callback. Se repite `rounds` veces sobre
+    la misma base para ver cómo cambian la latencia y la memoria del
+    servidor a medida que crece el historial de hits.
+    """
+    tokens = [t['token'] for t in server.api('POST', '/api/tokens/bulk', json={
+        'tokens': [{'type': 'pdf', 'description': f'bench {i}'} for i in range(token_count)]
+    })['tokens']]
+
+    results = []
+    for round_number in range(1, rounds + 1):
+        planned = _tracking_requests(server.tracking_url, tokens, count)
+        round_result = {'round': round_number, 'endpoints': {}}
+        for name, requests_list in planned.items():
+            round_result['endpoints'][name] = _run_load(requests_list, concurrency)
+        ingest = server.wait_ingested()
+        round_result['history_hits'] = ingest.pop('total_hits')
+        round_result['ingest'] = ingest
+        round_result['rss_mb'] = server.rss_mb()
+        results.append(round_result)
+        print_round(round_result)
+    return results
+
+
+# ============================================================================
+# REPORTE
+# ============================================================================
+
+def _row(name, s):
+    if 'skipped' in s:
+        return f"  {name:<26} omitido ({s['skipped']})"
+    if not s.get('count'):
+        return f"  {name:<26} sin resultados ({s.get('errors', 0)} errores)"
+    return (f"  {name:<26} p50 {s['p50_ms']:8.3f} ms   p99 {s['p99_ms']:8.3f} ms   "
+            f"{s['throughput']:9.1f}/s   errores {s['errors']}")
+
+
+def print_generators(results):
+    print("Generadores")
+    for token_type, result in results.items():
+        if 'skipped' in result:
+            print(_row(token_type, result))
+            continue
+        for mode in ('generate', 'register+generate'):
+            print(_row(f"{token_type} {mode}", result[mode]))
+
+
+def print_round(result):
+    rss = f"{result['rss_mb']:.1f} MB" if result['rss_mb'] is not None else "?"
+    print(f"Tracking ronda {result['round']} (historial: {result['history_hits']} hits, RSS servidor: {rss}, "
+          f"descartados: {result['ingest'].get('dropped', 0)})")
+    for name, summary in result['endpoints'].items():
+        print(_row(name, summary))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="TokenSnare Bench - Benchmarks de generadores y endpoints de tracking"
+    )
+    parser.add_argument('--only', choices=['generators', 'tracking'], default=None,
+                        help='Corre sólo una de las partes (default: ambas)')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json',
+                        help='Backend del servidor local (default: json)')
+    parser.add_argument('--tracker', action='store_true',
+                        help='Mide el tracking contra el listener asyncio (--tracking-port) en lugar de Flask')
+    parser.add_argument('--types', default=None,
+                        help='Tipos de generador separados por comas (default: todos)')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='Archivos por generador y modo (default: 50)')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='Clientes concurrentes en el tracking (default: 16)')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='Pedidos por endpoint y ronda (default: 2000)')
+    parser.add_argument('--rounds', type=int, default=3,
+                        help='Rondas de tracking sobre la misma base, para ver el efecto del historial (default: 3)')
+    parser.add_argument('--tokens', type=int, default=100,
+                        help='Tokens a los que se reparten los hits (default: 100)')
+    parser.add_argument('--json', metavar='PATH',
+                        help='Guarda los resultados en JSON ("-" para stdout)')
+    args = parser.parse_args()
+
+    # Con --json - el JSON va a stdout y el resumen legible a stderr
+    console = contextlib.redirect_stdout(sys.stderr) if args.json == '-' else contextlib.nullcontext()
+
+    server = LocalServer(args.storage, tracker=args.tracker).start()
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+    }
+    try:
+        with console:
+            report['server_rss_mb_start'] = server.rss_mb()
+            if args.only in (None, 'generators'):
+                types = args.types.split(',') if args.types else None
+                report['generators'] = bench_generators(server, args.iterations, types)
+                print_generators(report['generators'])
+            if args.only in (None, 'tracking'):
+                report['tracking'] = bench_tracking(server, args.concurrency, args.requests, args.rounds, args.tokens)
+    finally:
+        server.stop()
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados guardados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,33 +4,232 @@ TokenSnare CLI
 Herramienta centralizada para generación de Honeytokens.
 """
 import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
-from generators import generate_pdf_honeytoken, generate_binary_honeytoken, generate_epub_honeytoken, generate_xlsx_honeytoken, generate_docx_honeytoken, generate_qrcode_honeytoken
+import generators
+from generators.common import RegistrationError, get_registrar
+from generators.pool import DEFAULT_POOL_FILE, PoolExhausted, TokenPool
 
 OUTPUT_FOLDER_NAME = "honeyTokens"
-FILE_TYPE_SUPPORTED = ['pdf', 'epub', 'xlsx', 'docx', 'qrcode', 'binary']
+
+# Columnas del manifiesto de --batch (CSV con encabezado o JSONL, un objeto por línea)
+MANIFEST_FIELDS = ['type', 'output', 'title', 'author', 'content', 'description', 'platform']
 
 
 def get_output_path(filename):
-    folder = Path(OUTPUT_FOLDER_NAME)
-    folder.mkdir(exist_ok=True)
-    full_path = folder / filename
+    full_path = Path(OUTPUT_FOLDER_NAME) / filename
+    full_path.parent.mkdir(parents=True, exist_ok=True)
     return str(full_path)
 
 
+def generate_honeytoken(token_type, server_url, output_file, description=None,
+                        title=None, author=None, content=None, platform='linux', token_data=None):
+    """
+    Genera un honeytoken del tipo indicado (lo usan el modo normal y el modo batch).
+    Si se pasa `token_data` (un token ya registrado) no se registra uno nuevo.
+    """
+    generators.generate(
+        token_type, server_url, output_file,
+        description=description,
+        token_data=token_data,
+        title=title,
+        author=author,
+        content=content,
+        platform=platform or 'linux'
+    )
+
+
+# ============================================================================
+# MODO BATCH
+# ============================================================================
+def load_manifest(manifest_path):
+    """
+    Lee el manifiesto (.csv o .jsonl). Retorna una lista de (línea, item, error):
+    los items inválidos quedan con su error para reportarlos sin frenar el resto.
+    """
+    path = Path(manifest_path)
+    entries = []
+
+    if path.suffix.lower() == '.csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                item = {field: (row.get(field) or '').strip() or None for field in MANIFEST_FIELDS}
+                entries.append((reader.line_num, item, None))
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError("se esperaba un objeto JSON")
+                except ValueError as e:
+                    entries.append((line_num, {}, f"JSON inválido: {e}"))
+                    continue
+                item = {field: row.get(field) or None for field in MANIFEST_FIELDS}
+                entries.append((line_num, item, None))
+
+    # Validación por item: tipo soportado, salida indicada y sin salidas repetidas
+    supported_types = generators.supported_types()
+    seen_outputs = set()
+    validated = []
+    for line_num, item, error in entries:
+        if error is None:
+            if item['type'] not in supported_types:
+                error = f"tipo no soportado: {item['type']}"
+            elif not item['output']:
+                error = "falta el campo 'output'"
+            elif item['output'] in seen_outputs:
+                error = f"salida repetida: {item['output']}"
+            else:
+                seen_outputs.add(item['output'])
+        validated.append((line_num, item, error))
+    return validated
+
+
+def _generate_item(item, server_url, token_data=None):
+    """
+    Genera un item del manifiesto (corre en un proceso del pool).
+    Los errores se devuelven como texto: un item fallido no afecta al resto.
+    """
+    try:
+        # Con procesos 'spawn' (Windows, macOS) el worker arranca sin los plugins
+        generators.load_plugins()
+        output_file = get_output_path(item['output'])
+        generate_honeytoken(
+            item['type'], server_url, output_file,
+            description=item['description'],
+            title=item['title'],
+            author=item['author'],
+            content=item['content'],
+            platform=item['platform'],
+            token_data=token_data
+        )
+        return output_file, None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def run_batch(manifest_path, server_url, jobs, token_pool=None):
+    """
+    Genera todos los items del manifiesto con un pool de `jobs` procesos
+    (cada proceso importa las librerías de los generadores una sola vez).
+    Los tokens se registran antes, en bloque (/api/tokens/bulk); si el
+    servidor no lo soporta, cada item registra el suyo. Con `token_pool`
+    se toman del pool local de tokens reservados, sin conectarse al servidor.
+    Retorna la cantidad de items fallidos.
+    """
+    entries = load_manifest(manifest_path)
+    total = len(entries)
+    done = failed = 0
+    started = time.monotonic()
+
+    def report(line_num, item, output_file, error):
+        nonlocal done, failed
+        done += 1
+        if error:
+            failed += 1
+            print(f"[{done}/{total}] ERROR línea {line_num} ({item.get('output')}): {error}", flush=True)
+        else:
+            print(f"[{done}/{total}] OK {item['type']} -> {output_file}", flush=True)
+
+    pending = []
+    for line_num, item, error in entries:
+        if error:
+            report(line_num, item, None, error)
+        else:
+            pending.append((line_num, item))
+
+    tokens = [None] * len(pending)
+    if pending and token_pool is not None:
+        try:
+            tokens = token_pool.take([item for _, item in pending])
+        except PoolExhausted as e:
+            print(f"ERROR: {e}")
+            return total
+    elif pending:
+        try:
+            tokens = get_registrar(server_url).register_many([item for _, item in pending])
+        except RegistrationError as e:
+            print(f"No se pudieron registrar los tokens en bloque ({e}); se registran de a uno", flush=True)
+
+    # Tokens del pool de los items fallidos: se devuelven al terminar
+    unused_tokens = []
+
+    if jobs <= 1:
+        for (line_num, item), token_data in zip(pending, tokens):
+            output_file, error = _generate_item(item, server_url, token_data)
+            if error:
+                unused_tokens.append(token_data)
+            report(line_num, item, output_file, error)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {
+                pool.submit(_generate_item, item, server_url, token_data): (line_num, item, token_data)
+                for (line_num, item), token_data in zip(pending, tokens)
+            }
+            for future in as_completed(futures):
+                line_num, item, token_data = futures[future]
+                try:
+                    output_file, error = future.result()
+                except Exception as e:  # p.ej. el proceso del worker murió
+                    output_file, error = None, f"{type(e).__name__}: {e}"
+                if error:
+                    unused_tokens.append(token_data)
+                report(line_num, item, output_file, error)
+
+    if token_pool is not None and unused_tokens:
+        released = token_pool.release(unused_tokens)
+        print(f"{released} tokens de items fallidos devueltos al pool")
+
+    elapsed = time.monotonic() - started
+    rate = (total - failed) / elapsed if elapsed > 0 else 0
+    print(f"Batch terminado: {total - failed} generados, {failed} con error, {elapsed:.1f}s ({rate:.1f}/s)")
+    return failed
+
+
 def main():
+    # Los plugins registran sus tipos antes de armar las opciones de --type
+    generators.load_plugins()
+
     parser = argparse.ArgumentParser(
         description="TokenSnare CLI - Generador de Honeytokens"
     )
 
     # Parámetros Obligatorios
-    parser.add_argument('--type', required=True, choices=FILE_TYPE_SUPPORTED,
+    parser.add_argument('--type', choices=generators.supported_types(),
                         help='Tipo de honeytoken a generar')
 
-    parser.add_argument('--output', required=True,
+    parser.add_argument('--output',
                         help='Nombre del archivo de salida (se guardará en honeyTokens/)')
 
+    # Modo batch
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help=f'Genera todos los honeytokens de un manifiesto .csv o .jsonl '
+                             f'(campos: {", ".join(MANIFEST_FIELDS)})')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Procesos en paralelo para --batch (default: cantidad de CPUs)')
+
+    # Pool offline de tokens reservados
+    parser.add_argument('--pool', default=DEFAULT_POOL_FILE,
+                        help=f'Archivo del pool de tokens reservados (default: {DEFAULT_POOL_FILE})')
+    parser.add_argument('--from-pool', action='store_true',
+                        help='Toma los tokens del pool en lugar de registrarlos (no necesita el servidor)')
+    parser.add_argument('--pool-fill', type=int, metavar='N',
+                        help='Reserva N tokens en el servidor y los agrega al pool')
+    parser.add_argument('--pool-sync', action='store_true',
+                        help='Informa al servidor el tipo y la descripción de los tokens del pool ya usados')
+    parser.add_argument('--pool-status', action='store_true',
+                        help='Muestra cuántos tokens quedan en el pool y cuántos falta sincronizar')
+
     # Argumentos Generales
     parser.add_argument('--server', default='http://127.0.0.1:5000',
                         help='URL del servidor de alertas (default: localhost:5000)')
@@ -47,63 +246,116 @@ def main():
                         help='Texto del documento')
     parser.add_argument('--platform', default='linux', choices=['windows', 'linux'],
                         help='Plataforma del binario (solo para tipo binary)')
+    parser.add_argument('--count', type=int, default=1,
+                        help='Cantidad de QR en una hoja para imprimir (solo qrcode; salida .pdf o .svg)')
+
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Muestra el tiempo de importación de cada generador (o del de --type) y sale')
 
     args = parser.parse_args()
 
+    if args.profile_startup:
+        sys.exit(profile_startup([args.type] if args.type else None))
+
+    token_pool = TokenPool(args.pool)
+    if args.pool_fill or args.pool_sync or args.pool_status:
+        sys.exit(run_pool_command(token_pool, args))
+
+    if args.batch:
+        failed = run_batch(args.batch, args.server, args.jobs, token_pool if args.from_pool else None)
+        sys.exit(1 if failed else 0)
+
+    if not args.type or not args.output:
+        parser.error("--type y --output son obligatorios (salvo con --batch o los comandos del pool)")
+
     final_output_path = get_output_path(args.output)
 
-    match args.type:
-        case 'pdf':
-            generate_pdf_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
-                description=args.description,
-                title=args.title,
-                author=args.author,
-                content=args.content
-            )
-        case 'epub':
-            generate_epub_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
-                title=args.title,
-                author=args.author,
-                description=args.description,
-                content=args.content
-            )
-        case 'xlsx':
-            generate_xlsx_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
-                description=args.description,
-                title=args.title,
-                author=args.author,
-                content=args.content
-            )
-        case 'docx':
-            generate_docx_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
+    if args.count > 1:
+        if args.type != 'qrcode':
+            parser.error("--count sólo se puede usar con --type qrcode")
+        sys.exit(run_qrcode_sheet(args, final_output_path, token_pool if args.from_pool else None))
+
+    try:
+        token_data = None
+        if args.from_pool:
+            token_data = token_pool.take([{
+                'type': args.type, 'description': args.description, 'output': final_output_path
+            }])[0]
+        try:
+            generate_honeytoken(
+                args.type, args.server, final_output_path,
                 description=args.description,
                 title=args.title,
                 author=args.author,
-                content=args.content
-            )
-        case 'qrcode':
-            generate_qrcode_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
-                description=args.description,
-            )
-        case 'binary':
-            generate_binary_honeytoken(
-                server_url=args.server,
-                output_file=final_output_path,
+                content=args.content,
                 platform=args.platform,
-                description=args.description
+                token_data=token_data
             )
-        case _:
-            print("Tipo no reconocido")
+        except Exception:
+            # Sin documento el token del pool sigue sin usar
+            if token_data is not None:
+                token_pool.release([token_data])
+            raise
+    except (RegistrationError, PoolExhausted) as e:
+        print(e)
+        sys.exit(1)
+
+
+def run_qrcode_sheet(args, output_file, token_pool=None):
+    """--type qrcode --count N: registra N tokens (o los toma del pool) y arma una hoja con todos."""
+    from generators.qrcode_gen import generate_qrcode_sheet
+
+    items = [{'type': 'qrcode', 'description': args.description, 'output': output_file}] * args.count
+    try:
+        if token_pool is not None:
+            tokens = token_pool.take(items)
+        else:
+            tokens = get_registrar(args.server).register_many(items)
+    except (RegistrationError, PoolExhausted) as e:
+        print(e)
+        return 1
+    try:
+        generate_qrcode_sheet(output_file, tokens)
+    except Exception:
+        if token_pool is not None:
+            token_pool.release(tokens)
+        raise
+    print(f"{len(tokens)} códigos QR -> {output_file}")
+    return 0
+
+
+def profile_startup(types=None):
+    """--profile-startup: tiempo de importación de cada generador, en un proceso nuevo."""
+    timings = generators.profile_imports(types)
+    for token_type, seconds in sorted(timings.items(), key=lambda t: -(t[1] or 0)):
+        if seconds is None:
+            print(f"  {token_type:<8} ERROR al importar")
+        else:
+            print(f"  {token_type:<8} {seconds * 1000:8.1f} ms")
+    return 1 if None in timings.values() else 0
+
+
+def run_pool_command(token_pool, args):
+    """--pool-fill, --pool-sync y --pool-status. Retorna el código de salida."""
+    try:
+        if args.pool_fill:
+            available = token_pool.fill(args.server, args.pool_fill)
+            print(f"Reservados {args.pool_fill} tokens en {args.server}. Disponibles en el pool: {available}")
+        if args.pool_sync:
+            synced, errors = token_pool.sync()
+            print(f"Sincronizados {synced} tokens")
+            for token, error in errors.items():
+                print(f"  ERROR {token}: {error}")
+            if errors:
+                return 1
+        if args.pool_status:
+            status = token_pool.status()
+            print(f"Pool {args.pool} (servidor: {status['server']}): {status['available']} disponibles, "
+                  f"{status['used']} usados, {status['pending_sync']} sin sincronizar")
+    except (RegistrationError, ValueError) as e:
+        print(e)
+        return 1
+    return 0
 
 
 if __name__ == "__main__":
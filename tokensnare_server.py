@@ -1,16 +1,26 @@
 import argparse
-from flask import Flask, Response, request, jsonify, render_template, send_file, redirect, url_for
+import atexit
+from flask import Flask, Response, request, jsonify, render_template, send_file, redirect, url_for, stream_with_context
 from flask_httpauth import HTTPBasicAuth
 from datetime import datetime, timezone, timedelta
 import logging
 import json
-import os, textwrap
+import os, re, textwrap
 import hashlib
-from pathlib import Path
+import base64
+import queue
+import threading
+import time
+from collections import OrderedDict
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
 
+import generators
+from storage import HitQueue, open_storage
+from storage.records import filter_headers, parse_header_list
+from tokensnare_tracker import TRANSPARENT_PNG, TrackingServer
+
 # Cargar variables de entorno desde .env
 load_dotenv()
 
@@ -22,38 +32,136 @@ app = Flask(__name__)
 auth = HTTPBasicAuth()
 BUENOS_AIRES_TZ = timezone(timedelta(hours=-3))
 
-# pixel transparente 1x1
-TRANSPARENT_PNG = (
-    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01'
-    b'\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01'
-    b'\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82'
-)
-
-# Base de datos simple (en memoria + persistencia JSON)
-tokens_db = {}
-hits_db = []
-
 API_KEY = os.environ.get("API_KEY")
 
 ADMIN_USER = os.environ.get("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin")
 
-DB_FILE = Path("tokensnare_db.json")
+# Persistencia: backend intercambiable (json por defecto, o sqlite)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+DB_PATH = os.environ.get("DB_PATH")
+# Segundos que el backend json espera a que otro proceso suelte la base antes
+# de fallar (en --production se espera lo que dura el apagado de un worker)
+JSON_LOCK_TIMEOUT = float(os.environ.get("JSON_LOCK_TIMEOUT", 0))
+
+def _storage_options(backend):
+    if backend == "json":
+        return {
+            # Se compacta en un snapshot cuando el journal supera RATIO veces el tamaño
+            # del snapshot (y al menos MIN_BYTES)
+            'compact_ratio': float(os.environ.get("JOURNAL_COMPACT_RATIO", 1.0)),
+            'compact_min_bytes': int(os.environ.get("JOURNAL_COMPACT_MIN_BYTES", 4 * 1024 * 1024)),
+            'fsync_every': int(os.environ.get("JOURNAL_FSYNC_EVERY", 64)),
+            'fsync_interval': float(os.environ.get("JOURNAL_FSYNC_INTERVAL", 1.0)),
+            'lock_timeout': JSON_LOCK_TIMEOUT,
+        }
+    return {}
+
+storage = open_storage(STORAGE_BACKEND, DB_PATH, **_storage_options(STORAGE_BACKEND))
+
+# Cola de ingesta: los endpoints de tracking encolan y un thread escritor guarda por lotes
+HIT_QUEUE_SIZE = int(os.environ.get("HIT_QUEUE_SIZE", 10000))
+HIT_QUEUE_OVERFLOW = os.environ.get("HIT_QUEUE_OVERFLOW", "drop")
+HIT_BATCH_SIZE = int(os.environ.get("HIT_BATCH_SIZE", 256))
+# Segundos que se espera al thread escritor al apagar (drenar la cola)
+HIT_QUEUE_STOP_TIMEOUT = float(os.environ.get("HIT_QUEUE_STOP_TIMEOUT", 30))
+# Segundos durante los que los hits repetidos de un mismo cliente (token, IP y
+# user agent) se suman al primero en lugar de guardarse aparte. 0 desactiva.
+HIT_DEDUP_WINDOW = float(os.environ.get("HIT_DEDUP_WINDOW", 10))
+
+hit_queue = None
+
+# Límite de hits por IP en los endpoints de tracking (token bucket): HIT_RATE_LIMIT hits por
+# segundo con ráfagas de hasta HIT_RATE_BURST, recordando a lo sumo HIT_RATE_MAX_CLIENTS IPs.
+# Los hits que se pasan del límite se responden igual pero no se guardan. Desactivado por
+# defecto (0): detrás de un proxy sin TRUSTED_PROXY_HOPS todos los hits vendrían de la IP
+# del proxy y el límite descartaría detecciones legítimas.
+HIT_RATE_LIMIT = float(os.environ.get("HIT_RATE_LIMIT", 0))
+HIT_RATE_BURST = int(os.environ.get("HIT_RATE_BURST", 20))
+HIT_RATE_MAX_CLIENTS = int(os.environ.get("HIT_RATE_MAX_CLIENTS", 100000))
+# Proxies de confianza delante del servidor. El límite por IP usa la dirección del
+# socket; X-Forwarded-For sólo se usa si hay proxies configurados, y de él se toma
+# la dirección que agregó el más externo (como ProxyFix con x_for=TRUSTED_PROXY_HOPS).
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", 0))
+
+# Alertas por consola: como máximo ALERT_BURST por token cada ALERT_INTERVAL segundos (0 = sin límite)
+ALERT_BURST = int(os.environ.get("ALERT_BURST", 5))
+ALERT_INTERVAL = float(os.environ.get("ALERT_INTERVAL", 60))
+
+# Headers que se guardan de cada hit (nombres separados por coma, sin distinguir mayúsculas).
+# Con ALLOW sólo se guardan esos; los de DENY se descartan siempre. Vacíos: se guardan todos.
+HIT_HEADERS_ALLOW = parse_header_list(os.environ.get("HIT_HEADERS_ALLOW"))
+HIT_HEADERS_DENY = parse_header_list(os.environ.get("HIT_HEADERS_DENY"))
+
+# Listener asyncio opcional para los endpoints de tracking (--tracking-port)
+tracking_server = None
+
+# Base de las URLs de tracking que se devuelven al registrar un token.
+# Útil cuando el tracking se sirve por otro puerto/dominio que la administración.
+TRACKING_BASE_URL = os.environ.get("TRACKING_BASE_URL")
+
+def load_database(backend=None, path=None):
+    """
+    Abre la base e inicia el thread escritor de hits.
+    Si se indica otro backend o ruta (flags de la CLI del servidor),
+    reemplaza el configurado por variables de entorno.
+    """
+    global storage, hit_queue
+    if backend or path:
+        backend = backend or STORAGE_BACKEND
+        storage = open_storage(backend, path, **_storage_options(backend))
+    storage.load()
+
+    hit_queue = HitQueue(
+        storage,
+        maxsize=HIT_QUEUE_SIZE,
+        batch_size=HIT_BATCH_SIZE,
+        overflow=HIT_QUEUE_OVERFLOW,
+        on_written=_alert_hit,
+        dedup_window=HIT_DEDUP_WINDOW,
+        on_error=_ingest_error
+    )
+    hit_queue.start()
+
+@atexit.register
+def close_database():
+    """Drena los hits pendientes antes de cerrar la base. Se puede llamar más de una vez."""
+    global hit_queue, tracking_server
+    if tracking_server is not None:
+        tracking_server.stop()
+        tracking_server = None
+    if hit_queue is not None:
+        hit_queue.stop(HIT_QUEUE_STOP_TIMEOUT)
+        hit_queue = None
+    storage.close()
+
+def start_tracking_listener(host, port):
+    """
+    Inicia el listener asyncio de tracking (tokensnare_tracker) en un thread.
+    Comparte el almacenamiento y la cola de hits con la app Flask.
+    """
+    global tracking_server
+
+    def on_clone_report(headers, remote_addr):
+        token_id = report_js_clone(headers.get("X-Cloned-Domain"))
+        register_hit(token_id, headers, remote_addr)
 
-def load_database():
-    global tokens_db, hits_db
-    if DB_FILE.exists():
-        with open(DB_FILE, 'r') as f:
-            data = json.load(f)
-            tokens_db = data.get('tokens', {})
-            hits_db = data.get('hits', [])
+    tracking_server = TrackingServer(host, port, on_hit=register_hit, on_clone_report=on_clone_report)
+    tracking_server.start()
 
-def save_database():
-    with open(DB_FILE, 'w') as f:
-        json.dump({
-            'tokens': tokens_db,
-            'hits': hits_db
-        }, f, indent=2)
+def create_app(backend=None, path=None, tracking_port=None, tracking_host="0.0.0.0"):
+    """
+    App factory para servidores WSGI (gunicorn, etc.):
+        gunicorn 'tokensnare_server:create_app()'
+        gunicorn 'tokensnare_server:create_app(tracking_port=5001)'
+    Abre la base e inicia el thread escritor en cada worker y, si se indica
+    `tracking_port`, el listener rápido de tracking (con SO_REUSEPORT, así
+    todos los workers comparten el puerto).
+    """
+    load_database(backend, path)
+    if tracking_port:
+        start_tracking_listener(tracking_host, tracking_port)
+    return app
 
 def generate_token_id(data_string):
     return hashlib.sha256(data_string.encode()).hexdigest()[:16]
@@ -69,7 +177,7 @@ def construct_response_with_urls(token_id, record):
     Reconstruye las URLs de tracking para responder al cliente.
     La CLI las necesita.
     """
-    base_url = request.host_url.rstrip('/')
+    base_url = (TRACKING_BASE_URL or request.host_url).rstrip('/')
     response_data = record.copy()
     response_data['tracking_url_image'] = f"{base_url}/image/{token_id}.png"
     response_data['tracking_url_link'] = f"{base_url}/link/{token_id}"
@@ -93,49 +201,85 @@ def verify_password(username, password):
         return username
     return None
 
+# Elementos por página en el dashboard (el resto se carga con "Cargar más")
+DASHBOARD_PAGE_SIZE = 50
+
 @app.route("/tokens")
-@app.route("/api/tokens", methods=['GET'])
 @auth.login_required
 def honeytokens_index():
-    # In your Flask route:
-    return render_template("tokens_index.html", tokens=tokens_db, hits_list=hits_db)
-
-# Assuming tokens_db and hits_db are available globally
+    sort = request.args.get('sort', 'created')
+    if sort not in ('created', 'last_hit'):
+        sort = 'created'
+    tokens, next_cursor = storage.query_tokens(sort=sort, limit=DASHBOARD_PAGE_SIZE)
+    # Contadores mantenidos por el almacenamiento: no dependen del tamaño del historial
+    totals = storage.totals()
+    return render_template(
+        "tokens_index.html",
+        tokens=tokens,
+        sort=sort,
+        next_cursor=_encode_cursor(next_cursor),
+        page_size=DASHBOARD_PAGE_SIZE,
+        total_tokens=totals['tokens'],
+        total_hits=totals['hits']
+    )
 
 @app.route("/tokens/<token>", methods=['GET'])
 @auth.login_required
 def show_token_details(token):
-    if token not in tokens_db:
+    # Get the token's base info
+    ht_info = storage.get_token(token)
+    if ht_info is None:
         # If the token is not found, render a simple 404 page (or redirect)
         return render_template("404.html", error_message=f"Honeytoken '{token}' no encontrado"), 404
 
-    # Get the token's base info
-    ht_info = tokens_db[token].copy()
-    
-    # Filter the global hits_db to get only hits for this token
-    hit_history = [
-        hit for hit in hits_db if hit['token'] == token
-    ]
+    stats = _collect_stats(token)
+    if stats is None:
+        # Borrado mientras se armaba la página
+        return render_template("404.html", error_message=f"Honeytoken '{token}' no encontrado"), 404
+
+    # Only the newest page of hits, without headers (fetched on demand)
+    hit_history, next_cursor = storage.query_hits(
+        token, limit=DASHBOARD_PAGE_SIZE, reverse=True, headers=False
+    )
 
     # Render the detail template
     return render_template(
         "token_detail.html", 
         token_data=ht_info, 
-        hit_history=hit_history
+        hit_history=hit_history,
+        next_cursor=_encode_cursor(next_cursor),
+        page_size=DASHBOARD_PAGE_SIZE,
+        stats=stats,
+        hourly_series=_hourly_series(stats['hourly'])
     )
 
+# Endpoints JSON del dashboard (misma paginación que la API, con login web)
+@app.route("/web/api/tokens", methods=['GET'])
+@auth.login_required
+def web_tokens_page():
+    return _tokens_page()
+
+@app.route("/web/api/tokens/<token>/hits", methods=['GET'])
+@auth.login_required
+def web_token_hits_page(token):
+    return _token_hits_page(token)
+
+@app.route("/web/api/tokens/<token>/hits/<int:hit_id>/headers", methods=['GET'])
+@auth.login_required
+def web_hit_headers(token, hit_id):
+    """Headers de un hit, pedidos al hacer click en 'Mostrar Headers'."""
+    hit = storage.get_hit(token, hit_id)
+    if hit is None:
+        return jsonify({"error": "Hit no encontrado"}), 404
+    return jsonify(hit.get('headers', {}))
+
 # ACCIÓN WEB: BORRAR TOKEN
 @app.route("/web/delete/<token>", methods=['POST'])
 @auth.login_required
 def delete_token_web(token):
     """Borra el token y redirige a la lista (Usado por el botón web)"""
-    global hits_db
-    
-    if token in tokens_db:
-        del tokens_db[token]
-        # Limpiar hits asociados
-        hits_db = [hit for hit in hits_db if hit['token'] != token]
-        save_database()
+    # Borra el token y sus hits asociados
+    if storage.delete_token(token):
         log_print(f"Honeytoken eliminado desde Web | ID: {token}")
     
     # Redirigir a la lista de tokens
@@ -171,57 +315,609 @@ def register_honeytoken():
     if not data or 'type' not in data:
         return jsonify({"error": "Campo 'type' requerido"}), 400
     
-    current_time = get_timestamp()
+    token_record = _new_token_record(data['type'], data.get('description'), get_timestamp())
+    storage.add_token(token_record)
+
+    log_print(f"Nuevo honeytoken registrado | ID: {token_record['token']} | Tipo: {token_record['type']}")
 
-    ht_type = data['type']
-    ht_desc = data.get('description') or "Sin descripción"
-    token_id = generate_token_id(ht_type + ht_desc + current_time)
+    return jsonify(construct_response_with_urls(token_record['token'], token_record)), 201
 
-    token_record = {
-        'token': token_id,
+def _new_token_record(ht_type, description, current_time, salt=""):
+    """Registro de un token nuevo. `salt` distingue tokens iguales creados en el mismo instante."""
+    ht_desc = description or "Sin descripción"
+    return {
+        'token': generate_token_id(ht_type + ht_desc + current_time + salt),
         'type': ht_type,
         'description': ht_desc,
         'created_at': current_time,
         'hits': 0,
         'last_hit': None
     }
-    tokens_db[token_id] = token_record
-    save_database()
 
-    log_print(f"Nuevo honeytoken registrado | ID: {token_id} | Tipo: {ht_type}")
+# Máximo de tokens por pedido a /api/tokens/bulk
+MAX_BULK_TOKENS = 1000
+
+@app.route("/api/tokens/bulk", methods=['POST'])
+@require_api_key
+def register_honeytokens_bulk():
+    """
+    Registra varios honeytokens en una sola operación.
+    Body: {"tokens": [{"type": ..., "description": ...}, ...]}
+    Responde con los tokens y sus URLs de tracking, en el mismo orden.
+    Si algún item es inválido no se registra ninguno.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('tokens') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Campo 'tokens' requerido (lista no vacía)"}), 400
+    if len(items) > MAX_BULK_TOKENS:
+        return jsonify({"error": f"Máximo {MAX_BULK_TOKENS} tokens por pedido"}), 400
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('type'):
+            return jsonify({"error": f"Campo 'type' requerido en el item {index}"}), 400
+
+    current_time = get_timestamp()
+    records = [
+        _new_token_record(item['type'], item.get('description'), current_time, salt=str(index))
+        for index, item in enumerate(items)
+    ]
+    storage.add_tokens(records)
+
+    log_print(f"Nuevos honeytokens registrados en bloque | Cantidad: {len(records)}")
+
+    return jsonify({
+        'tokens': [construct_response_with_urls(record['token'], record) for record in records],
+        'count': len(records)
+    }), 201
+
+# Tokens reservados: IDs que se entregan antes de generar los documentos (pool
+# offline de la CLI). Ya registran hits; al sincronizar se les asigna tipo y descripción.
+RESERVED_TYPE = "reserved"
+
+@app.route("/api/tokens/reserve", methods=['POST'])
+@require_api_key
+def reserve_honeytokens():
+    """
+    Reserva un bloque de IDs de token con sus URLs de tracking.
+    Body: {"count": N} (máximo MAX_BULK_TOKENS).
+    """
+    data = request.get_json(silent=True) or {}
+    count = data.get('count')
+    if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_BULK_TOKENS:
+        return jsonify({"error": f"Campo 'count' requerido (entre 1 y {MAX_BULK_TOKENS})"}), 400
 
-    return jsonify(construct_response_with_urls(token_id, token_record)), 201
+    current_time = get_timestamp()
+    records = [
+        _new_token_record(RESERVED_TYPE, "Token reservado (sin asignar)", current_time, salt=f"{index}-{os.urandom(8).hex()}")
+        for index in range(count)
+    ]
+    storage.add_tokens(records)
+
+    log_print(f"Bloque de honeytokens reservado | Cantidad: {count}")
+
+    return jsonify({
+        'tokens': [construct_response_with_urls(record['token'], record) for record in records],
+        'count': len(records)
+    }), 201
+
+@app.route("/api/tokens/claim", methods=['POST'])
+@require_api_key
+def claim_honeytokens():
+    """
+    Asigna tipo y descripción a tokens reservados que ya se usaron.
+    Body: {"tokens": [{"token": ..., "type": ..., "description": ...}, ...]}
+    Sólo se pueden reclamar tokens reservados; el resto se informa en 'errors'.
+    """
+    data = request.get_json(silent=True)
+    items = data.get('tokens') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Campo 'tokens' requerido (lista no vacía)"}), 400
+    if len(items) > MAX_BULK_TOKENS:
+        return jsonify({"error": f"Máximo {MAX_BULK_TOKENS} tokens por pedido"}), 400
+
+    claimed, errors = [], {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('token') or not item.get('type'):
+            errors[str(index)] = "Campos 'token' y 'type' requeridos"
+            continue
+        token = item['token']
+        record = storage.get_token(token)
+        if record is None:
+            errors[token] = "Honeytoken no encontrado"
+        elif record['type'] != RESERVED_TYPE:
+            errors[token] = "El honeytoken no está reservado"
+        else:
+            storage.update_token(token, type=item['type'], description=item.get('description') or "Sin descripción")
+            claimed.append(token)
+
+    if claimed:
+        log_print(f"Honeytokens reservados asignados | Cantidad: {len(claimed)}")
+
+    return jsonify({'claimed': claimed, 'errors': errors})
+
+# ----------------------------------------------------------------------------
+# Generación de documentos desde el servidor
+# ----------------------------------------------------------------------------
+# Tipos de honeytoken de plugins (TOKENSNARE_PLUGINS), para /api/generate
+generators.load_plugins()
+
+# Segundos que /api/generate espera cada pedazo del documento antes de abortar
+GENERATE_STALL_TIMEOUT = float(os.environ.get("GENERATE_STALL_TIMEOUT", 60))
+
+# Extensión y tipo MIME de la respuesta de cada generador
+GENERATED_FILES = {
+    'pdf': ('pdf', 'application/pdf'),
+    'docx': ('docx', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'epub': ('epub', 'application/epub+zip'),
+    'qrcode': ('png', 'image/png'),
+    'binary': ('', 'application/octet-stream'),
+}
+QRCODE_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml', 'pdf': 'application/pdf'}
+
+class _StreamWriter:
+    """
+    Destino de los generadores para /api/generate: el generador corre en su
+    propio thread y cada pedazo que escribe pasa por una cola acotada a la
+    respuesta, que lo manda al cliente mientras sigue la generación (el
+    documento nunca está entero en memoria). `name` le indica el formato a
+    los generadores que lo usan.
+    """
+
+    CHUNK_SIZE = 256 * 1024
+    _DONE = object()
+
+    def __init__(self, name, maxsize=8, stall_timeout=60):
+        self.name = name
+        self.size = 0
+        self.error = None
+        # Segundos sin recibir un pedazo del generador antes de abortar
+        self.stall_timeout = stall_timeout
+        self._queue = queue.Queue(maxsize)
+        self._closed = threading.Event()
+        self._thread = None
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        for start in range(0, len(view), self.CHUNK_SIZE):
+            self._put(bytes(view[start:start + self.CHUNK_SIZE]))
+        self.size += len(view)
+        return len(view)
+
+    def _put(self, item):
+        # Si el cliente se fue nadie vacía la cola: se corta la generación
+        while True:
+            if self._closed.is_set():
+                raise IOError("La respuesta se cerró antes de terminar el documento")
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def start(self, produce):
+        """
+        Arranca `produce(self)` en un thread y espera el primer pedazo, así
+        un error antes de escribir nada todavía puede responderse con un
+        status de error. Devuelve el error o None.
+        """
+        def run():
+            try:
+                produce(self)
+            except Exception as e:
+                self.error = e
+            finally:
+                try:
+                    self._put(self._DONE)
+                except IOError:
+                    pass
+
+        self._thread = threading.Thread(target=run, name="generate-document", daemon=True)
+        self._thread.start()
+        self._first = self._get()
+        if self._first is self._DONE:
+            self._closed.set()
+            return self.error
+        return None
+
+    def _get(self):
+        """
+        Próximo pedazo del generador, o _DONE con `error` si el generador se
+        colgó (más de `stall_timeout` segundos sin escribir) o su thread
+        terminó sin avisar el final.
+        """
+        deadline = time.monotonic() + self.stall_timeout
+        while True:
+            try:
+                return self._queue.get(timeout=0.5)
+            except queue.Empty:
+                pass
+            if not self._thread.is_alive() and self._queue.empty():
+                self.error = self.error or RuntimeError("El generador terminó sin completar el documento")
+            elif time.monotonic() >= deadline:
+                self.error = TimeoutError(f"El generador no escribió nada en {self.stall_timeout} segundos")
+            else:
+                continue
+            # El thread, si sigue vivo, falla en la próxima escritura
+            self._closed.set()
+            return self._DONE
+
+    def chunks(self, on_error):
+        """Cuerpo de la respuesta; `on_error(e)` si falla a mitad del documento."""
+        item = self._first
+        try:
+            while item is not self._DONE:
+                yield item
+                item = self._get()
+        finally:
+            self._closed.set()
+        if self.error is not None:
+            on_error(self.error)
+            # Se corta la respuesta para que el cliente no se quede con un documento truncado
+            raise self.error
+
+@app.route("/api/generate/<ht_type>", methods=['POST'])
+@require_api_key
+def generate_document(ht_type):
+    """
+    Registra un honeytoken y devuelve el documento ya generado.
+    Body (todo opcional): {"description", "title", "author", "content",
+    "platform" (binary: linux|windows), "format" (qrcode: png|svg|pdf), "filename"}
+    El ID del token va en el header X-Token-Id.
+    """
+    if ht_type not in generators.supported_types():
+        return jsonify({"error": f"Tipo no soportado: {ht_type}"}), 404
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON"}), 400
+
+    extension, mimetype = GENERATED_FILES.get(ht_type, ('', 'application/octet-stream'))
+    platform = data.get('platform') or 'linux'
+    if ht_type == 'binary':
+        if platform not in ('linux', 'windows'):
+            return jsonify({"error": "Las plataformas soportadas son windows y linux"}), 400
+        extension = 'exe' if platform == 'windows' else ''
+    if ht_type == 'qrcode' and data.get('format'):
+        if data['format'] not in QRCODE_FORMATS:
+            return jsonify({"error": f"Formatos de QR soportados: {', '.join(QRCODE_FORMATS)}"}), 400
+        extension, mimetype = data['format'], QRCODE_FORMATS[data['format']]
+
+    default_name = f"{ht_type}.{extension}" if extension else ht_type
+    # Sólo caracteres seguros para el header Content-Disposition
+    filename = re.sub(r'[^A-Za-z0-9._-]', '_', os.path.basename(str(data.get('filename') or ''))).strip('.') or default_name
+    if ht_type == 'qrcode':
+        # El generador de QR elige el formato por la extensión
+        filename = f"{os.path.splitext(filename)[0]}.{extension}"
+
+    record = _new_token_record(ht_type, data.get('description'), get_timestamp())
+    storage.add_token(record)
+    token_data = construct_response_with_urls(record['token'], record)
+
+    # El generador corre fuera del contexto del request
+    host_url = request.host_url
+
+    def produce(output):
+        generators.generate(
+            ht_type, host_url, output,
+            description=record['description'],
+            token_data=token_data,
+            title=data.get('title'),
+            author=data.get('author'),
+            content=data.get('content'),
+            platform=platform
+        )
+
+    def failed(e):
+        # Sin documento el token no sirve: se borra
+        storage.delete_token(record['token'])
+        log_print(f"Error generando honeytoken {ht_type}: {e}")
+
+    output = _StreamWriter(filename, stall_timeout=GENERATE_STALL_TIMEOUT)
+    error = output.start(produce)
+    if error is not None:
+        failed(error)
+        status = 400 if isinstance(error, ValueError) else 500
+        return jsonify({"error": f"No se pudo generar el documento: {error}"}), status
+
+    def body():
+        yield from output.chunks(failed)
+        log_print(f"Nuevo honeytoken generado | ID: {record['token']} | Tipo: {ht_type} | {output.size} bytes")
+
+    # Sin Content-Length: se manda por partes a medida que se genera
+    response = Response(stream_with_context(body()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Token-Id'] = record['token']
+    return response
+
+# ----------------------------------------------------------------------------
+# Paginación, filtros y proyección de campos
+# ----------------------------------------------------------------------------
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def _encode_cursor(value):
+    """Cursor opaco para la próxima página (base64 de la clave del último elemento)."""
+    if value is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+def _decode_cursor(raw, kind):
+    """Decodifica el cursor y valida su forma: 'token' -> [clave, token], 'hit' -> id."""
+    if not raw:
+        return None
+    try:
+        value = json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))
+    except (ValueError, TypeError):
+        value = None
+
+    if kind == 'token':
+        valid = isinstance(value, list) and len(value) == 2 and all(isinstance(v, str) for v in value)
+    else:
+        valid = isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    if not valid:
+        raise ValueError("Parámetro 'cursor' inválido")
+    return value
+
+def _arg_time(name):
+    """Fecha ISO 8601 de la query string, normalizada a la zona horaria de la base."""
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    try:
+        value = datetime.fromisoformat(raw)
+    except ValueError:
+        raise ValueError(f"Parámetro '{name}' inválido, se espera una fecha ISO 8601")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=BUENOS_AIRES_TZ)
+    return value.astimezone(BUENOS_AIRES_TZ).isoformat()
+
+def _arg_bool(name):
+    raw = request.args.get(name)
+    if raw is None:
+        return None
+    if raw.lower() in ('1', 'true', 'yes', 'si'):
+        return True
+    if raw.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Parámetro '{name}' inválido, se espera true o false")
+
+def _arg_limit(name='limit'):
+    raw = request.args.get(name)
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ValueError(f"Parámetro '{name}' inválido")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"Parámetro '{name}' debe estar entre 1 y {MAX_PAGE_SIZE}")
+    return limit
+
+def _arg_fields(name='fields'):
+    """Proyección de campos: ?fields=token,timestamp,ip"""
+    raw = request.args.get(name)
+    if not raw:
+        return None
+    return [field.strip() for field in raw.split(',') if field.strip()]
+
+def _project(record, fields):
+    if fields is None:
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+def _wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+def _ndjson_response(fetch_page, cursor, fields):
+    """
+    Respuesta NDJSON (un objeto JSON por línea) que recorre todas las páginas
+    con un generador, sin armar la lista completa en memoria.
+    """
+    def generate():
+        next_cursor = cursor
+        while True:
+            page, next_cursor = fetch_page(next_cursor)
+            for record in page:
+                yield json.dumps(_project(record, fields), ensure_ascii=False) + '\n'
+            if next_cursor is None:
+                break
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _token_filters():
+    sort = request.args.get('sort', 'created')
+    if sort not in ('created', 'last_hit'):
+        raise ValueError("Parámetro 'sort' inválido, opciones: created, last_hit")
+    return {
+        'type': request.args.get('type'),
+        'created_from': _arg_time('created_from'),
+        'created_to': _arg_time('created_to'),
+        'has_hits': _arg_bool('has_hits'),
+        'hit_since': _arg_time('hit_since'),
+        'hit_until': _arg_time('hit_until'),
+        'ip': request.args.get('ip'),
+        'sort': sort,
+    }
+
+def _hit_filters(prefix=''):
+    return {
+        'since': _arg_time(f'{prefix}since'),
+        'until': _arg_time(f'{prefix}until'),
+        'ip': request.args.get(f'{prefix}ip'),
+        'reverse': request.args.get(f'{prefix}order', 'asc') == 'desc',
+    }
 
 @app.route("/api/tokens", methods=['GET'])
 @require_api_key
 def list_honeytokens():
-    output_list = list(tokens_db.values())
-    return jsonify({'tokens': output_list, 'total': len(output_list)})
+    """
+    Lista paginada de tokens.
+    Filtros: type, created_from, created_to, has_hits, hit_since, hit_until, ip.
+    Orden: sort=created|last_hit. Paginación: limit, cursor. Proyección: fields.
+    Con format=ndjson (o Accept: application/x-ndjson) se devuelven todos en streaming.
+    """
+    return _tokens_page()
+
+def _tokens_page():
+    try:
+        filters = _token_filters()
+        fields = _arg_fields()
+        cursor = _decode_cursor(request.args.get('cursor'), 'token')
+        limit = _arg_limit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if _wants_ndjson():
+        return _ndjson_response(
+            lambda after: storage.query_tokens(after=after, limit=MAX_PAGE_SIZE, **filters),
+            cursor, fields
+        )
+
+    page, next_cursor = storage.query_tokens(after=cursor, limit=limit, **filters)
+    return jsonify({
+        'tokens': [_project(record, fields) for record in page],
+        'count': len(page),
+        'total': storage.count_tokens(),
+        'next_cursor': _encode_cursor(next_cursor)
+    })
 
 @app.route("/api/tokens/<token>", methods=['GET'])
 @require_api_key
 def get_honeytoken_info(token):
-    if token not in tokens_db:
+    """
+    Detalle de un token con la primera página de su historial de hits.
+    Acepta los mismos parámetros que /hits con prefijo 'hits_'
+    (hits_limit, hits_since, hits_until, hits_ip, hits_order, hits_fields).
+    """
+    ht_info = storage.get_token(token)
+    if ht_info is None:
         return jsonify({"error": "Honeytoken no encontrado"}), 404
 
-    ht_info = tokens_db[token].copy()
-    ht_info['hit_history'] = [
-        hit for hit in hits_db if hit['token'] == token
-    ]
+    try:
+        filters = _hit_filters('hits_')
+        fields = _arg_fields('hits_fields')
+        limit = _arg_limit('hits_limit')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page, next_cursor = storage.query_hits(
+        token, limit=limit, headers=fields is None or 'headers' in fields, **filters
+    )
+    ht_info['hit_history'] = [_project(hit, fields) for hit in page]
+    ht_info['hit_history_next_cursor'] = _encode_cursor(next_cursor)
 
     return jsonify(ht_info)
 
+@app.route("/api/tokens/<token>/hits", methods=['GET'])
+@require_api_key
+def get_honeytoken_hits(token):
+    """
+    Historial paginado de hits de un token.
+    Filtros: since, until, ip. Orden: order=asc|desc. Paginación: limit, cursor.
+    Proyección: fields (sin 'headers' no se leen los headers del almacenamiento).
+    Con format=ndjson (o Accept: application/x-ndjson) se devuelven todos en streaming.
+    """
+    return _token_hits_page(token)
+
+def _token_hits_page(token):
+    if not storage.has_token(token):
+        return jsonify({"error": "Honeytoken no encontrado"}), 404
+
+    try:
+        filters = _hit_filters()
+        fields = _arg_fields()
+        cursor = _decode_cursor(request.args.get('cursor'), 'hit')
+        limit = _arg_limit()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with_headers = fields is None or 'headers' in fields
+
+    if _wants_ndjson():
+        return _ndjson_response(
+            lambda after: storage.query_hits(token, after=after, limit=MAX_PAGE_SIZE,
+                                             headers=with_headers, **filters),
+            cursor, fields
+        )
+
+    page, next_cursor = storage.query_hits(token, after=cursor, limit=limit, headers=with_headers, **filters)
+    return jsonify({
+        'token': token,
+        'hits': [_project(hit, fields) for hit in page],
+        'count': len(page),
+        'next_cursor': _encode_cursor(next_cursor)
+    })
+
+# ----------------------------------------------------------------------------
+# Estadísticas (agregados precalculados al guardar cada hit)
+# ----------------------------------------------------------------------------
+STATS_HOURS = 48
+STATS_DAYS = 30
+
+def _collect_stats(token=None):
+    """
+    Agregados globales o de un token, con los buckets de las últimas
+    STATS_HOURS horas y STATS_DAYS días y los totales de 24h y 7 días.
+    Retorna None si el token no existe.
+    """
+    now = datetime.now(BUENOS_AIRES_TZ)
+    hourly_since = (now - timedelta(hours=STATS_HOURS - 1)).strftime('%Y-%m-%dT%H')
+    daily_since = (now - timedelta(days=STATS_DAYS - 1)).strftime('%Y-%m-%d')
+
+    if token is None:
+        stats = storage.global_stats(hourly_since, daily_since)
+    else:
+        stats = storage.token_stats(token, hourly_since, daily_since)
+        if stats is None:
+            return None
+
+    last_24h = (now - timedelta(hours=23)).strftime('%Y-%m-%dT%H')
+    last_7d = (now - timedelta(days=6)).strftime('%Y-%m-%d')
+    stats['hits_last_24h'] = sum(count for bucket, count in stats['hourly'].items() if bucket >= last_24h)
+    stats['hits_last_7d'] = sum(count for bucket, count in stats['daily'].items() if bucket >= last_7d)
+    return stats
+
+def _hourly_series(hourly):
+    """Las últimas STATS_HOURS horas en orden, con 0 en las horas sin hits (para el gráfico)."""
+    now = datetime.now(BUENOS_AIRES_TZ)
+    hours = [(now - timedelta(hours=offset)).strftime('%Y-%m-%dT%H') for offset in range(STATS_HOURS - 1, -1, -1)]
+    return [(hour, hourly.get(hour, 0)) for hour in hours]
+
+@app.route("/api/stats", methods=['GET'])
+@require_api_key
+def get_stats():
+    """
+    Estadísticas de todos los hits (o de un token con ?token=<id>):
+    IPs únicas, primer/último hit, hits por hora y por día, top user agents.
+    """
+    token = request.args.get('token')
+    record = storage.get_token(token) if token is not None else None
+    stats = _collect_stats(token)
+    # El token se pudo borrar entre las dos lecturas
+    if stats is None or (token is not None and record is None):
+        return jsonify({"error": "Honeytoken no encontrado"}), 404
+
+    if token is None:
+        totals = storage.totals()
+        stats['total_tokens'] = totals['tokens']
+        stats['total_hits'] = totals['hits']
+        if hit_queue is not None:
+            stats['ingest'] = hit_queue.stats()
+        stats['alerts'] = alert_limiter.stats()
+        stats['shed'] = dict(shed_hits, rate_limiter=rate_limiter.stats())
+    else:
+        stats['token'] = token
+        stats['hits'] = record['hits']
+    return jsonify(stats)
+
 @app.route("/api/tokens/<token>", methods=['DELETE'])
 @require_api_key
 def delete_honeytoken(token):
     """Elimina un honeytoken específico y sus hits asociados."""
-    global hits_db
-    if token not in tokens_db:
+    if not storage.delete_token(token):
         return jsonify({"error": "Honeytoken no encontrado"}), 404
-    
-    del tokens_db[token]
-    hits_db = [hit for hit in hits_db if hit['token'] != token]
-    save_database()
 
     log_print(f"Honeytoken eliminado | ID: {token}")
 
@@ -231,10 +927,7 @@ def delete_honeytoken(token):
 @require_api_key
 def delete_all():
     """Elimina TODOS los honeytokens y hits. Útil para reiniciar."""
-    global tokens_db, hits_db
-    tokens_db.clear()
-    hits_db.clear()
-    save_database()
+    storage.reset()
 
     log_print(f"DB Reset")
     return jsonify({"message": "DB Reset"}), 200
@@ -243,38 +936,162 @@ def delete_all():
 # TRACKING
 # ============================================================================
 
+class RateLimiter:
+    """
+    Token bucket por cliente: `rate` hits por segundo con ráfagas de hasta
+    `burst`. Recuerda a lo sumo `max_clients` clientes; al llenarse olvida
+    el que lleva más tiempo sin pedir nada (LRU), así la memoria queda
+    acotada aunque el tráfico venga de muchas IPs.
+    """
+
+    def __init__(self, rate, burst, max_clients):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # cliente -> [fichas disponibles, última recarga]
+        self._lock = threading.Lock()
+
+    def allow(self, client):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [self.burst, now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def stats(self):
+        return {'clients': len(self._buckets), 'max_clients': self.max_clients}
+
+rate_limiter = RateLimiter(HIT_RATE_LIMIT, HIT_RATE_BURST, HIT_RATE_MAX_CLIENTS)
+
+# Hits descartados antes de encolarlos, por motivo
+shed_hits = {'unknown_token': 0, 'rate_limited': 0}
+_shed_lock = threading.Lock()
+
+def _shed_hit(reason):
+    with _shed_lock:
+        shed_hits[reason] += 1
+        count = shed_hits[reason]
+    if count % 1000 == 1:
+        log_print(f"ADVERTENCIA: hits descartados ({reason}) hasta ahora: {count}")
+
+def client_address(headers, remote_addr):
+    """Dirección del cliente para el límite por IP (no se puede falsear con headers)."""
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [part.strip() for part in headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return remote_addr
+
 def _register_hit(token: str):
     """
     Función helper interna.
-    Registra un hit para un honeytoken, actualiza la DB y guarda en disco.
+    Arma el registro del hit y lo encola; el thread escritor lo guarda y emite la alerta.
+    No toca el disco, así el endpoint responde sin esperar al almacenamiento.
     """
-    ts_iso = get_timestamp()
-    
-    ip = request.headers.getlist("X-Forwarded-For")[0] if request.headers.getlist("X-Forwarded-For") else request.remote_addr
-    user_agent = request.headers.get('User-Agent', 'Unknown')
-    
-    # Registra el hit
+    register_hit(token, request.headers, request.remote_addr)
+
+def register_hit(token, headers, remote_addr):
+    """
+    Encola un hit a partir de los headers del request.
+    Es compartida por las rutas Flask y el listener rápido de tracking.
+
+    Antes de copiar headers o encolar nada se descartan los hits de tokens
+    inexistentes (scanners probando URLs al azar) y los de IPs que se pasan
+    del límite. La respuesta al cliente es la misma en todos los casos.
+    """
+    writer = hit_queue
+    if writer is None:
+        # El servidor se está apagando
+        return
+
+    if not storage.has_token(token):
+        _shed_hit('unknown_token')
+        return
+
+    if not rate_limiter.allow(client_address(headers, remote_addr)):
+        _shed_hit('rate_limited')
+        return
+
     hit_record = {
         'token': token,
-        'timestamp': ts_iso,
-        'ip': ip,
-        'user_agent': user_agent,
-        'headers': dict(request.headers)
+        'timestamp': get_timestamp(),
+        'ip': headers.get('X-Forwarded-For') or remote_addr,
+        'user_agent': headers.get('User-Agent', 'Unknown'),
+        'headers': filter_headers(dict(headers), HIT_HEADERS_ALLOW, HIT_HEADERS_DENY)
     }
-    
-    # Alerta
-    if token in tokens_db:
-        hits_db.append(hit_record)
 
-        tokens_db[token]['hits'] += 1
-        tokens_db[token]['last_hit'] = ts_iso
-        token_type = tokens_db[token]['type']
-        description = tokens_db[token]['description']
-        log_print(f"ALERTA HIT | ID: {token} | Tipo: {token_type} | Descripción: {description} | IP: {ip} | UA: {user_agent}")
+    if not writer.put(hit_record) and writer.dropped % 1000 == 1:
+        log_print(f"ADVERTENCIA: cola de hits llena, descartados hasta ahora: {writer.dropped}")
 
-    # else:
-    #     log_print(f"ALERTA HIT NO ESPERADO | IP: {ip} | UA: {user_agent}")
-    save_database()
+class AlertLimiter:
+    """
+    Límite de alertas por token en ventanas fijas de `interval` segundos.
+    Las alertas que se pasan del límite no se imprimen, pero se cuentan y
+    se informan junto con la siguiente alerta emitida de ese token.
+    """
+
+    def __init__(self, burst, interval):
+        self.burst = burst
+        self.interval = interval
+        self.suppressed = 0
+        self._windows = {}  # token -> [inicio de la ventana, emitidas, suprimidas sin informar]
+        self._lock = threading.Lock()
+
+    def allow(self, token):
+        """Retorna (emitir, alertas suprimidas a informar con ésta)."""
+        if self.burst <= 0:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(token)
+            if window is None or now - window[0] >= self.interval:
+                pending = window[2] if window else 0
+                self._windows[token] = [now, 1, 0]
+                return True, pending
+            if window[1] < self.burst:
+                window[1] += 1
+                pending, window[2] = window[2], 0
+                return True, pending
+            window[2] += 1
+            self.suppressed += 1
+            return False, 0
+
+    def stats(self):
+        return {'suppressed': self.suppressed}
+
+alert_limiter = AlertLimiter(ALERT_BURST, ALERT_INTERVAL)
+
+def _ingest_error(action, error):
+    """Errores del thread escritor de hits (el thread sigue corriendo)."""
+    log_print(f"ERROR en la ingesta de hits {action}: {type(error).__name__}: {error}")
+
+def _alert_hit(hit):
+    """
+    Alerta por consola de un hit ya guardado (se ejecuta en el thread escritor).
+    Los hits de tokens inexistentes se descartan al guardar y no generan alerta;
+    las repeticiones agrupadas por la ventana de deduplicación tampoco.
+    """
+    send, suppressed = alert_limiter.allow(hit['token'])
+    if not send:
+        return
+    token_info = storage.get_token(hit['token'])
+    if token_info:
+        token_type = token_info['type']
+        description = token_info['description']
+        summary = f" | Alertas suprimidas desde la anterior: {suppressed}" if suppressed else ""
+        log_print(f"ALERTA HIT | ID: {hit['token']} | Tipo: {token_type} | Descripción: {description} | IP: {hit['ip']} | UA: {hit['user_agent']}{summary}")
 
 @app.route("/image/<token>.png", methods=['GET', 'OPTIONS'])
 def image_hit(token):
@@ -303,7 +1120,13 @@ def link_hit(token):
 
 @app.route("/", methods=['GET'])
 def index():
-    return render_template("home.html", active_tokens=len(tokens_db), hits=len(hits_db))
+    totals = storage.totals()
+    return render_template(
+        "home.html",
+        active_tokens=totals['tokens'],
+        hits=totals['hits'],
+        stats=_collect_stats()
+    )
 
 # ============================================================================
 # Sitio web demo
@@ -335,19 +1158,21 @@ def logo():
             if ref_host and ref_host != current_host:
                 token_id = generate_token_id("WEBSITE_CLONE_PROTECION_CSS")
 
-                if token_id not in tokens_db:
-                    tokens_db[token_id] = {
+                description = f"Sitio clonado detectado desde {ref_host}"
+                # El logo se pide en cada carga de página: sólo se escribe si algo cambió
+                existing = storage.get_token(token_id)
+                if existing is None:
+                    storage.add_token({
                         "token": token_id,
                         "type": "WEB_CLONE",
-                        "description": f"Sitio clonado detectado desde {ref_host}",
+                        "description": description,
                         "created_at": get_timestamp(),
                         "hits": 0,
                         "last_hit": None,
-                    }
-                else:
-                    tokens_db[token_id]["description"] = (
-                        f"Sitio clonado detectado desde {ref_host}"
-                    )
+                    })
+                elif existing['description'] != description:
+                    # Sólo se actualiza la descripción, sin pisar los contadores de hits
+                    storage.update_token(token_id, description=description)
 
                 _register_hit(token_id)
 
@@ -368,27 +1193,36 @@ def js_callback():
         )
         return response
 
+    token_id = report_js_clone(request.headers.get("X-Cloned-Domain"))
+    _register_hit(token_id)
+
+    response = jsonify({"status": "ok"})
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+def report_js_clone(cloned_domain):
+    """
+    Asegura que exista el token de clonación por JS y actualiza su descripción
+    con el dominio reportado. Retorna el ID del token.
+    """
     token_id = generate_token_id("WEBSITE_CLONE_PROTECTION_JS")
 
-    if token_id not in tokens_db:
-        tokens_db[token_id] = {
+    existing = storage.get_token(token_id)
+    if existing is None:
+        storage.add_token({
             "token": token_id,
             "type": "WEB_CLONE_JS",
             "description": "Sitio web clonado (Reporte JS)",
             "created_at": get_timestamp(),
             "hits": 0,
             "last_hit": None,
-        }
+        })
 
-    cloned_domain = request.headers.get("X-Cloned-Domain")
-    if cloned_domain:
-        tokens_db[token_id]["description"] = f"Sitio web clonado en: {cloned_domain}"
+    description = f"Sitio web clonado en: {cloned_domain}"
+    if cloned_domain and (existing is None or existing['description'] != description):
+        storage.update_token(token_id, description=description)
 
-    _register_hit(token_id)
-
-    response = jsonify({"status": "ok"})
-    response.headers["Access-Control-Allow-Origin"] = "*"
-    return response
+    return token_id
 
 # ============================================================================
 # MAIN
@@ -401,15 +1235,25 @@ def main():
         epilog=textwrap.dedent("""
             Endpoints:
             POST   /api/tokens          - Registrar
-            GET    /api/tokens          - Listar
+            POST   /api/generate/<tipo> - Registrar y descargar el documento generado
+            GET    /api/tokens          - Listar (paginado, filtros, format=ndjson)
             GET    /api/tokens/<token>  - Detalles
+            GET    /api/tokens/<token>/hits - Historial de hits (paginado, filtros, format=ndjson)
             DELETE /api/tokens/<token>  - Borrar uno
             DELETE /api/tokens/all      - Borrar todo
             
             GET    /image/<token>.png   - Tracking (Imagen)
             GET    /link/<token>        - Tracking (Link)
 
-            La base de datos se guarda en: tokensnare_db.json
+            Con --tracking-port las rutas de tracking (/image, /link, /api/callback)
+            también se sirven desde un listener asyncio liviano en ese puerto.
+
+            Almacenamiento (--storage o STORAGE_BACKEND):
+            json   - tokensnare_db.json (snapshot) + tokensnare_db.journal (default)
+            sqlite - tokensnare_db.sqlite3 (modo WAL, hits indexados)
+
+            Migrar una base JSON existente a SQLite:
+            python tokensnare_server.py --storage sqlite --import-json tokensnare_db.json
         """)
     )
 
@@ -417,21 +1261,98 @@ def main():
                        help='Host del servidor (default: 0.0.0.0 para escuchar todas las interfaces)')
     parser.add_argument('--port', type=int, default=5000,
                        help='Puerto del servidor (default: 5000)')
+    parser.add_argument('--tracking-port', type=int, default=None,
+                       help='Puerto del listener asyncio para /image, /link y /api/callback (opcional)')
+    parser.add_argument('--production', action='store_true',
+                       help='Usa gunicorn en lugar del servidor de desarrollo de Flask')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Procesos worker en modo producción (default: 1; más de 1 requiere --storage sqlite)')
+    parser.add_argument('--threads', type=int, default=8,
+                       help='Threads por worker en modo producción (default: 8)')
+    parser.add_argument('--keep-alive', type=int, default=5,
+                       help='Segundos que se mantiene abierta una conexión keep-alive (default: 5)')
+    parser.add_argument('--backlog', type=int, default=2048,
+                       help='Conexiones pendientes máximas en el socket (default: 2048)')
+    parser.add_argument('--worker-connections', type=int, default=2000,
+                       help='Conexiones simultáneas máximas por worker (default: 2000)')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default=None,
+                       help=f'Backend de almacenamiento (default: {STORAGE_BACKEND})')
+    parser.add_argument('--db', default=None,
+                       help='Ruta de la base de datos (default: según el backend)')
+    parser.add_argument('--import-json', metavar='JSON_DB', default=None,
+                       help='Importa una base tokensnare_db.json existente al backend SQLite antes de iniciar')
     
     args = parser.parse_args()
+
+    if args.production and args.workers > 1 and (args.storage or STORAGE_BACKEND) != 'sqlite':
+        parser.error("Más de un worker requiere --storage sqlite (el backend json admite un solo proceso)")
     
     # Cargar base de datos
-    load_database()
+    load_database(args.storage, args.db)
+
+    if args.import_json:
+        if not hasattr(storage, 'import_json'):
+            parser.error("--import-json sólo se puede usar con --storage sqlite")
+        imported_tokens, imported_hits = storage.import_json(args.import_json)
+        log_print(f"Migración completada | Tokens: {imported_tokens} | Hits: {imported_hits}")
     
     print("=" * 60)
     print("TokenSnare Alert Server")
     print("=" * 60)
     print(f"Servidor corriendo en: http://{args.host}:{args.port}")
-    print(f"Honeytokens registrados hasta el momento: {len(tokens_db)}")
+    if args.tracking_port:
+        print(f"Tracking rápido en: http://{args.host}:{args.tracking_port}")
+    print(f"Honeytokens registrados hasta el momento: {storage.count_tokens()}")
     print("=" * 60)
     
     # Iniciar servidor
-    app.run(host=args.host, port=args.port)
+    if args.production:
+        # Cada worker abre su propia conexión a la base desde create_app()
+        close_database()
+        run_production(args)
+    else:
+        if args.tracking_port:
+            start_tracking_listener(args.host, args.tracking_port)
+        app.run(host=args.host, port=args.port)
+
+# Segundos que gunicorn le da a un worker para terminar (y drenar su cola)
+GRACEFUL_TIMEOUT = 30
+
+def run_production(args):
+    """
+    Lanza la app con gunicorn (workers gthread). Al reiniciar o detener un
+    worker (SIGHUP/SIGTERM) se drena su cola de hits antes de que termine.
+    Con el backend json (un solo worker, ver main) al recargar el worker
+    nuevo espera a que el anterior suelte la base.
+    """
+    global JSON_LOCK_TIMEOUT
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("Error: el modo --production requiere gunicorn (pip install gunicorn)")
+        exit(1)
+
+    backend = args.storage or STORAGE_BACKEND
+    if backend == 'json':
+        JSON_LOCK_TIMEOUT = max(JSON_LOCK_TIMEOUT, GRACEFUL_TIMEOUT)
+
+    class TokenSnareApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{args.host}:{args.port}")
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('keepalive', args.keep_alive)
+            self.cfg.set('backlog', args.backlog)
+            self.cfg.set('worker_connections', args.worker_connections)
+            self.cfg.set('graceful_timeout', GRACEFUL_TIMEOUT)
+            self.cfg.set('worker_exit', lambda server, worker: close_database())
+
+        def load(self):
+            # Se reabre la base en cada worker con las opciones de producción
+            return create_app(backend, args.db or DB_PATH, args.tracking_port, args.host)
+
+    TokenSnareApplication().run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
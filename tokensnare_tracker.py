@@ -0,0 +1,238 @@
+"""
+TokenSnare Tracker
+Listener HTTP mínimo sobre asyncio para los endpoints de tracking.
+
+Sólo atiende las rutas calientes (las mismas que la app Flask):
+    GET/OPTIONS  /image/<token>.png
+    GET/OPTIONS  /link/<token>
+    POST/OPTIONS /api/callback
+
+Las respuestas son constantes precalculadas y el hit se entrega a las mismas
+funciones del servidor (que lo encolan para el thread escritor), así que no
+pasa por el ruteo, los contextos ni los templates de Flask. El panel de
+administración y la API siguen en la app Flask.
+"""
+import asyncio
+import threading
+from urllib.parse import unquote
+
+MAX_HEADER_BYTES = 16 * 1024
+# Body más grande que se acepta (los de /api/callback son de unos pocos bytes)
+MAX_BODY_BYTES = 64 * 1024
+
+# pixel transparente 1x1 (el mismo que sirve la app Flask)
+TRANSPARENT_PNG = (
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01'
+    b'\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01'
+    b'\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82'
+)
+
+CORS_HEADERS = (
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Methods: POST, OPTIONS\r\n"
+    b"Access-Control-Allow-Headers: Content-Type, X-Cloned-Domain, X-Cloned-Url, X-Screen-Res\r\n"
+)
+
+
+def _response(status, headers=b"", body=b""):
+    """Arma una respuesta HTTP/1.1 completa (sin el header Connection)."""
+    return (
+        b"HTTP/1.1 " + status + b"\r\n" + headers +
+        b"Content-Length: " + str(len(body)).encode() + b"\r\n",
+        body
+    )
+
+
+# Respuestas precalculadas: (status line + headers, body)
+RESPONSE_PNG = _response(b"200 OK", b"Content-Type: image/png\r\n", TRANSPARENT_PNG)
+RESPONSE_NO_CONTENT = _response(b"204 No Content")
+RESPONSE_CORS_PREFLIGHT = _response(b"204 No Content", CORS_HEADERS)
+RESPONSE_CALLBACK_OK = _response(
+    b"200 OK",
+    b"Content-Type: application/json\r\nAccess-Control-Allow-Origin: *\r\n",
+    b'{"status":"ok"}\n'
+)
+RESPONSE_NOT_FOUND = _response(b"404 Not Found", b"Content-Type: text/plain\r\n", b"Not Found")
+RESPONSE_BAD_REQUEST = _response(b"400 Bad Request", b"Content-Type: text/plain\r\n", b"Bad Request")
+RESPONSE_METHOD_NOT_ALLOWED = _response(b"405 Method Not Allowed", b"Content-Type: text/plain\r\n", b"Method Not Allowed")
+
+
+class TrackingProtocol(asyncio.Protocol):
+    """
+    Parser HTTP/1.1 mínimo con soporte de keep-alive y pipelining.
+    Los headers se normalizan como los expone Werkzeug ('User-Agent', 'Dnt', ...)
+    para que los hits queden iguales vengan de Flask o de este listener.
+    """
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.transport = None
+        self.buffer = b""
+        self.body_remaining = 0
+        self.remote_addr = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        peer = transport.get_extra_info('peername')
+        self.remote_addr = peer[0] if peer else None
+
+    def data_received(self, data):
+        self.buffer += data
+        while self.transport is not None and not self.transport.is_closing():
+            # Descartar el body del request anterior (sólo lo usa /api/callback, y no se lee)
+            if self.body_remaining:
+                skipped = min(self.body_remaining, len(self.buffer))
+                self.buffer = self.buffer[skipped:]
+                self.body_remaining -= skipped
+                if self.body_remaining:
+                    return
+
+            end = self.buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(self.buffer) > MAX_HEADER_BYTES:
+                    self._send(RESPONSE_BAD_REQUEST, keep_alive=False)
+                return
+
+            head, self.buffer = self.buffer[:end], self.buffer[end + 4:]
+            self._handle(head)
+
+    def _handle(self, head):
+        try:
+            lines = head.decode('latin-1').split("\r\n")
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            self._send(RESPONSE_BAD_REQUEST, keep_alive=False)
+            return
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                continue
+            name = name.strip().title()
+            value = value.strip()
+            headers[name] = f"{headers[name]},{value}" if name in headers else value
+
+        # Sólo se aceptan bodies con un Content-Length entero, no negativo y
+        # acotado (sin chunked): si no, no se sabe dónde empieza el próximo request
+        content_length = headers.get('Content-Length', '0')
+        if (not content_length.isascii() or not content_length.isdigit()
+                or int(content_length) > MAX_BODY_BYTES or 'Transfer-Encoding' in headers):
+            self._send(RESPONSE_BAD_REQUEST, keep_alive=False)
+            return
+        self.body_remaining = int(content_length)
+
+        connection = headers.get('Connection', '').lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+
+        path = unquote(target.split("?", 1)[0])
+        self._send(self._route(method, path, headers), keep_alive)
+
+    def _route(self, method, path, headers):
+        if path.startswith("/image/") and path.endswith(".png"):
+            token = path[len("/image/"):-len(".png")]
+            if not token or "/" in token:
+                return RESPONSE_NOT_FOUND
+            if method == "OPTIONS":
+                return RESPONSE_NO_CONTENT
+            if method != "GET":
+                return RESPONSE_METHOD_NOT_ALLOWED
+            self.tracker.on_hit(token, headers, self.remote_addr)
+            return RESPONSE_PNG
+
+        if path.startswith("/link/"):
+            token = path[len("/link/"):]
+            if not token or "/" in token:
+                return RESPONSE_NOT_FOUND
+            if method == "OPTIONS":
+                return RESPONSE_NO_CONTENT
+            if method != "GET":
+                return RESPONSE_METHOD_NOT_ALLOWED
+            self.tracker.on_hit(token, headers, self.remote_addr)
+            return RESPONSE_NO_CONTENT
+
+        if path == "/api/callback":
+            if method == "OPTIONS":
+                return RESPONSE_CORS_PREFLIGHT
+            if method != "POST":
+                return RESPONSE_METHOD_NOT_ALLOWED
+            # Crear/actualizar el token toca el almacenamiento: fuera del event loop
+            self.tracker.loop.run_in_executor(
+                None, self.tracker.on_clone_report, headers, self.remote_addr
+            )
+            return RESPONSE_CALLBACK_OK
+
+        return RESPONSE_NOT_FOUND
+
+    def _send(self, response, keep_alive):
+        head, body = response
+        connection = b"Connection: keep-alive\r\n\r\n" if keep_alive else b"Connection: close\r\n\r\n"
+        self.transport.write(head + connection + body)
+        if not keep_alive:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+
+class TrackingServer:
+    """
+    Corre el listener de tracking en su propio thread con su propio event loop.
+    `on_hit(token, headers, remote_addr)` y `on_clone_report(headers, remote_addr)`
+    son las funciones del servidor que registran el hit.
+    Con `reuse_port` varios workers (gunicorn) pueden escuchar el mismo puerto.
+    """
+
+    def __init__(self, host, port, on_hit, on_clone_report, reuse_port=True, backlog=2048):
+        self.host = host
+        self.port = port
+        self.on_hit = on_hit
+        self.on_clone_report = on_clone_report
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tracking-listener", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(self.loop.create_server(
+                lambda: TrackingProtocol(self),
+                self.host, self.port,
+                reuse_port=self.reuse_port,
+                backlog=self.backlog
+            ))
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            self.loop.close()
+
+    def stop(self):
+        """Deja de aceptar conexiones y espera a que termine el thread."""
+        if self._thread is None:
+            return
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+        self._thread = None